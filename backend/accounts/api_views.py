@@ -2,13 +2,17 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+
+def me_payload(u):
+    return {
+        "id": u.id,
+        "username": u.username,
+        "role": getattr(u, "role", None),
+    }
+
+
 class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        u = request.user
-        return Response({
-            "id": u.id,
-            "username": u.username,
-            "role": getattr(u, "role", None),
-        })
+        return Response(me_payload(request.user))
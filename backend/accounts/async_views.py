@@ -0,0 +1,12 @@
+from config.async_views import AsyncAPIView, json_response
+
+from .api_views import me_payload
+
+
+class AsyncMeView(AsyncAPIView):
+    """
+    GET /api/async/accounts/me/
+    """
+
+    async def get(self, request):
+        return json_response(me_payload(request.user))
@@ -1,3 +1,21 @@
-from django.test import TestCase
+from django.test import AsyncClient, TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from accounts.models import User
+
+
+class AsyncMeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+
+    async def test_me(self):
+        token = str(AccessToken.for_user(self.gp))
+        resp = await AsyncClient().get(reverse("async_me"), headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"id": self.gp.id, "username": "gp1", "role": "GP"})
+
+    async def test_bad_token(self):
+        resp = await AsyncClient().get(reverse("async_me"), headers={"Authorization": "Bearer nope"})
+        self.assertEqual(resp.status_code, 401)
@@ -1,10 +1,18 @@
 
 from django.urls import path
 from . import api_views
-from .availability import AvailabilityView
+from .availability import AvailabilityView, EarliestAvailabilityView
+from .feeds import FeedLinkView, IcsFeedView
+from .streams import AppointmentEventStreamView
 
 urlpatterns = [
     path("", api_views.AppointmentListCreateView.as_view(), name="appointment_list_create"),
     path("availability/", AvailabilityView.as_view(), name="appointment_availability"),
+    path("availability/earliest/", EarliestAvailabilityView.as_view(), name="appointment_earliest_availability"),
+    path("export/", api_views.AppointmentExportView.as_view(), name="appointment_export"),
+    path("feed/", FeedLinkView.as_view(), name="appointment_feed_link"),
+    path("feed/<str:token>.ics", IcsFeedView.as_view(), name="appointment_ics_feed"),
+    path("events/", AppointmentEventStreamView.as_view(), name="appointment_events"),
+    path("bulk/", api_views.AppointmentBulkCreateView.as_view(), name="appointment_bulk_create"),
     path("<int:pk>/", api_views.AppointmentDetailView.as_view(), name="appointment_detail"),
 ]
@@ -1,74 +1,86 @@
 from urllib import response
-from rest_framework import generics
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+from .bulk import create_appointments
 from .models import Appointment
-from .serializers import AppointmentSerializer
+from .serializers import AppointmentSerializer, BulkAppointmentSerializer, RecurrenceSerializer
 from django.utils import timezone
-from django.utils.dateparse import parse_date
 from audits.utils import log_event
-
-
-
-class AppointmentListCreateView(generics.ListCreateAPIView):
+from config.conditional import ConditionalGetMixin
+from config.exports import EXPORT_FORMATS, parse_export_format, streaming_export
+from config.filters import filter_date_range
+from config.pagination import KeysetPagination
+from idempotency.mixins import IdempotentCreateMixin
+
+
+class AppointmentCursorPagination(KeysetPagination):
+    # Newest first, same as the unpaginated list used to be; id breaks ties
+    ordering = "-start_time"
+    page_size = 50
+    max_page_size = 200
+
+
+def appointments_for(request):
+    """
+    Appointments visible to request.user, with the list filters from the query
+    string applied (upcoming, date_from/date_to, and staff-only patient/gp).
+    Shared by the list and the export; callers choose the ordering.
+    """
+    u = request.user
+
+    # Base queryset by role
+    if u.is_superuser or u.role in ["RECEPTIONIST", "PRACTICE_MANAGER"]:
+        qs = Appointment.objects.all()
+        staff = True
+    elif u.role == "GP":
+        qs = Appointment.objects.filter(gp=u)
+        staff = False
+    elif u.role == "PATIENT":
+        qs = Appointment.objects.filter(patient=u)
+        staff = False
+    else:
+        qs = Appointment.objects.none()
+        staff = False
+
+    # Optional filters (mostly for staff "manager/receptionist views")
+    params = request.query_params
+
+    upcoming = params.get("upcoming")
+    if str(upcoming).lower() in {"1", "true", "yes", "y", "on"}:
+        qs = qs.filter(start_time__gte=timezone.now())
+
+    qs = filter_date_range(qs, "start_time", params)
+
+    # Staff-only filters
+    if staff:
+        patient = params.get("patient")
+        if patient:
+            try:
+                qs = qs.filter(patient_id=int(patient))
+            except (TypeError, ValueError):
+                raise ValidationError({"patient": "Invalid patient id."})
+
+        gp = params.get("gp")
+        if gp:
+            try:
+                qs = qs.filter(gp_id=int(gp))
+            except (TypeError, ValueError):
+                raise ValidationError({"gp": "Invalid gp id."})
+
+    return qs
+
+
+class AppointmentListCreateView(IdempotentCreateMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AppointmentCursorPagination
 
     def get_queryset(self):
-        u = self.request.user
-
-        # Base queryset by role
-        if u.is_superuser or u.role in ["RECEPTIONIST", "PRACTICE_MANAGER"]:
-            qs = Appointment.objects.all()
-            staff = True
-        elif u.role == "GP":
-            qs = Appointment.objects.filter(gp=u)
-            staff = False
-        elif u.role == "PATIENT":
-            qs = Appointment.objects.filter(patient=u)
-            staff = False
-        else:
-            qs = Appointment.objects.none()
-            staff = False
-
-        # Optional filters (mostly for staff "manager/receptionist views")
-        params = self.request.query_params
-
-        upcoming = params.get("upcoming")
-        if str(upcoming).lower() in {"1", "true", "yes", "y", "on"}:
-            qs = qs.filter(start_time__gte=timezone.now())
-
-        date_from = params.get("date_from")
-        if date_from:
-            d = parse_date(date_from)
-            if not d:
-                raise ValidationError({"date_from": "Invalid date. Use YYYY-MM-DD."})
-            qs = qs.filter(start_time__date__gte=d)
-
-        date_to = params.get("date_to")
-        if date_to:
-            d = parse_date(date_to)
-            if not d:
-                raise ValidationError({"date_to": "Invalid date. Use YYYY-MM-DD."})
-            qs = qs.filter(start_time__date__lte=d)
-
-        # Staff-only filters
-        if staff:
-            patient = params.get("patient")
-            if patient:
-                try:
-                    qs = qs.filter(patient_id=int(patient))
-                except (TypeError, ValueError):
-                    raise ValidationError({"patient": "Invalid patient id."})
-
-            gp = params.get("gp")
-            if gp:
-                try:
-                    qs = qs.filter(gp_id=int(gp))
-                except (TypeError, ValueError):
-                    raise ValidationError({"gp": "Invalid gp id."})
-
-        return qs.order_by("-start_time")
+        return appointments_for(self.request).order_by("-start_time")
 
 
     def perform_create(self, serializer):
@@ -109,7 +121,7 @@ class AppointmentListCreateView(generics.ListCreateAPIView):
     
     
 
-class AppointmentDetailView(generics.RetrieveUpdateAPIView):
+class AppointmentDetailView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     serializer_class = AppointmentSerializer
     queryset = Appointment.objects.all()
     permission_classes = [IsAuthenticated]
@@ -159,8 +171,86 @@ class AppointmentDetailView(generics.RetrieveUpdateAPIView):
             )
         return response
 
-       
 
+class AppointmentBulkCreateView(APIView):
+    """
+    POST /api/appointments/bulk/
 
-        
-    
+    Staff-only batch booking. Body is either
+      {"mode": "atomic"|"best_effort", "appointments": [{patient, gp, start_time, end_time, status?, reason?}, ...]}
+    or
+      {"mode": ..., "recurrence": {patient, gp, start_time, end_time, status?, reason?,
+                                   frequency: "DAILY"|"WEEKLY", interval?, count | until}}
+
+    atomic (default): nothing is created unless every item is valid and conflict-free.
+    best_effort: valid items are created, the rest are reported.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(request=BulkAppointmentSerializer, responses={201: OpenApiTypes.OBJECT, 400: OpenApiTypes.OBJECT})
+    def post(self, request):
+        u = request.user
+        if not (u.is_superuser or u.role in ["RECEPTIONIST", "PRACTICE_MANAGER"]):
+            raise PermissionDenied("Only staff can bulk-create appointments.")
+
+        serializer = BulkAppointmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        mode = serializer.validated_data["mode"]
+
+        if "recurrence" in serializer.validated_data:
+            items = RecurrenceSerializer.expand(serializer.validated_data["recurrence"])
+        else:
+            items = serializer.validated_data["appointments"]
+
+        created, results = create_appointments(
+            request, items, best_effort=(mode == BulkAppointmentSerializer.MODE_BEST_EFFORT)
+        )
+        return Response(
+            {"mode": mode, "requested": len(items), "created": created, "results": results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+
+class AppointmentExportView(APIView):
+    """
+    GET /api/appointments/export/?output=csv|ndjson&<list filters>
+
+    Staff-only. Streams every matching appointment (same filters as the list)
+    oldest first, without building the response in memory.
+    """
+    permission_classes = [IsAuthenticated]
+
+    FIELDS = [
+        "id", "patient", "patient__username", "gp", "gp__username",
+        "start_time", "end_time", "status", "reason", "created_at",
+    ]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="output",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                enum=list(EXPORT_FORMATS),
+                description="csv (default) or ndjson."
+            ),
+        ],
+        responses={200: OpenApiTypes.BINARY},
+    )
+    def get(self, request):
+        u = request.user
+        if not (u.is_superuser or u.role in ["RECEPTIONIST", "PRACTICE_MANAGER"]):
+            raise PermissionDenied("Only staff can export appointments.")
+
+        fmt = parse_export_format(request.query_params)
+        qs = appointments_for(request).order_by("start_time", "id")
+
+        log_event(
+            request,
+            action="APPOINTMENT_EXPORT",
+            object_type="appointment",
+            metadata={"output": fmt, "filters": request.query_params.dict()},
+        )
+        return streaming_export(request, qs, self.FIELDS, fmt, filename="appointments")
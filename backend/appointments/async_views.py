@@ -0,0 +1,53 @@
+# backend/appointments/async_views.py
+
+from django.contrib.auth import get_user_model
+
+from config.async_views import AsyncAPIView, json_response
+
+from .api_views import AppointmentCursorPagination, appointments_for
+from .availability import (
+    aavailability_for, aresolve_gp_ids, check_single_day_gp, is_range_request,
+    parse_range_params, parse_single_day_params, range_payload, single_day_payload,
+)
+from .serializers import AppointmentSerializer
+
+User = get_user_model()
+
+
+class AsyncAvailabilityView(AsyncAPIView):
+    """
+    GET /api/async/appointments/availability/  (same params and response as AvailabilityView)
+    """
+
+    async def get(self, request):
+        params = request.query_params
+        if is_range_request(params):
+            date_from, date_to = parse_range_params(params)
+            gp_ids = await aresolve_gp_ids(request)
+            available = await aavailability_for(gp_ids, date_from, date_to)
+            return json_response(range_payload(date_from, date_to, gp_ids, available))
+
+        date_str, day, gp_id = parse_single_day_params(params)
+        gp_user = await User.objects.filter(id=gp_id, role="GP").afirst()
+        check_single_day_gp(request.user, gp_user)
+
+        slots = (await aavailability_for([gp_user.id], day, day))[(gp_user.id, day)]
+        return json_response(single_day_payload(date_str, day, gp_user.id, slots))
+
+
+class AsyncAppointmentListView(AsyncAPIView):
+    """
+    GET /api/async/appointments/  (same scoping, filters and keyset pages as the list)
+    """
+
+    async def get(self, request):
+        pagination = AppointmentCursorPagination()
+        pagination.request = request
+        pagination.size = pagination.get_page_size(request)
+
+        qs = pagination.apply_cursor(
+            appointments_for(request), request.query_params.get(pagination.cursor_query_param)
+        )
+        page = pagination.take_page([appt async for appt in qs[: pagination.size + 1]])
+        data = AppointmentSerializer(page, many=True).data
+        return json_response({"next": pagination.get_next_link(), "results": data})
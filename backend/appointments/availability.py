@@ -1,6 +1,11 @@
 # backend/appointments/availability.py
 
-from datetime import datetime, time, timedelta, timezone as dt_timezone
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth import get_user_model
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,23 +14,330 @@ from rest_framework.permissions import IsAuthenticated
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 
 
-from .models import Appointment
+from .cache import (
+    aget_cached_availability, aset_cached_availability,
+    get_cached_availability, set_cached_availability,
+)
+from .models import SlotOccupancy
+from .slots import (
+    SLOT_MINUTES, DAY_START_HOUR, DAY_END_HOUR,
+    day_window, iter_days, iso_z, mask_to_slots, slot_dicts,
+)
 
 User = get_user_model()
 
+# Longest date range a single request may ask for (inclusive).
+MAX_RANGE_DAYS = 31
+
+# Earliest-slot search: how far ahead to look, how many days to load per query, max results.
+EARLIEST_HORIZON_DAYS = 90
+EARLIEST_CHUNK_DAYS = 7
+MAX_EARLIEST_LIMIT = 50
+
+
+def occupancy_queryset(gp_ids, date_from, date_to):
+    return (
+        SlotOccupancy.objects
+        .filter(gp_id__in=gp_ids, day__gte=date_from, day__lte=date_to)
+        .values_list("gp_id", "day", "mask")
+    )
+
+
+def occupancy_masks(gp_ids, date_from, date_to) -> dict:
+    """
+    {(gp_id, day): busy mask} from the occupancy table. Days without a row are free.
+    """
+    return {(gp_id, day): mask for gp_id, day, mask in occupancy_queryset(gp_ids, date_from, date_to)}
+
+
+async def aoccupancy_masks(gp_ids, date_from, date_to) -> dict:
+    return {(gp_id, day): mask async for gp_id, day, mask in occupancy_queryset(gp_ids, date_from, date_to)}
+
+
+def _pairs(gp_ids, date_from, date_to):
+    days = list(iter_days(date_from, date_to))
+    return [(gp_id, day) for gp_id in gp_ids for day in days]
+
+
+def _missing_range(missing):
+    """
+    GP ids and first/last day covering every (gp_id, day) cache miss.
+    """
+    days = sorted({day for _, day in missing})
+    return sorted({gp_id for gp_id, _ in missing}), days[0], days[-1]
+
+
+def _slots_for(missing, masks) -> dict:
+    return {
+        (gp_id, day): slot_dicts(mask_to_slots(day, masks.get((gp_id, day), 0)))
+        for gp_id, day in missing
+    }
+
+
+def availability_for(gp_ids, date_from, date_to):
+    """
+    Free slots for every (gp_id, day) in the range, as {(gp_id, day): [slot dicts]}.
+
+    Days already in the cache are served from it; the rest come from one
+    occupancy-table query covering only the GPs and days that missed.
+    """
+    pairs = _pairs(gp_ids, date_from, date_to)
+    result = get_cached_availability(pairs)
+
+    missing = [pair for pair in pairs if pair not in result]
+    if not missing:
+        return result
+
+    computed = _slots_for(missing, occupancy_masks(*_missing_range(missing)))
+    set_cached_availability(computed)
+    result.update(computed)
+    return result
+
+
+async def aavailability_for(gp_ids, date_from, date_to):
+    """
+    availability_for() with the async cache and ORM APIs.
+    """
+    pairs = _pairs(gp_ids, date_from, date_to)
+    result = await aget_cached_availability(pairs)
+
+    missing = [pair for pair in pairs if pair not in result]
+    if not missing:
+        return result
+
+    computed = _slots_for(missing, await aoccupancy_masks(*_missing_range(missing)))
+    await aset_cached_availability(computed)
+    result.update(computed)
+    return result
+
+
+def parse_gp_ids(request):
+    """
+    Accepts ?gp=1&gp=2 and/or ?gp=1,2. Returns a sorted list of ints.
+    """
+    raw = []
+    for value in request.query_params.getlist("gp"):
+        raw.extend(part for part in value.split(",") if part.strip())
+
+    try:
+        return sorted({int(part) for part in raw})
+    except ValueError:
+        raise ValidationError({"gp": "gp must be an integer user id (or a comma-separated list)."})
+
+
+def _requested_gp_ids(request):
+    """
+    (gp_ids, final): final is True when no lookup is needed (a GP asking
+    about themselves). GPs are always limited to themselves.
+    """
+    u = request.user
+    gp_ids = parse_gp_ids(request)
+
+    if getattr(u, "role", None) == "GP":
+        # GP can only query their own availability
+        if gp_ids and gp_ids != [u.id]:
+            raise PermissionDenied("GPs can only view their own availability.")
+        return [u.id], True
+    return gp_ids, False
+
+
+def _all_gp_ids_queryset():
+    return User.objects.filter(role="GP").order_by("id").values_list("id", flat=True)
+
+
+def _known_gp_ids_queryset(gp_ids):
+    return User.objects.filter(id__in=gp_ids, role="GP").values_list("id", flat=True)
+
+
+def _check_found(gp_ids, found):
+    missing = [gp_id for gp_id in gp_ids if gp_id not in found]
+    if missing:
+        raise ValidationError({"gp": f"GP user not found: {', '.join(map(str, missing))}."})
+    return gp_ids
+
+
+def resolve_gp_ids(request):
+    """
+    GP ids a multi-GP query should cover: the ?gp list, or every GP when omitted.
+    """
+    gp_ids, final = _requested_gp_ids(request)
+    if final:
+        return gp_ids
+    if not gp_ids:
+        return list(_all_gp_ids_queryset())
+    return _check_found(gp_ids, set(_known_gp_ids_queryset(gp_ids)))
+
+
+async def aresolve_gp_ids(request):
+    gp_ids, final = _requested_gp_ids(request)
+    if final:
+        return gp_ids
+    if not gp_ids:
+        return [gp_id async for gp_id in _all_gp_ids_queryset()]
+    return _check_found(gp_ids, {gp_id async for gp_id in _known_gp_ids_queryset(gp_ids)})
+
+
+def parse_day(value, field):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValidationError({field: "Invalid date format. Use YYYY-MM-DD."})
+
+
+def parse_single_day_params(params):
+    """
+    (date string, day, gp_id) for single-day mode.
+    """
+    date_str = params.get("date")
+    gp_str = params.get("gp")
+
+    if not date_str:
+        raise ValidationError({"date": "This query param is required (YYYY-MM-DD)."})
+    if not gp_str:
+        raise ValidationError({"gp": "This query param is required (gp user id)."})
+
+    day = parse_day(date_str, "date")
+    try:
+        gp_id = int(gp_str)
+    except ValueError:
+        raise ValidationError({"gp": "gp must be an integer user id."})
+    return date_str, day, gp_id
+
+
+def check_single_day_gp(user, gp_user):
+    if not gp_user:
+        raise ValidationError({"gp": "GP user not found."})
+    # Role rule: GP can only query their own availability; staff/patient can query any GP
+    if getattr(user, "role", None) == "GP" and user.id != gp_user.id:
+        raise PermissionDenied("GPs can only view their own availability.")
+
+
+def single_day_payload(date_str, day, gp_id, slots):
+    window_start, window_end = day_window(day)
+    return {
+        "date": date_str,
+        "gp": gp_id,
+        "slot_minutes": SLOT_MINUTES,
+        "window_utc": {
+            "start": iso_z(window_start),
+            "end": iso_z(window_end),
+        },
+        "available": slots
+    }
+
+
+def parse_range_params(params):
+    if not params.get("date_from") or not params.get("date_to"):
+        raise ValidationError({"date_from": "date_from and date_to must be used together (YYYY-MM-DD)."})
+
+    date_from = parse_day(params["date_from"], "date_from")
+    date_to = parse_day(params["date_to"], "date_to")
+    if date_to < date_from:
+        raise ValidationError({"date_to": "date_to must be on or after date_from."})
+    if (date_to - date_from).days + 1 > MAX_RANGE_DAYS:
+        raise ValidationError({"date_to": f"Range too large (max {MAX_RANGE_DAYS} days)."})
+    return date_from, date_to
+
+
+def range_payload(date_from, date_to, gp_ids, available):
+    gps = []
+    for gp_id in gp_ids:
+        days = [
+            {"date": day.isoformat(), "available": available[(gp_id, day)]}
+            for day in iter_days(date_from, date_to)
+        ]
+        gps.append({"gp": gp_id, "days": days})
+
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "slot_minutes": SLOT_MINUTES,
+        "window_utc": {
+            "start": f"{DAY_START_HOUR:02d}:00",
+            "end": f"{DAY_END_HOUR:02d}:00",
+        },
+        "gps": gps,
+    }
+
+
+def is_range_request(params) -> bool:
+    return bool(params.get("date_from") or params.get("date_to"))
+
+
+class _ChunkedAvailability:
+    """
+    Loads availability for all GPs a few days at a time, only when a stream
+    actually reaches those days.
+    """
+
+    def __init__(self, gp_ids, first_day, last_day, chunk_days):
+        self.gp_ids = gp_ids
+        self.last_day = last_day
+        self.chunk_days = chunk_days
+        self.loaded_until = first_day - timedelta(days=1)
+        self.data = {}
+
+    def slots(self, gp_id, day):
+        while day > self.loaded_until:
+            start = self.loaded_until + timedelta(days=1)
+            end = min(start + timedelta(days=self.chunk_days - 1), self.last_day)
+            self.data.update(availability_for(self.gp_ids, start, end))
+            self.loaded_until = end
+        return self.data[(gp_id, day)]
+
+
+def earliest_slots(gp_ids, after, limit, horizon_days=EARLIEST_HORIZON_DAYS, chunk_days=EARLIEST_CHUNK_DAYS):
+    """
+    The `limit` earliest free slots across gp_ids starting at or after `after`.
+
+    Each GP is a lazy stream of free slots in time order; heapq.merge keeps a
+    priority queue of their heads, so reading stops as soon as `limit` slots
+    are out instead of materialising the whole horizon.
+    """
+    after = after.astimezone(dt_timezone.utc)
+    # Slots start on whole seconds, so rounding `after` up to one keeps the
+    # string comparison below exact (a fractional `after` would sort early)
+    if after.microsecond:
+        after = after.replace(microsecond=0) + timedelta(seconds=1)
+    after_iso = iso_z(after)
+    first_day = after.astimezone(dt_timezone.utc).date()
+    last_day = first_day + timedelta(days=horizon_days - 1)
+    loader = _ChunkedAvailability(gp_ids, first_day, last_day, chunk_days)
+
+    def stream(gp_id):
+        for day in iter_days(first_day, last_day):
+            for slot in loader.slots(gp_id, day):
+                # ISO-8601 UTC strings of the same shape sort chronologically
+                if slot["start_time"] >= after_iso:
+                    yield slot["start_time"], gp_id, slot["end_time"]
+
+    merged = heapq.merge(*(stream(gp_id) for gp_id in gp_ids))
+    return [
+        {"gp": gp_id, "start_time": start, "end_time": end}
+        for start, gp_id, end in islice(merged, limit)
+    ]
+
 
 class AvailabilityView(APIView):
     """
     GET /api/appointments/availability/?date=YYYY-MM-DD&gp=<gp_id>
+    GET /api/appointments/availability/?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&gp=<id>[,<id>...]
 
     Returns available 15-min slots between 09:00–17:00 UTC (exclusive end).
     Removes any slot that overlaps existing appointments for that GP.
+
+    Range mode covers up to MAX_RANGE_DAYS days and any number of GPs
+    (omit gp to get every GP).
+
+    Busy slots come from the SlotOccupancy bitmap (one row per GP/day), and
+    results are cached per GP and day; appointment writes refresh the bitmap
+    and invalidate the affected days (see appointments.signals).
     """
     permission_classes = [IsAuthenticated]
 
-    SLOT_MINUTES = 15
-    DAY_START_HOUR = 9
-    DAY_END_HOUR = 17
+    SLOT_MINUTES = SLOT_MINUTES
+    DAY_START_HOUR = DAY_START_HOUR
+    DAY_END_HOUR = DAY_END_HOUR
 
     @extend_schema(
         parameters=[
@@ -33,98 +345,119 @@ class AvailabilityView(APIView):
                 name="date",
                 type=OpenApiTypes.DATE,
                 location=OpenApiParameter.QUERY,
-                required=True,
-                description="Required. Date in YYYY-MM-DD format."
+                required=False,
+                description="Single-day mode. Date in YYYY-MM-DD format."
+            ),
+            OpenApiParameter(
+                name="date_from",
+                type=OpenApiTypes.DATE,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Range mode. First day (YYYY-MM-DD), use together with date_to."
+            ),
+            OpenApiParameter(
+                name="date_to",
+                type=OpenApiTypes.DATE,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description=f"Range mode. Last day (YYYY-MM-DD, inclusive). At most {MAX_RANGE_DAYS} days."
             ),
             OpenApiParameter(
                 name="gp",
-                type=OpenApiTypes.INT,
+                type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
-                required=True,
-                description="Required. GP user id."
+                required=False,
+                description="GP user id. Required in single-day mode. In range mode: one id, a comma-separated list, or omit for all GPs."
             ),
         ],
-        description="Returns available 15-min slots between 09:00–17:00 UTC (exclusive end). Excludes slots overlapping existing appointments for the selected GP.",
+        description="Returns available 15-min slots between 09:00–17:00 UTC (exclusive end). Excludes slots overlapping existing appointments for the selected GP(s).",
         responses={200: OpenApiTypes.OBJECT},
     )
-    
-    def get(self, request):
-        date_str = request.query_params.get("date")
-        gp_str = request.query_params.get("gp")
-
-        if not date_str:
-            raise ValidationError({"date": "This query param is required (YYYY-MM-DD)."})
-        if not gp_str:
-            raise ValidationError({"gp": "This query param is required (gp user id)."})
-
 
-        # Parse date
-        try:
-            day = datetime.strptime(date_str, "%Y-%m-%d").date()
-        except ValueError:
-            raise ValidationError({"date": "Invalid date format. Use YYYY-MM-DD."})
-
-        # Parse gp id
-        try:
-            gp_id = int(gp_str)
-        except ValueError:
-            raise ValidationError({"gp": "gp must be an integer user id."})
+    def get(self, request):
+        params = request.query_params
+        if is_range_request(params):
+            return self.get_range(request)
 
-        # Fetch GP user
+        date_str, day, gp_id = parse_single_day_params(params)
         gp_user = User.objects.filter(id=gp_id, role="GP").first()
-        if not gp_user:
-            raise ValidationError({"gp": "GP user not found."})
+        check_single_day_gp(request.user, gp_user)
 
-        # Role rule: GP can only query their own availability; staff/patient can query any GP
-        u = request.user
-        if getattr(u, "role", None) == "GP" and u.id != gp_user.id:
-            raise PermissionDenied("GPs can only view their own availability.")
+        slots = availability_for([gp_user.id], day, day)[(gp_user.id, day)]
+        return Response(single_day_payload(date_str, day, gp_user.id, slots))
 
-        # Build day window in UTC
-        window_start = datetime.combine(day, time(self.DAY_START_HOUR, 0, 0)).replace(tzinfo=dt_timezone.utc)
-        window_end = datetime.combine(day, time(self.DAY_END_HOUR, 0, 0)).replace(tzinfo=dt_timezone.utc)
+    def get_range(self, request):
+        date_from, date_to = parse_range_params(request.query_params)
+        gp_ids = resolve_gp_ids(request)
+        available = availability_for(gp_ids, date_from, date_to)
+        return Response(range_payload(date_from, date_to, gp_ids, available))
 
-        slot_delta = timedelta(minutes=self.SLOT_MINUTES)
 
-        # Grab existing appointments that overlap the day window
-        busy_qs = (
-            Appointment.objects
-            .filter(gp=gp_user, start_time__lt=window_end, end_time__gt=window_start)
-            .exclude(status=Appointment.Status.CANCELLED)
-            .values_list("start_time", "end_time")
-        )
-        busy_intervals = list(busy_qs)
+class EarliestAvailabilityView(APIView):
+    """
+    GET /api/appointments/availability/earliest/?after=<ISO datetime>&limit=N&gp=<id>[,<id>...]
 
-        def overlaps(a_start, a_end, b_start, b_end) -> bool:
-            # overlap if a_start < b_end AND a_end > b_start
-            return a_start < b_end and a_end > b_start
+    The N earliest free 15-min slots across the given GPs (or all GPs),
+    starting from `after` (default: now), within EARLIEST_HORIZON_DAYS.
+    """
+    permission_classes = [IsAuthenticated]
 
-        slots = []
-        cur = window_start
-        while cur + slot_delta <= window_end:
-            slot_start = cur
-            slot_end = cur + slot_delta
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="after",
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Only slots starting at or after this time (ISO 8601, default now, naive = UTC)."
+            ),
+            OpenApiParameter(
+                name="limit",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description=f"Number of slots to return (1-{MAX_EARLIEST_LIMIT}, default 10)."
+            ),
+            OpenApiParameter(
+                name="gp",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="One GP id, a comma-separated list, or omit for all GPs."
+            ),
+        ],
+        description="Earliest available 15-min slots across one, several or all GPs.",
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    def get(self, request):
+        params = request.query_params
 
-            conflict = any(
-                overlaps(slot_start, slot_end, busy_start, busy_end)
-                for (busy_start, busy_end) in busy_intervals
-            )
+        after = timezone.now()
+        if params.get("after"):
+            try:
+                after = parse_datetime(params["after"])
+            except ValueError:
+                # Well-formed but out of range, e.g. month 13
+                after = None
+            if after is None:
+                raise ValidationError({"after": "Invalid datetime. Use ISO 8601."})
+            if timezone.is_naive(after):
+                after = after.replace(tzinfo=dt_timezone.utc)
 
-            if not conflict:
-                slots.append({
-                    "start_time": slot_start.isoformat().replace("+00:00", "Z"),
-                    "end_time": slot_end.isoformat().replace("+00:00", "Z"),
-                })
+        try:
+            limit = int(params.get("limit", 10))
+        except ValueError:
+            raise ValidationError({"limit": "limit must be an integer."})
+        if not 1 <= limit <= MAX_EARLIEST_LIMIT:
+            raise ValidationError({"limit": f"limit must be between 1 and {MAX_EARLIEST_LIMIT}."})
 
-            cur += slot_delta
+        gp_ids = resolve_gp_ids(request)
+        slots = earliest_slots(gp_ids, after, limit) if gp_ids else []
 
         return Response({
-            "date": date_str,
-            "gp": gp_user.id,
-            "slot_minutes": self.SLOT_MINUTES,
-            "window_utc": {
-                "start": window_start.isoformat().replace("+00:00", "Z"),
-                "end": window_end.isoformat().replace("+00:00", "Z"),
-            },
-            "available": slots
+            "after": iso_z(after.astimezone(dt_timezone.utc)),
+            "limit": limit,
+            "slot_minutes": SLOT_MINUTES,
+            "slots": slots,
         })
+
@@ -0,0 +1,181 @@
+"""
+Batched appointment creation: validate, detect conflicts and insert many
+appointments with a fixed number of queries, whatever the batch size.
+"""
+
+from bisect import bisect_right, insort
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from audits.utils import log_events
+from .cache import affected_keys, invalidate_availability
+from .events import EVENT_CREATED, appointment_event, publish_events
+from .models import Appointment
+from .occupancy import refresh_occupancy, slot_pairs
+from .serializers import BulkAppointmentItemSerializer, GP_OVERLAP_ERROR, is_gp_overlap_violation
+
+User = get_user_model()
+
+
+class BusyIndex:
+    """
+    Active intervals for one GP, kept sorted. Active appointments of a GP never
+    overlap (exclusion constraint), so sorting by start also sorts by end and
+    an overlap test is one bisect.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self.ends = [end for _, end in self.intervals]
+
+    def overlaps(self, start, end) -> bool:
+        # First interval ending after `start` is the only candidate
+        i = bisect_right(self.ends, start)
+        return i < len(self.intervals) and self.intervals[i][0] < end
+
+    def add(self, start, end) -> None:
+        insort(self.intervals, (start, end))
+        self.ends.insert(bisect_right(self.ends, end), end)
+
+
+def validate_items(raw_items):
+    """
+    Field-level validation per item plus one query each for patient and GP ids.
+    Returns (results, valid) where results is index-aligned with raw_items and
+    valid is a list of (index, attrs).
+    """
+    results = [None] * len(raw_items)
+    valid = []
+    for index, raw in enumerate(raw_items):
+        serializer = BulkAppointmentItemSerializer(data=raw)
+        if serializer.is_valid():
+            valid.append((index, dict(serializer.validated_data)))
+        else:
+            results[index] = {"index": index, "status": "invalid", "errors": serializer.errors}
+
+    patient_ids = {attrs["patient"] for _, attrs in valid}
+    gp_ids = {attrs["gp"] for _, attrs in valid if attrs["gp"] is not None}
+    known_patients = set(User.objects.filter(id__in=patient_ids, role="PATIENT").values_list("id", flat=True))
+    known_gps = set(User.objects.filter(id__in=gp_ids, role="GP").values_list("id", flat=True))
+
+    still_valid = []
+    for index, attrs in valid:
+        errors = {}
+        if attrs["patient"] not in known_patients:
+            errors["patient"] = "Patient user not found."
+        if attrs["gp"] is not None and attrs["gp"] not in known_gps:
+            errors["gp"] = "GP user not found."
+        if errors:
+            results[index] = {"index": index, "status": "invalid", "errors": errors}
+        else:
+            still_valid.append((index, attrs))
+    return results, still_valid
+
+
+def find_conflicts(valid) -> dict:
+    """
+    {index: errors} for items clashing with an existing appointment or with an
+    earlier item of the same batch. One range query covers every GP involved.
+    """
+    active = [
+        (index, attrs) for index, attrs in valid
+        if attrs["gp"] is not None and attrs["status"] != Appointment.Status.CANCELLED
+    ]
+    if not active:
+        return {}
+
+    gp_ids = {attrs["gp"] for _, attrs in active}
+    range_start = min(attrs["start_time"] for _, attrs in active)
+    range_end = max(attrs["end_time"] for _, attrs in active)
+
+    existing = {gp_id: [] for gp_id in gp_ids}
+    rows = (
+        Appointment.objects
+        .filter(gp_id__in=gp_ids, start_time__lt=range_end, end_time__gt=range_start)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .values_list("gp_id", "start_time", "end_time")
+    )
+    for gp_id, start, end in rows:
+        existing[gp_id].append((start, end))
+    busy = {gp_id: BusyIndex(intervals) for gp_id, intervals in existing.items()}
+
+    conflicts = {}
+    # Input order decides which of two clashing batch items wins
+    for index, attrs in active:
+        index_for_gp = busy[attrs["gp"]]
+        if index_for_gp.overlaps(attrs["start_time"], attrs["end_time"]):
+            conflicts[index] = GP_OVERLAP_ERROR
+        else:
+            index_for_gp.add(attrs["start_time"], attrs["end_time"])
+    return conflicts
+
+
+def create_appointments(request, items, best_effort: bool):
+    """
+    Plan and insert a batch. Returns (created_count, results). Nothing is
+    written when any item fails and best_effort is False.
+    """
+    results, valid = validate_items(items)
+    conflicts = find_conflicts(valid)
+    for index, errors in conflicts.items():
+        results[index] = {"index": index, "status": "conflict", "errors": errors}
+
+    to_create = [(index, attrs) for index, attrs in valid if index not in conflicts]
+    failed = len(items) - len(to_create)
+
+    if not to_create or (failed and not best_effort):
+        for index, _ in to_create:
+            results[index] = {"index": index, "status": "skipped"}
+        return 0, results
+
+    objs = [
+        Appointment(
+            patient_id=attrs["patient"],
+            gp_id=attrs["gp"],
+            start_time=attrs["start_time"],
+            end_time=attrs["end_time"],
+            status=attrs["status"],
+            reason=attrs["reason"],
+        )
+        for _, attrs in to_create
+    ]
+
+    try:
+        with transaction.atomic():
+            created = Appointment.objects.bulk_create(objs)
+
+            # bulk_create skips post_save, so do the signal work for the whole batch here
+            pairs, keys = set(), set()
+            for appt in created:
+                pairs |= slot_pairs(appt.gp_id, appt.start_time, appt.end_time)
+                keys |= affected_keys(appt.gp_id, appt.start_time, appt.end_time)
+            refresh_occupancy(pairs)
+            invalidate_availability(keys)
+            publish_events(appointment_event(EVENT_CREATED, appt) for appt in created)
+
+            log_events(request, [
+                {
+                    "action": "APPOINTMENT_CREATE",
+                    "obj": appt,
+                    "object_type": "appointment",
+                    "metadata": {"status": appt.status, "bulk": True},
+                }
+                for appt in created
+            ])
+    except IntegrityError as exc:
+        # Someone booked one of these slots between our check and the insert
+        if is_gp_overlap_violation(exc):
+            raise ValidationError({**GP_OVERLAP_ERROR, "detail": "A conflicting booking was made concurrently; retry the batch."})
+        raise
+
+    for (index, _), appt in zip(to_create, created):
+        results[index] = {
+            "index": index,
+            "status": "created",
+            "id": appt.id,
+            "start_time": appt.start_time,
+            "end_time": appt.end_time,
+        }
+    return len(created), results
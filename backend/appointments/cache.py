@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .slots import days_touched
+
+
+KEY_PREFIX = "appointments:availability:v1"
+
+
+def availability_key(gp_id, day) -> str:
+    return f"{KEY_PREFIX}:{gp_id}:{day.isoformat()}"
+
+
+def cache_timeout() -> int:
+    return getattr(settings, "AVAILABILITY_CACHE_TIMEOUT", 3600)
+
+
+def get_cached_availability(pairs) -> dict:
+    """
+    pairs: iterable of (gp_id, day). Returns {(gp_id, day): slots} for hits only.
+    """
+    keys = {availability_key(gp_id, day): (gp_id, day) for gp_id, day in pairs}
+    if not keys:
+        return {}
+    found = cache.get_many(list(keys))
+    return {keys[k]: v for k, v in found.items()}
+
+
+async def aget_cached_availability(pairs) -> dict:
+    keys = {availability_key(gp_id, day): (gp_id, day) for gp_id, day in pairs}
+    if not keys:
+        return {}
+    found = await cache.aget_many(list(keys))
+    return {keys[k]: v for k, v in found.items()}
+
+
+def set_cached_availability(values: dict) -> None:
+    """
+    values: {(gp_id, day): slots}
+    """
+    if values:
+        cache.set_many(
+            {availability_key(gp_id, day): slots for (gp_id, day), slots in values.items()},
+            timeout=cache_timeout(),
+        )
+
+
+async def aset_cached_availability(values: dict) -> None:
+    if values:
+        await cache.aset_many(
+            {availability_key(gp_id, day): slots for (gp_id, day), slots in values.items()},
+            timeout=cache_timeout(),
+        )
+
+
+def affected_keys(gp_id, start_time, end_time):
+    if gp_id is None:
+        return set()
+    return {availability_key(gp_id, day) for day in days_touched(start_time, end_time)}
+
+
+def invalidate_availability(keys) -> None:
+    """
+    Drop cached days now, and again once the surrounding transaction commits,
+    so a reader racing the write can't re-cache the pre-commit state.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
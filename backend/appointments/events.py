@@ -0,0 +1,209 @@
+"""
+Appointment change events for live dashboards (served as SSE by
+appointments.streams).
+
+Writers call publish_appointment_event(); the event goes out after the
+surrounding transaction commits. Subscribers are asyncio queues fed by the
+broker chosen with settings.APPOINTMENT_EVENTS_BACKEND:
+
+  "inprocess" (default)  fan-out inside this process only
+  "postgres"             NOTIFY on a channel; each process LISTENs on its own
+                         connection and fans out locally, so events reach
+                         clients connected to any worker
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "appointment_events"
+
+# Per-subscriber backlog; a client that falls further behind gets "resync".
+QUEUE_SIZE = 100
+
+EVENT_CREATED = "created"
+EVENT_UPDATED = "updated"
+EVENT_CANCELLED = "cancelled"
+EVENT_DELETED = "deleted"
+
+
+# ----- payload / scoping -----
+
+def appointment_event(kind, appt, previous_gp=None) -> dict:
+    event = {
+        "type": kind,
+        "id": appt.id,
+        "patient": appt.patient_id,
+        "gp": appt.gp_id,
+        "status": appt.status,
+        "start_time": appt.start_time.isoformat(),
+        "end_time": appt.end_time.isoformat(),
+    }
+    if previous_gp is not None and previous_gp != appt.gp_id:
+        # Lets the GP an appointment was moved away from see the change too
+        event["previous_gp"] = previous_gp
+    return event
+
+
+def visible_to(user, event) -> bool:
+    """
+    Same scoping as the appointment list: staff see everything, GPs their own
+    appointments, patients theirs.
+    """
+    if user.is_superuser or user.role in ["RECEPTIONIST", "PRACTICE_MANAGER"]:
+        return True
+    if user.role == "GP":
+        return user.id in (event["gp"], event.get("previous_gp"))
+    if user.role == "PATIENT":
+        return event["patient"] == user.id
+    return False
+
+
+# ----- subscribers -----
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on self.loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class LocalFanout:
+    """
+    Thread-safe set of subscriptions in this process. dispatch() may be called
+    from any thread (sync views, the LISTEN thread).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = set()
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subs)
+
+    def dispatch(self, event) -> None:
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.deliver, event)
+            except RuntimeError:
+                # Loop already closed; the stream's cleanup will unsubscribe it
+                pass
+
+
+class InProcessBroker(LocalFanout):
+    def publish(self, event) -> None:
+        self.dispatch(event)
+
+
+class PostgresBroker(LocalFanout):
+    """
+    Publishes with pg_notify and relays notifications from a background
+    LISTEN connection (started on first subscribe).
+    """
+    reconnect_seconds = 2
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, event) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(event)])
+
+    def subscribe(self) -> Subscription:
+        sub = super().subscribe()
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="appointment-events", daemon=True)
+                self._listener.start()
+        return sub
+
+    def _connect(self):
+        import psycopg
+
+        db = settings.DATABASES["default"]
+        return psycopg.connect(
+            dbname=db["NAME"], user=db["USER"], password=db["PASSWORD"],
+            host=db["HOST"], port=db["PORT"], autocommit=True,
+        )
+
+    def _listen(self):
+        while True:
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    for notify in conn.notifies():
+                        self.dispatch(json.loads(notify.payload))
+            except Exception:
+                logger.exception("Appointment event listener failed; reconnecting")
+                time.sleep(self.reconnect_seconds)
+
+
+BROKERS = {
+    "inprocess": InProcessBroker,
+    "postgres": PostgresBroker,
+}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = BROKERS[getattr(settings, "APPOINTMENT_EVENTS_BACKEND", "inprocess")]()
+        return _broker
+
+
+# ----- publishing -----
+
+def publish_events(events) -> None:
+    """
+    Send events once the current transaction commits (immediately in autocommit).
+    A broker failure is logged, never raised into the write that caused it.
+    """
+    events = list(events)
+    if not events:
+        return
+
+    def send():
+        broker = get_broker()
+        for event in events:
+            try:
+                broker.publish(event)
+            except Exception:
+                logger.exception("Could not publish appointment event %s", event.get("id"))
+
+    transaction.on_commit(send)
+
+
+def publish_appointment_event(kind, appt, previous_gp=None) -> None:
+    publish_events([appointment_event(kind, appt, previous_gp)])
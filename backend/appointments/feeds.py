@@ -0,0 +1,121 @@
+# backend/appointments/feeds.py
+
+from django.contrib.auth import get_user_model
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+
+from .ics import feed_queryset, feed_token, feed_validators, read_feed_token, render_feed, rotate_feed
+
+User = get_user_model()
+
+
+class FeedLinkView(APIView):
+    """
+    GET /api/appointments/feed/                 (GP / patient: own feed)
+    GET /api/appointments/feed/?gp=<id>         (staff)
+    GET /api/appointments/feed/?patient=<id>    (staff)
+    POST (same query)                           revoke the feed's old URLs
+
+    Returns the secret .ics URL to paste into a calendar app. Calendars are
+    often shared with other services, so appointment reasons are left out
+    unless ?include_reason=1.
+    """
+    permission_classes = [IsAuthenticated]
+
+    feed_parameters = [
+        OpenApiParameter(name="gp", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False,
+                         description="Staff only: GP whose feed to link."),
+        OpenApiParameter(name="patient", type=OpenApiTypes.INT, location=OpenApiParameter.QUERY, required=False,
+                         description="Staff only: patient whose feed to link."),
+        OpenApiParameter(name="include_reason", type=OpenApiTypes.BOOL, location=OpenApiParameter.QUERY,
+                         required=False, description="Show appointment reasons in the feed."),
+    ]
+
+    @extend_schema(parameters=feed_parameters, responses={200: OpenApiTypes.OBJECT})
+    def get(self, request):
+        return self.link(request, *self.feed_of(request))
+
+    @extend_schema(parameters=feed_parameters, responses={200: OpenApiTypes.OBJECT})
+    def post(self, request):
+        kind, user_id = self.feed_of(request)
+        rotate_feed(kind, user_id)
+        return self.link(request, kind, user_id)
+
+    def link(self, request, kind, user_id):
+        with_reason = request.query_params.get("include_reason") in ("1", "true")
+        token = feed_token(kind, user_id, with_reason=with_reason)
+        url = request.build_absolute_uri(reverse("appointment_ics_feed", args=[token]))
+        return Response({"kind": kind, "user": user_id, "include_reason": with_reason, "url": url})
+
+    def feed_of(self, request):
+        u = request.user
+        params = request.query_params
+
+        if u.is_superuser or u.role in ["RECEPTIONIST", "PRACTICE_MANAGER"]:
+            kind = "gp" if params.get("gp") else "patient" if params.get("patient") else None
+            if kind is None:
+                raise ValidationError({"gp": "Pass gp or patient to choose a feed."})
+            try:
+                user_id = int(params[kind])
+            except ValueError:
+                raise ValidationError({kind: f"Invalid {kind} id."})
+            role = "GP" if kind == "gp" else "PATIENT"
+            if not User.objects.filter(id=user_id, role=role).exists():
+                raise ValidationError({kind: f"{role.title()} user not found."})
+        elif u.role == "GP":
+            kind, user_id = "gp", u.id
+        elif u.role == "PATIENT":
+            kind, user_id = "patient", u.id
+        else:
+            raise PermissionDenied("You do not have an appointment feed.")
+        return kind, user_id
+
+
+class IcsFeedView(APIView):
+    """
+    GET /api/appointments/feed/<token>.ics
+
+    iCalendar feed for one GP or patient. The signed token in the URL is the
+    credential until the feed is rotated. Responses carry a strong ETag and Last-Modified; a poll whose
+    validators still match gets 304 after the token's version lookup and a
+    single index-only aggregate, without loading or rendering any appointment.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    @extend_schema(responses={200: OpenApiTypes.STR, 304: None})
+    def get(self, request, token):
+        parsed = read_feed_token(token)
+        if parsed is None:
+            raise Http404
+        kind, user_id, with_reason = parsed
+
+        qs = feed_queryset(kind, user_id)
+        etag, last = feed_validators(qs)
+        last_modified = int(last.timestamp()) if last else None
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        owner = User.objects.filter(id=user_id).values_list("username", flat=True).first()
+        if owner is None:
+            raise Http404
+        fields = ["id", "start_time", "end_time", "status", "updated_at", "patient__username", "gp__username"]
+        rows = qs.order_by("start_time", "id").values(*fields, *(["reason"] if with_reason else []))
+        body = render_feed(kind, rows, name=f"Appointments - {owner}")
+
+        response = HttpResponse(body, content_type="text/calendar; charset=utf-8")
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # Always revalidate; the 304 path is cheap
+        response["Cache-Control"] = "private, no-cache"
+        return response
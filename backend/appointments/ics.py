@@ -0,0 +1,166 @@
+"""
+iCalendar (RFC 5545) rendering and signed feed tokens for per-GP and
+per-patient appointment feeds.
+"""
+
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core import signing
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import Appointment, FeedVersion
+
+FEED_KINDS = ("gp", "patient")
+FEED_SALT = "appointments.ics-feed"
+
+# Feeds cover upcoming appointments plus this much history.
+FEED_PAST_DAYS = 30
+
+PRODID = "-//GP System//Appointments//EN"
+
+STATUS_MAP = {
+    Appointment.Status.REQUESTED: "TENTATIVE",
+    Appointment.Status.CONFIRMED: "CONFIRMED",
+    Appointment.Status.COMPLETED: "CONFIRMED",
+    Appointment.Status.CANCELLED: "CANCELLED",
+}
+
+
+# ----- tokens -----
+
+def feed_version(kind, user_id) -> int:
+    return FeedVersion.objects.filter(kind=kind, user_id=user_id).values_list("version", flat=True).first() or 0
+
+
+def rotate_feed(kind, user_id) -> int:
+    """
+    Revoke every URL issued for a feed so far; returns the new version.
+    """
+    feed, _ = FeedVersion.objects.get_or_create(kind=kind, user_id=user_id)
+    FeedVersion.objects.filter(pk=feed.pk).update(version=F("version") + 1)
+    return feed_version(kind, user_id)
+
+
+def feed_token(kind, user_id, with_reason=False) -> str:
+    """
+    Opaque, unguessable token naming one feed at its current version.
+    Calendar apps can't send a JWT, so the feed URL itself is the credential;
+    rotate_feed() revokes it. Appointment reasons (clinical data) are only
+    rendered when the token was issued with with_reason.
+    """
+    payload = [kind, user_id, feed_version(kind, user_id), int(bool(with_reason))]
+    return signing.dumps(payload, salt=FEED_SALT, compress=True)
+
+
+def read_feed_token(token):
+    """
+    (kind, user_id, with_reason), or None for a tampered, unknown or revoked
+    token (including ones issued before feeds had versions).
+    """
+    try:
+        kind, user_id, version, with_reason = signing.loads(token, salt=FEED_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if kind not in FEED_KINDS or not isinstance(user_id, int) or not isinstance(version, int):
+        return None
+    if version != feed_version(kind, user_id):
+        return None
+    return kind, user_id, bool(with_reason)
+
+
+# ----- queries -----
+
+def feed_queryset(kind, user_id, now=None):
+    now = now or timezone.now()
+    return Appointment.objects.filter(
+        **{f"{kind}_id": user_id},
+        start_time__gte=now - timedelta(days=FEED_PAST_DAYS),
+    )
+
+
+def feed_validators(qs):
+    """
+    (etag, last_modified) for a feed, from one aggregate over the
+    (owner, start_time) INCLUDE (updated_at) index, so no row is read.
+
+    The count changes when an appointment is deleted or ages out of the
+    window; max(updated_at) changes on any edit or insert.
+    """
+    # count(*), not count(id): id isn't in the index
+    agg = qs.aggregate(count=Count("*"), last=Max("updated_at"))
+    last = agg["last"]
+    stamp = last.isoformat() if last else "-"
+    digest = hashlib.sha256(f"{agg['count']}:{stamp}".encode()).hexdigest()[:32]
+    return f'"{digest}"', last
+
+
+# ----- rendering -----
+
+def _escape(text) -> str:
+    return (
+        str(text)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line) -> str:
+    """
+    Lines longer than 75 octets continue on the next line after CRLF + space.
+    """
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, chunk = [], b""
+    for ch in line:
+        enc = ch.encode("utf-8")
+        if len(chunk) + len(enc) > (75 if not parts else 74):
+            parts.append(chunk.decode("utf-8"))
+            chunk = b""
+        chunk += enc
+    parts.append(chunk.decode("utf-8"))
+    return "\r\n ".join(parts)
+
+
+def _utc(dt) -> str:
+    return dt.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_feed(kind, rows, name) -> str:
+    """
+    rows are values() dicts with id, start_time, end_time, status, updated_at,
+    the other party's username and, for feeds that show it, reason.
+    """
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ]
+    for row in rows:
+        if kind == "gp":
+            summary = f"Appointment: {row['patient__username']}"
+        else:
+            summary = f"GP appointment with {row['gp__username']}" if row["gp__username"] else "GP appointment"
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:appointment-{row['id']}@gp-system",
+            f"DTSTAMP:{_utc(row['updated_at'])}",
+            f"LAST-MODIFIED:{_utc(row['updated_at'])}",
+            f"DTSTART:{_utc(row['start_time'])}",
+            f"DTEND:{_utc(row['end_time'])}",
+            f"SUMMARY:{_escape(summary)}",
+            f"STATUS:{STATUS_MAP.get(row['status'], 'CONFIRMED')}",
+        ]
+        if row.get("reason"):
+            lines.append(f"DESCRIPTION:{_escape(row['reason'])}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return "".join(_fold(line) + "\r\n" for line in lines)
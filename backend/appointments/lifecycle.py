@@ -0,0 +1,102 @@
+"""
+Moves finished appointments to terminal states, a small batch at a time:
+
+  CONFIRMED whose end_time has passed             -> COMPLETED
+  REQUESTED whose start_time (+ grace) has passed  -> CANCELLED
+
+Each batch is one short transaction: lock up to batch_size candidate rows
+(SKIP LOCKED, so rows a user is editing are left for the next run), UPDATE
+them by id, write their audit rows in one INSERT. Re-running is harmless:
+only rows still in the source status are picked.
+
+Only expiry frees slots. COMPLETED appointments still count toward the
+overlap checks and the no-overlap constraint, like every non-cancelled
+booking; they have already ended, so they never block a new one.
+"""
+
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from audits.utils import log_events
+from .cache import affected_keys, invalidate_availability
+from .events import EVENT_CANCELLED, EVENT_UPDATED, appointment_event, publish_events
+from .models import Appointment
+from .occupancy import refresh_occupancy, slot_pairs
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def transition_batch(from_status, to_status, due, now, batch_size, action) -> int:
+    """
+    Move one batch of appointments matching `due` (a Q) from from_status to
+    to_status. Returns how many were moved (0 when nothing is left).
+    """
+    with transaction.atomic():
+        rows = list(
+            Appointment.objects
+            .select_for_update(skip_locked=True)
+            .filter(due, status=from_status)
+            .order_by("start_time", "id")
+            .values("id", "patient_id", "gp_id", "start_time", "end_time")[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        Appointment.objects.filter(id__in=[row["id"] for row in rows]).update(
+            # update() skips auto_now
+            status=to_status, updated_at=now,
+        )
+        moved = [Appointment(status=to_status, **row) for row in rows]
+
+        if to_status == Appointment.Status.CANCELLED:
+            # Freed slots: same follow-up the post_save signal would do
+            pairs, keys = set(), set()
+            for appt in moved:
+                pairs |= slot_pairs(appt.gp_id, appt.start_time, appt.end_time)
+                keys |= affected_keys(appt.gp_id, appt.start_time, appt.end_time)
+            refresh_occupancy(pairs)
+            invalidate_availability(keys)
+
+        log_events(None, [
+            {
+                "action": action,
+                "obj": appt,
+                "object_type": "appointment",
+                "metadata": {"status": to_status, "previous_status": from_status, "automatic": True},
+            }
+            for appt in moved
+        ])
+
+        kind = EVENT_CANCELLED if to_status == Appointment.Status.CANCELLED else EVENT_UPDATED
+        publish_events(appointment_event(kind, appt) for appt in moved)
+    return len(rows)
+
+
+def run_lifecycle(now=None, batch_size=DEFAULT_BATCH_SIZE, requested_grace=timedelta(0), pause=0.0) -> dict:
+    """
+    Drain both transitions in batches. `pause` seconds between batches
+    throttles the job on a busy database. Returns {"completed": n, "expired": n}.
+    """
+    now = now or timezone.now()
+    jobs = [
+        ("completed", Appointment.Status.CONFIRMED, Appointment.Status.COMPLETED,
+         Q(start_time__lt=now, end_time__lte=now), "APPOINTMENT_AUTO_COMPLETE"),
+        ("expired", Appointment.Status.REQUESTED, Appointment.Status.CANCELLED,
+         Q(start_time__lte=now - requested_grace), "APPOINTMENT_EXPIRE"),
+    ]
+
+    totals = {}
+    for name, from_status, to_status, due, action in jobs:
+        totals[name] = 0
+        while True:
+            moved = transition_batch(from_status, to_status, due, now, batch_size, action)
+            totals[name] += moved
+            if moved < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return totals
@@ -0,0 +1,95 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of the sync read endpoints with their "
+        "/api/async/ variants on a running server (run it under uvicorn so both "
+        "go through the same ASGI stack)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--username")
+        parser.add_argument("--password")
+        parser.add_argument("--token", help="JWT access token (instead of username/password).")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint variant.")
+        parser.add_argument("--record", type=int, help="Record id for the entries endpoint (skipped if omitted).")
+
+    def handle(self, *args, **options):
+        base = options["base_url"].rstrip("/")
+        token = options["token"] or self.login(base, options["username"], options["password"])
+
+        today = timezone.now().date()
+        availability = f"?date_from={today}&date_to={today + timedelta(days=6)}"
+        pairs = [
+            ("me", "/api/accounts/me/", "/api/async/accounts/me/"),
+            ("appointments", "/api/appointments/", "/api/async/appointments/"),
+            ("availability", f"/api/appointments/availability/{availability}",
+             f"/api/async/appointments/availability/{availability}"),
+        ]
+        if options["record"]:
+            rid = options["record"]
+            pairs.append(("entries", f"/api/records/{rid}/entries/", f"/api/async/records/{rid}/entries/"))
+
+        self.stdout.write(
+            f"{options['requests']} requests per variant, concurrency {options['concurrency']}\n"
+            f"{'endpoint':<14}{'variant':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+        )
+        for name, sync_path, async_path in pairs:
+            for variant, path in (("sync", sync_path), ("async", async_path)):
+                result = self.run(base + path, token, options["requests"], options["concurrency"])
+                self.stdout.write(
+                    f"{name:<14}{variant:<8}{result['rps']:>9.1f}{result['p50']:>9.1f}"
+                    f"{result['p95']:>9.1f}{result['errors']:>8}"
+                )
+
+    def login(self, base, username, password):
+        if not (username and password):
+            raise CommandError("Pass --token or --username and --password.")
+        req = urllib.request.Request(
+            base + "/api/token/",
+            data=json.dumps({"username": username, "password": password}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return json.load(resp)["access"]
+        except urllib.error.URLError as exc:
+            raise CommandError(f"Login failed: {exc}")
+
+    def run(self, url, token, total, concurrency):
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+
+        def one(_):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as resp:
+                    resp.read()
+                    ok = resp.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(seconds * 1000 for seconds, _ in results)
+        return {
+            "rps": total / elapsed,
+            "p50": statistics.median(latencies),
+            "p95": latencies[int(len(latencies) * 0.95) - 1],
+            "errors": sum(1 for _, ok in results if not ok),
+        }
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from appointments.lifecycle import DEFAULT_BATCH_SIZE, run_lifecycle
+
+
+class Command(BaseCommand):
+    help = (
+        "Complete past CONFIRMED appointments and cancel REQUESTED ones whose "
+        "start has passed, in small batches. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--requested-grace-minutes", type=int, default=0,
+            help="Keep REQUESTED appointments this long after their start before expiring them.",
+        )
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument(
+            "--every", type=int, default=0,
+            help="Keep running, repeating every N seconds (0 = run once).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            totals = run_lifecycle(
+                batch_size=options["batch_size"],
+                requested_grace=timedelta(minutes=options["requested_grace_minutes"]),
+                pause=options["pause"],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Completed {totals['completed']}, expired {totals['expired']} appointments."
+            ))
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
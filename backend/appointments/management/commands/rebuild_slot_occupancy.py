@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from appointments.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-GP/per-day slot occupancy bitmap from appointments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = rebuild_occupancy(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt slot occupancy: {written} GP/day rows."))
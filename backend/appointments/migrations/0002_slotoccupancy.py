@@ -0,0 +1,88 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:35
+
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Copied from appointments.slots as of this migration, so later changes
+# there don't change what it builds: 09:00-17:00 UTC in 15-minute slots.
+SLOT_DELTA = timedelta(minutes=15)
+
+
+def day_window(day):
+    window_start = datetime.combine(day, time(9, 0, 0)).replace(tzinfo=dt_timezone.utc)
+    window_end = datetime.combine(day, time(17, 0, 0)).replace(tzinfo=dt_timezone.utc)
+    return window_start, window_end
+
+
+def days_touched(start_time, end_time):
+    start_time = start_time.astimezone(dt_timezone.utc)
+    end_time = end_time.astimezone(dt_timezone.utc)
+    day = start_time.date()
+    last = (end_time - timedelta(microseconds=1)).date() if end_time > start_time else day
+    days = []
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def interval_mask(day, start_time, end_time) -> int:
+    window_start, window_end = day_window(day)
+    start = max(start_time, window_start)
+    end = min(end_time, window_end)
+    if end <= start:
+        return 0
+    first = (start - window_start) // SLOT_DELTA
+    last = -((window_start - end) // SLOT_DELTA) - 1
+    return ((1 << (last - first + 1)) - 1) << first
+
+
+def build_occupancy(apps, schema_editor):
+    Appointment = apps.get_model("appointments", "Appointment")
+    SlotOccupancy = apps.get_model("appointments", "SlotOccupancy")
+
+    masks = {}
+    rows = (
+        Appointment.objects
+        .exclude(status="CANCELLED")
+        .exclude(gp__isnull=True)
+        .values_list("gp_id", "start_time", "end_time")
+        .iterator(chunk_size=2000)
+    )
+    for gp_id, start, end in rows:
+        for day in days_touched(start, end):
+            bits = interval_mask(day, start, end)
+            if bits:
+                masks[(gp_id, day)] = masks.get((gp_id, day), 0) | bits
+
+    SlotOccupancy.objects.bulk_create(
+        [SlotOccupancy(gp_id=gp_id, day=day, mask=mask) for (gp_id, day), mask in masks.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('mask', models.BigIntegerField(default=0)),
+                ('gp', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_occupancy', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('gp', 'day'), name='slot_occupancy_gp_day_uniq')],
+            },
+        ),
+        migrations.RunPython(build_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:36
+
+import appointments.models
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.conf import settings
+from django.db import migrations, models
+
+# Before the constraint, the overlap check was racy, so an existing database
+# may hold double bookings (or rows ending before they start), and adding the
+# constraint would abort with a bare Postgres error. List them instead.
+OVERLAPS_SQL = """
+SELECT a."id", b."id", a."gp_id", a."start_time", a."end_time", b."start_time", b."end_time"
+FROM "appointments_appointment" a
+JOIN "appointments_appointment" b
+  ON b."gp_id" = a."gp_id" AND b."id" > a."id"
+ AND b."start_time" < a."end_time" AND a."start_time" < b."end_time"
+WHERE a."status" <> 'CANCELLED' AND b."status" <> 'CANCELLED'
+ORDER BY a."gp_id", a."start_time", a."id"
+LIMIT 51
+"""
+
+INVERTED_SQL = """
+SELECT "id" FROM "appointments_appointment"
+WHERE "end_time" < "start_time" AND "gp_id" IS NOT NULL AND "status" <> 'CANCELLED'
+ORDER BY "id"
+LIMIT 51
+"""
+
+
+def check_no_overlaps(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS_SQL)
+        overlaps = cursor.fetchall()
+        cursor.execute(INVERTED_SQL)
+        inverted = [row[0] for row in cursor.fetchall()]
+    if not overlaps and not inverted:
+        return
+    lines = [
+        f"appointments {a} and {b} (GP {gp}): {a_start:%Y-%m-%d %H:%M}-{a_end:%H:%M} overlaps "
+        f"{b_start:%Y-%m-%d %H:%M}-{b_end:%H:%M}"
+        for a, b, gp, a_start, a_end, b_start, b_end in overlaps[:50]
+    ]
+    if len(overlaps) > 50:
+        lines.append("... and more")
+    if inverted:
+        lines.append(f"appointments ending before they start: {', '.join(map(str, inverted[:50]))}")
+    raise RuntimeError(
+        "Can't add the GP no-overlap constraint: active appointments overlap.\n  "
+        + "\n  ".join(lines)
+        + "\nCancel or move one appointment of each pair (and fix the end times), then run migrate again."
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_slotoccupancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_no_overlaps, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('gp__isnull', False), models.Q(('status', 'CANCELLED'), _negated=True)), expressions=[(appointments.models.Int8Range('gp', 'gp', models.Value('[]')), '&&'), (appointments.models.TsTzRange('start_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&')], name='appointment_gp_no_overlap'),
+        ),
+    ]
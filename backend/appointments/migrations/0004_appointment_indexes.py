@@ -0,0 +1,43 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_gp_no_overlap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Build the composites before dropping the single-column FK indexes they cover
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['gp', 'start_time'], name='appt_gp_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'start_time'], name='appt_patient_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 'CANCELLED'), _negated=True), fields=['gp', 'start_time', 'end_time'], name='appt_gp_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['start_time', 'id'], name='appt_start_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='gp',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments_as_gp', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='appointments_as_patient', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
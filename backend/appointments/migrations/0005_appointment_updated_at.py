@@ -0,0 +1,44 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Best available guess for existing rows
+    Appointment = apps.get_model("appointments", "Appointment")
+    Appointment.objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appointment_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_gp_start_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_patient_start_idx',
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['gp', 'start_time'], include=('updated_at',), name='appt_gp_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'start_time'], include=('updated_at',), name='appt_patient_start_idx'),
+        ),
+    ]
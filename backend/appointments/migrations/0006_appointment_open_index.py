@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-16 20:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['REQUESTED', 'CONFIRMED'])), fields=['status', 'start_time'], name='appt_open_start_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_open_index'),
+    ]
+
+    operations = [
+        # appt_gp_start_idx serves the overlap check just as well (gp plus a
+        # start_time bound); with both, the planner's pick was arbitrary
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_gp_active_idx',
+        ),
+    ]
@@ -1,5 +1,24 @@
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import (
+    BigIntegerRangeField, DateTimeRangeField, RangeBoundary, RangeOperators,
+)
+from django.db import models, transaction
+from django.db.models import Q, Value
+
+
+# Name is matched when translating the violation into an API error.
+GP_OVERLAP_CONSTRAINT = "appointment_gp_no_overlap"
+
+
+class TsTzRange(models.Func):
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
+
+
+class Int8Range(models.Func):
+    function = "INT8RANGE"
+    output_field = BigIntegerRangeField()
 
 
 class Appointment(models.Model):
@@ -13,6 +32,7 @@ class Appointment(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name="appointments_as_patient",
+        db_index=False,  # covered by appt_patient_start_idx
     )
     gp = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -20,6 +40,7 @@ class Appointment(models.Model):
         null=True,
         blank=True,
         related_name="appointments_as_gp",
+        db_index=False,  # covered by appt_gp_start_idx
     )
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
@@ -28,6 +49,90 @@ class Appointment(models.Model):
     reason = models.CharField(max_length=255, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every save; bulk updates must set it explicitly (feeds' ETags depend on it)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Per-user lists ("my appointments", GP diary), optionally by date range,
+            # and the GP overlap check (a GP's few rows near the slot; cancelled
+            # ones are filtered from there). updated_at is included so calendar
+            # feed validators are index-only scans.
+            models.Index(fields=["gp", "start_time"], include=["updated_at"], name="appt_gp_start_idx"),
+            models.Index(fields=["patient", "start_time"], include=["updated_at"], name="appt_patient_start_idx"),
+            # Staff list: keyset pages on (start_time, id), scanned backwards
+            models.Index(fields=["start_time", "id"], name="appt_start_id_idx"),
+            # Lifecycle job (appointments.lifecycle): only still-open rows, so it stays small
+            models.Index(
+                fields=["status", "start_time"],
+                name="appt_open_start_idx",
+                condition=Q(status__in=["REQUESTED", "CONFIRMED"]),
+            ),
+        ]
+        constraints = [
+            # No two active appointments for the same GP may overlap. gp is
+            # wrapped in a single-point int8range so GiST can compare it with
+            # && and the constraint doesn't need the btree_gist extension.
+            ExclusionConstraint(
+                name=GP_OVERLAP_CONSTRAINT,
+                expressions=[
+                    (Int8Range("gp", "gp", Value("[]")), RangeOperators.OVERLAPS),
+                    (TsTzRange("start_time", "end_time", RangeBoundary()), RangeOperators.OVERLAPS),
+                ],
+                condition=Q(gp__isnull=False) & ~Q(status="CANCELLED"),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # post_save refreshes SlotOccupancy; keep it in the same transaction as the write
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.patient.username} @ {self.start_time} ({self.status})"
+
+
+class SlotOccupancy(models.Model):
+    """
+    Busy 15-minute slots (09:00-17:00 UTC) for one GP on one day, as a bitmask.
+    Bit i is set when slot i overlaps a non-cancelled appointment.
+    Maintained by appointments.occupancy; rebuild with `manage.py rebuild_slot_occupancy`.
+    """
+    gp = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="slot_occupancy",
+    )
+    day = models.DateField()
+    mask = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["gp", "day"], name="slot_occupancy_gp_day_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.gp_id} {self.day} {self.mask:032b}"
+
+
+class FeedVersion(models.Model):
+    """
+    Current version of one calendar feed's URL. Feed tokens carry the version
+    they were issued for; bumping it (appointments.ics.rotate_feed) revokes
+    every URL handed out before. A feed without a row is at version 0.
+    """
+    kind = models.CharField(max_length=16)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "user"], name="feed_version_kind_user_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} feed of {self.user_id} v{self.version}"
@@ -0,0 +1,116 @@
+from functools import reduce
+from operator import or_
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Appointment, SlotOccupancy
+from .slots import day_window, days_touched, interval_mask
+
+
+def slot_pairs(gp_id, start_time, end_time):
+    """
+    (gp_id, day) occupancy rows an appointment can affect.
+    """
+    if gp_id is None:
+        return set()
+    return {(gp_id, day) for day in days_touched(start_time, end_time)}
+
+
+def add_to_masks(masks: dict, gp_id, start_time, end_time, wanted=None) -> None:
+    for day in days_touched(start_time, end_time):
+        if wanted is not None and (gp_id, day) not in wanted:
+            continue
+        bits = interval_mask(day, start_time, end_time)
+        if bits:
+            masks[(gp_id, day)] = masks.get((gp_id, day), 0) | bits
+
+
+def compute_masks(pairs) -> dict:
+    """
+    Busy masks for the given (gp_id, day) pairs, straight from Appointment rows.
+    """
+    pairs = set(pairs)
+    gp_ids = {gp_id for gp_id, _ in pairs}
+    days = sorted(day for _, day in pairs)
+    range_start, _ = day_window(days[0])
+    _, range_end = day_window(days[-1])
+
+    rows = (
+        Appointment.objects
+        .filter(gp_id__in=gp_ids, start_time__lt=range_end, end_time__gt=range_start)
+        .exclude(status=Appointment.Status.CANCELLED)
+        .values_list("gp_id", "start_time", "end_time")
+    )
+
+    masks = {}
+    for gp_id, start, end in rows:
+        add_to_masks(masks, gp_id, start, end, wanted=pairs)
+    return masks
+
+
+def refresh_occupancy(pairs) -> None:
+    """
+    Recompute occupancy rows for (gp_id, day) pairs inside the caller's transaction.
+
+    The rows are locked before the appointments are read, so two writers
+    touching the same GP/day serialise here and the second one sees the
+    first one's appointment instead of overwriting its bits.
+    """
+    pairs = sorted({(gp_id, day) for gp_id, day in pairs if gp_id is not None})
+    if not pairs:
+        return
+
+    with transaction.atomic():
+        SlotOccupancy.objects.bulk_create(
+            [SlotOccupancy(gp_id=gp_id, day=day) for gp_id, day in pairs],
+            ignore_conflicts=True,
+        )
+        # Stable lock order so concurrent refreshes can't deadlock
+        rows = list(
+            SlotOccupancy.objects
+            .select_for_update()
+            .filter(reduce(or_, (Q(gp_id=gp_id, day=day) for gp_id, day in pairs)))
+            .order_by("gp_id", "day")
+        )
+
+        masks = compute_masks(pairs)
+        changed = []
+        for row in rows:
+            mask = masks.get((row.gp_id, row.day), 0)
+            if row.mask != mask:
+                row.mask = mask
+                changed.append(row)
+        if changed:
+            SlotOccupancy.objects.bulk_update(changed, ["mask"])
+
+
+def rebuild_occupancy(chunk_size: int = 2000) -> int:
+    """
+    Rebuild the whole occupancy table from Appointment rows. Returns rows written.
+
+    Holds an EXCLUSIVE lock on the occupancy table (readers still work), so
+    concurrent refreshes wait and then recompute on top of the rebuilt data.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {SlotOccupancy._meta.db_table} IN EXCLUSIVE MODE")
+
+        SlotOccupancy.objects.all().delete()
+
+        rows = (
+            Appointment.objects
+            .exclude(status=Appointment.Status.CANCELLED)
+            .exclude(gp__isnull=True)
+            .values_list("gp_id", "start_time", "end_time")
+            .iterator(chunk_size=chunk_size)
+        )
+        masks = {}
+        for gp_id, start, end in rows:
+            add_to_masks(masks, gp_id, start, end)
+
+        SlotOccupancy.objects.bulk_create(
+            [SlotOccupancy(gp_id=gp_id, day=day, mask=mask) for (gp_id, day), mask in masks.items()],
+            batch_size=chunk_size,
+        )
+    return len(masks)
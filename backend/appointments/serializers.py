@@ -1,10 +1,23 @@
+from datetime import timedelta
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 from django.utils import timezone
-from .models import Appointment
+from .models import Appointment, GP_OVERLAP_CONSTRAINT
 
 User = get_user_model()
 
+GP_OVERLAP_ERROR = {"gp": "This GP already has an appointment in that time range."}
+
+
+def is_gp_overlap_violation(exc: IntegrityError) -> bool:
+    """
+    True if the IntegrityError came from the appointment_gp_no_overlap exclusion constraint.
+    """
+    diag = getattr(exc.__cause__, "diag", None)
+    return getattr(diag, "constraint_name", None) == GP_OVERLAP_CONSTRAINT
+
 
 class AppointmentSerializer(serializers.ModelSerializer):
     patient = serializers.PrimaryKeyRelatedField(
@@ -22,9 +35,9 @@ class AppointmentSerializer(serializers.ModelSerializer):
         fields = [
             "id", "patient", "gp",
             "start_time", "end_time",
-            "status", "reason", "created_at",
+            "status", "reason", "created_at", "updated_at",
         ]
-        read_only_fields = ["id", "created_at"]  # NOTE: don't make patient/gp read-only globally
+        read_only_fields = ["id", "created_at", "updated_at"]  # NOTE: don't make patient/gp read-only globally
 
     def _get_patient_assigned_gp_user(self, user):
         """
@@ -133,20 +146,35 @@ class AppointmentSerializer(serializers.ModelSerializer):
         gp = attrs.get("gp", getattr(instance, "gp", None))
 
         # Only check overlap if we have gp + times
+        # (fast path for a friendly error; the DB exclusion constraint is what
+        # actually guarantees no double booking under concurrent writes)
         if changing_slot and gp and start_time and end_time:
-            qs = Appointment.objects.filter(gp=gp)
+            if self._gp_has_conflict(gp, start_time, end_time, instance):
+                raise serializers.ValidationError(GP_OVERLAP_ERROR)
 
-            # Optional: ignore cancelled appointments for conflict checks
-            qs = qs.exclude(status=Appointment.Status.CANCELLED)
+        return attrs
 
-            if instance is not None:
-                qs = qs.exclude(pk=instance.pk)
+    def _gp_has_conflict(self, gp, start_time, end_time, instance=None) -> bool:
+        return self._conflict_queryset(gp, start_time, end_time, instance).exists()
 
-            conflict = qs.filter(start_time__lt=end_time, end_time__gt=start_time).exists()
-            if conflict:
-                raise serializers.ValidationError({"gp": "This GP already has an appointment in that time range."})
+    def _conflict_queryset(self, gp, start_time, end_time, instance=None):
+        qs = Appointment.objects.filter(gp=gp)
 
-        return attrs
+        # Optional: ignore cancelled appointments for conflict checks
+        qs = qs.exclude(status=Appointment.Status.CANCELLED)
+
+        if instance is not None:
+            qs = qs.exclude(pk=instance.pk)
+
+        return qs.filter(start_time__lt=end_time, end_time__gt=start_time)
+
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except IntegrityError as exc:
+            if is_gp_overlap_violation(exc):
+                raise serializers.ValidationError(GP_OVERLAP_ERROR)
+            raise
 
     def update(self, instance, validated_data):
         """
@@ -160,4 +188,89 @@ class AppointmentSerializer(serializers.ModelSerializer):
             validated_data.pop("patient", None)
             validated_data.pop("gp", None)
 
-        return super().update(instance, validated_data)
+        try:
+            return super().update(instance, validated_data)
+        except IntegrityError as exc:
+            if is_gp_overlap_violation(exc):
+                raise serializers.ValidationError(GP_OVERLAP_ERROR)
+            raise
+
+
+# ----- BULK / RECURRING CREATION -----
+
+MAX_BULK_ITEMS = 500
+
+
+class BulkAppointmentItemSerializer(serializers.Serializer):
+    """
+    One appointment in a bulk request. patient/gp are plain ids here: they are
+    checked for all items at once by appointments.bulk instead of one lookup
+    per item.
+    """
+    patient = serializers.IntegerField()
+    gp = serializers.IntegerField(required=False, allow_null=True, default=None)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    status = serializers.ChoiceField(choices=Appointment.Status.choices, default=Appointment.Status.REQUESTED)
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True, default="")
+
+    def validate(self, attrs):
+        if attrs["end_time"] <= attrs["start_time"]:
+            raise serializers.ValidationError({"end_time": "end_time must be after start_time."})
+        return attrs
+
+
+class RecurrenceSerializer(BulkAppointmentItemSerializer):
+    """
+    First occurrence (start_time/end_time) repeated every `interval` days or
+    weeks, either `count` times or until a date (inclusive).
+    """
+    frequency = serializers.ChoiceField(choices=["DAILY", "WEEKLY"])
+    interval = serializers.IntegerField(min_value=1, default=1)
+    count = serializers.IntegerField(min_value=1, max_value=MAX_BULK_ITEMS, required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if ("count" in attrs) == ("until" in attrs):
+            raise serializers.ValidationError({"detail": "Provide exactly one of count or until."})
+        if "until" in attrs and attrs["until"] < attrs["start_time"].date():
+            raise serializers.ValidationError({"until": "until must be on or after the first occurrence."})
+        return attrs
+
+    @staticmethod
+    def expand(data) -> list[dict]:
+        """
+        Validated recurrence data -> list of bulk item dicts.
+        """
+        step = timedelta(days=data["interval"] * (7 if data["frequency"] == "WEEKLY" else 1))
+        base = {k: data[k] for k in ("patient", "gp", "status", "reason")}
+
+        items = []
+        start, end = data["start_time"], data["end_time"]
+        while len(items) < data.get("count", MAX_BULK_ITEMS):
+            if "until" in data and start.date() > data["until"]:
+                break
+            items.append({**base, "start_time": start, "end_time": end})
+            start, end = start + step, end + step
+
+        if "until" in data and start.date() <= data["until"]:
+            raise serializers.ValidationError({"until": f"Recurrence expands to more than {MAX_BULK_ITEMS} appointments."})
+        return items
+
+
+class BulkAppointmentSerializer(serializers.Serializer):
+    MODE_ATOMIC = "atomic"
+    MODE_BEST_EFFORT = "best_effort"
+
+    mode = serializers.ChoiceField(choices=[MODE_ATOMIC, MODE_BEST_EFFORT], default=MODE_ATOMIC)
+    # Items are validated one by one in appointments.bulk so errors can be reported per item
+    appointments = serializers.ListField(
+        child=serializers.DictField(), required=False, min_length=1, max_length=MAX_BULK_ITEMS
+    )
+    recurrence = RecurrenceSerializer(required=False)
+
+    def validate(self, attrs):
+        if ("appointments" in attrs) == ("recurrence" in attrs):
+            raise serializers.ValidationError({"detail": "Provide either appointments or recurrence."})
+        return attrs
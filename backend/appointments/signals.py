@@ -0,0 +1,56 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import affected_keys, invalidate_availability
+from .events import (
+    EVENT_CANCELLED, EVENT_CREATED, EVENT_DELETED, EVENT_UPDATED, publish_appointment_event,
+)
+from .models import Appointment
+from .occupancy import refresh_occupancy, slot_pairs
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_slot(sender, instance: Appointment, **kwargs):
+    # Needed to refresh/invalidate the old GP/day when an appointment is moved,
+    # and to tell a cancellation apart from other updates
+    instance._previous_slot = None
+    instance._previous_status = None
+    if instance.pk:
+        row = (
+            Appointment.objects
+            .filter(pk=instance.pk)
+            .values_list("gp_id", "start_time", "end_time", "status")
+            .first()
+        )
+        if row:
+            instance._previous_slot = row[:3]
+            instance._previous_status = row[3]
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance: Appointment, created=False, **kwargs):
+    pairs = slot_pairs(instance.gp_id, instance.start_time, instance.end_time)
+    keys = affected_keys(instance.gp_id, instance.start_time, instance.end_time)
+
+    previous = getattr(instance, "_previous_slot", None)
+    if previous:
+        pairs |= slot_pairs(*previous)
+        keys |= affected_keys(*previous)
+
+    refresh_occupancy(pairs)
+    invalidate_availability(keys)
+
+    if created:
+        kind = EVENT_CREATED
+    elif instance.status == Appointment.Status.CANCELLED and getattr(instance, "_previous_status", None) != instance.status:
+        kind = EVENT_CANCELLED
+    else:
+        kind = EVENT_UPDATED
+    publish_appointment_event(kind, instance, previous_gp=previous[0] if previous else None)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance: Appointment, **kwargs):
+    refresh_occupancy(slot_pairs(instance.gp_id, instance.start_time, instance.end_time))
+    invalidate_availability(affected_keys(instance.gp_id, instance.start_time, instance.end_time))
+    publish_appointment_event(EVENT_DELETED, instance)
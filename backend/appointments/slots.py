@@ -0,0 +1,81 @@
+"""
+Slot arithmetic shared by availability and the occupancy bitmap.
+
+The bookable day is 09:00-17:00 UTC split into 15-minute slots, so a GP's
+day fits in a 32-bit mask: bit i is slot 09:00 + i * 15min.
+"""
+
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+SLOT_MINUTES = 15
+DAY_START_HOUR = 9
+DAY_END_HOUR = 17
+
+SLOT_COUNT = (DAY_END_HOUR - DAY_START_HOUR) * 60 // SLOT_MINUTES
+FULL_MASK = (1 << SLOT_COUNT) - 1
+
+SLOT_DELTA = timedelta(minutes=SLOT_MINUTES)
+
+
+def day_window(day):
+    """
+    UTC [start, end) bookable window for a calendar day.
+    """
+    window_start = datetime.combine(day, time(DAY_START_HOUR, 0, 0)).replace(tzinfo=dt_timezone.utc)
+    window_end = datetime.combine(day, time(DAY_END_HOUR, 0, 0)).replace(tzinfo=dt_timezone.utc)
+    return window_start, window_end
+
+
+def iter_days(date_from, date_to):
+    day = date_from
+    while day <= date_to:
+        yield day
+        day += timedelta(days=1)
+
+
+def days_touched(start_time, end_time):
+    """
+    UTC calendar days covered by [start_time, end_time).
+    """
+    if start_time is None or end_time is None:
+        return []
+    start_time = start_time.astimezone(dt_timezone.utc)
+    end_time = end_time.astimezone(dt_timezone.utc)
+    last = (end_time - timedelta(microseconds=1)).date() if end_time > start_time else start_time.date()
+    return list(iter_days(start_time.date(), last))
+
+
+def interval_mask(day, start_time, end_time) -> int:
+    """
+    Bits for every slot of `day` that [start_time, end_time) overlaps.
+    """
+    window_start, window_end = day_window(day)
+    start = max(start_time, window_start)
+    end = min(end_time, window_end)
+    if end <= start:
+        return 0
+
+    first = (start - window_start) // SLOT_DELTA
+    # ceil: a slot is busy if the interval ends anywhere inside it
+    last = -((window_start - end) // SLOT_DELTA) - 1
+    return ((1 << (last - first + 1)) - 1) << first
+
+
+def mask_to_slots(day, mask: int):
+    """
+    Free (start, end) slots for a day given its busy mask.
+    """
+    window_start, _ = day_window(day)
+    return [
+        (window_start + i * SLOT_DELTA, window_start + (i + 1) * SLOT_DELTA)
+        for i in range(SLOT_COUNT)
+        if not mask & (1 << i)
+    ]
+
+
+def iso_z(dt):
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def slot_dicts(slots):
+    return [{"start_time": iso_z(s), "end_time": iso_z(e)} for (s, e) in slots]
@@ -0,0 +1,77 @@
+# backend/appointments/streams.py
+
+import asyncio
+import json
+import time
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from config.async_views import authenticate_jwt_token
+
+from .events import get_broker, visible_to
+
+
+def _sse(event_name, data) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+
+class AppointmentEventStreamView(View):
+    """
+    GET /api/appointments/events/?token=<JWT access token>
+
+    Server-Sent Events stream of appointment changes the caller may see
+    (scoped like the appointment list). Events:
+
+      appointment  {"type": created|updated|cancelled|deleted, "id", "patient", "gp", ...}
+      resync       the client fell behind and should reload its list
+      expired      the access token has expired; the stream closes and the
+                   client reconnects with a current token
+
+    EventSource can't send headers, so the access token goes in the query
+    string (an Authorization header also works). The token is only checked
+    on connect, so the stream is closed when it expires. Needs an ASGI
+    server: each open stream is a coroutine waiting on a queue, not a worker
+    thread.
+    """
+    heartbeat_seconds = 15
+    retry_ms = 3000
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({"detail": "Event stream requires the ASGI server."}, status=501)
+
+        user, token = await authenticate_jwt_token(request, allow_query_token=True)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided or are invalid."}, status=401)
+
+        response = StreamingHttpResponse(self.stream(user, token["exp"]), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx-style proxies from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, user, expires_at):
+        broker = get_broker()
+        sub = broker.subscribe()
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            while True:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield _sse("expired", {})
+                    return
+                if sub.overflowed:
+                    sub.overflowed = False
+                    yield _sse("resync", {})
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), min(self.heartbeat_seconds, remaining))
+                except asyncio.TimeoutError:
+                    # Comment line keeps idle connections (and proxies) open
+                    yield ": ping\n\n"
+                    continue
+                if visible_to(user, event):
+                    yield _sse("appointment", event)
+        finally:
+            broker.unsubscribe(sub)
@@ -1,12 +1,30 @@
-from datetime import datetime, timedelta
+import asyncio
+import csv
+import json
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.urls import reverse
 from django.utils import timezone
-from django.test import TestCase
+from django.test import AsyncClient, TestCase
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from accounts.models import User
-from appointments.models import Appointment
+from audits.models import AuditLog
+from appointments.api_views import AppointmentCursorPagination
+from appointments.availability import MAX_RANGE_DAYS
+from appointments.events import appointment_event, get_broker, visible_to
+from appointments.lifecycle import run_lifecycle
+from appointments.models import Appointment, SlotOccupancy
+from appointments.serializers import AppointmentSerializer
+from appointments.slots import day_window, interval_mask, mask_to_slots
+from config.filters import filter_date_range
 
 
 class AppointmentAPITests(TestCase):
@@ -147,7 +165,7 @@ class AppointmentAPITests(TestCase):
 
         # should not include the past appointment
         now = timezone.now()
-        for item in resp.data:
+        for item in resp.data["results"]:
             dt = datetime.fromisoformat(item["start_time"].replace("Z", "+00:00"))
             self.assertGreaterEqual(dt, now)
 
@@ -157,3 +175,1007 @@ class AppointmentAPITests(TestCase):
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 403)
 
+
+
+def utc_dt(day, h, m):
+    return datetime.combine(day, datetime.min.time()).replace(hour=h, minute=m, tzinfo=dt_timezone.utc)
+
+
+class AvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.gp2 = User.objects.create_user(username="gp2", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+
+        cls.day = timezone.now().date() + timedelta(days=1)
+        dt = utc_dt
+
+        # 10:00-10:30 on day one, 09:05-09:20 on day two (covers two slots)
+        Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp,
+            start_time=dt(cls.day, 10, 0), end_time=dt(cls.day, 10, 30),
+            status=Appointment.Status.CONFIRMED,
+        )
+        Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp,
+            start_time=dt(cls.day + timedelta(days=1), 9, 5), end_time=dt(cls.day + timedelta(days=1), 9, 20),
+            status=Appointment.Status.REQUESTED,
+        )
+        # Cancelled appointments never block a slot
+        Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp2,
+            start_time=dt(cls.day, 9, 0), end_time=dt(cls.day, 17, 0),
+            status=Appointment.Status.CANCELLED,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def test_mask_slots_match_naive_scan(self):
+        window_start, window_end = day_window(self.day)
+        busy = [
+            (utc_dt(self.day, 8, 0), utc_dt(self.day, 9, 10)),
+            (utc_dt(self.day, 9, 50), utc_dt(self.day, 12, 0)),
+            (utc_dt(self.day, 10, 0), utc_dt(self.day, 10, 15)),
+            (utc_dt(self.day, 16, 45), utc_dt(self.day, 18, 0)),
+        ]
+
+        naive = []
+        cur = window_start
+        while cur < window_end:
+            end = cur + timedelta(minutes=15)
+            if not any(s < end and e > cur for s, e in busy):
+                naive.append((cur, end))
+            cur = end
+
+        mask = 0
+        for start, end in busy:
+            mask |= interval_mask(self.day, start, end)
+        self.assertEqual(mask_to_slots(self.day, mask), naive)
+
+    def test_single_day_mode_unchanged(self):
+        resp = self.client.get(reverse("appointment_availability") + f"?date={self.day}&gp={self.gp.id}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["available"]), 32 - 2)
+        starts = [s["start_time"] for s in resp.data["available"]]
+        self.assertNotIn(f"{self.day}T10:00:00Z", starts)
+        self.assertNotIn(f"{self.day}T10:15:00Z", starts)
+
+    def test_range_mode_multiple_gps(self):
+        day2 = self.day + timedelta(days=1)
+        resp = self.client.get(
+            reverse("appointment_availability")
+            + f"?date_from={self.day}&date_to={day2}&gp={self.gp.id},{self.gp2.id}"
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        by_gp = {g["gp"]: g["days"] for g in resp.data["gps"]}
+        self.assertEqual([d["date"] for d in by_gp[self.gp.id]], [str(self.day), str(day2)])
+        self.assertEqual(len(by_gp[self.gp.id][0]["available"]), 30)
+        self.assertEqual(len(by_gp[self.gp.id][1]["available"]), 30)
+        self.assertEqual(by_gp[self.gp.id][1]["available"][0]["start_time"], f"{day2}T09:30:00Z")
+        self.assertEqual(len(by_gp[self.gp2.id][0]["available"]), 32)
+
+    def test_range_mode_rejects_large_ranges(self):
+        resp = self.client.get(
+            reverse("appointment_availability")
+            + f"?date_from={self.day}&date_to={self.day + timedelta(days=MAX_RANGE_DAYS)}&gp={self.gp.id}"
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_gp_range_mode_is_scoped_to_self(self):
+        self.client.force_authenticate(self.gp)
+        resp = self.client.get(
+            reverse("appointment_availability") + f"?date_from={self.day}&date_to={self.day}&gp={self.gp2.id}"
+        )
+        self.assertEqual(resp.status_code, 403)
+
+        resp = self.client.get(reverse("appointment_availability") + f"?date_from={self.day}&date_to={self.day}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([g["gp"] for g in resp.data["gps"]], [self.gp.id])
+
+    def test_repeat_lookup_is_served_from_cache(self):
+        url = reverse("appointment_availability") + f"?date_from={self.day}&date_to={self.day}&gp={self.gp.id}"
+        first = self.client.get(url)
+
+        # Only the GP existence check remains; no appointment query
+        with self.assertNumQueries(1):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+
+    def test_moving_appointment_invalidates_old_and_new_day(self):
+        day2 = self.day + timedelta(days=1)
+        url = reverse("appointment_availability") + f"?date_from={self.day}&date_to={day2}&gp={self.gp.id},{self.gp2.id}"
+        self.client.get(url)  # warm the cache
+
+        appt = Appointment.objects.get(gp=self.gp, start_time=utc_dt(self.day, 10, 0))
+        staff = User.objects.create_user(username="reception1", password="pass", role=User.Role.RECEPTIONIST)
+        self.client.force_authenticate(staff)
+        resp = self.client.patch(
+            reverse("appointment_detail", args=[appt.id]),
+            {"gp": self.gp2.id, "start_time": utc_dt(day2, 12, 0).isoformat(), "end_time": utc_dt(day2, 12, 15).isoformat()},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200)
+
+        self.client.force_authenticate(self.patient)
+        by_gp = {g["gp"]: g["days"] for g in self.client.get(url).data["gps"]}
+        self.assertEqual(len(by_gp[self.gp.id][0]["available"]), 32)
+        self.assertEqual(len(by_gp[self.gp2.id][1]["available"]), 31)
+
+
+class SlotOccupancyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.day = timezone.now().date() + timedelta(days=3)
+
+    def mask(self, day=None):
+        row = SlotOccupancy.objects.filter(gp=self.gp, day=day or self.day).first()
+        return row.mask if row else 0
+
+    def test_bitmap_follows_create_cancel_and_move(self):
+        appt = Appointment.objects.create(
+            patient=self.patient, gp=self.gp,
+            start_time=utc_dt(self.day, 9, 10), end_time=utc_dt(self.day, 9, 40),
+            status=Appointment.Status.CONFIRMED,
+        )
+        self.assertEqual(self.mask(), 0b111)
+
+        appt.start_time = utc_dt(self.day + timedelta(days=1), 16, 45)
+        appt.end_time = utc_dt(self.day + timedelta(days=1), 17, 30)
+        appt.save()
+        self.assertEqual(self.mask(), 0)
+        self.assertEqual(self.mask(self.day + timedelta(days=1)), 1 << 31)
+
+        appt.status = Appointment.Status.CANCELLED
+        appt.save()
+        self.assertEqual(self.mask(self.day + timedelta(days=1)), 0)
+
+    def test_overlapping_appointments_keep_shared_slots_busy(self):
+        a = Appointment.objects.create(
+            patient=self.patient, gp=self.gp,
+            start_time=utc_dt(self.day, 10, 0), end_time=utc_dt(self.day, 10, 20),
+        )
+        # Shares the 10:15 slot with `a` without overlapping it
+        Appointment.objects.create(
+            patient=self.patient, gp=self.gp,
+            start_time=utc_dt(self.day, 10, 20), end_time=utc_dt(self.day, 10, 45),
+        )
+        a.delete()
+        self.assertEqual(self.mask(), 0b11 << 5)
+
+    def test_rebuild_command_matches_incremental_state(self):
+        Appointment.objects.create(
+            patient=self.patient, gp=self.gp,
+            start_time=utc_dt(self.day, 12, 0), end_time=utc_dt(self.day, 13, 0),
+        )
+        expected = self.mask()
+        SlotOccupancy.objects.all().delete()
+
+        call_command("rebuild_slot_occupancy", stdout=StringIO())
+        self.assertEqual(self.mask(), expected)
+        self.assertEqual(expected, 0b1111 << 12)
+
+
+class GPOverlapConstraintTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.receptionist = User.objects.create_user(
+            username="reception1", password="pass", role=User.Role.RECEPTIONIST
+        )
+        cls.day = timezone.now().date() + timedelta(days=2)
+        cls.existing = Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp,
+            start_time=utc_dt(cls.day, 10, 0), end_time=utc_dt(cls.day, 10, 30),
+            status=Appointment.Status.CONFIRMED,
+        )
+
+    def test_database_rejects_overlapping_active_appointments(self):
+        with self.assertRaises(IntegrityError):
+            Appointment.objects.create(
+                patient=self.patient, gp=self.gp,
+                start_time=utc_dt(self.day, 10, 15), end_time=utc_dt(self.day, 10, 45),
+            )
+
+    def test_cancelled_and_adjacent_appointments_are_allowed(self):
+        Appointment.objects.create(
+            patient=self.patient, gp=self.gp,
+            start_time=utc_dt(self.day, 10, 0), end_time=utc_dt(self.day, 10, 30),
+            status=Appointment.Status.CANCELLED,
+        )
+        Appointment.objects.create(
+            patient=self.patient, gp=self.gp,
+            start_time=utc_dt(self.day, 10, 30), end_time=utc_dt(self.day, 11, 0),
+        )
+        Appointment.objects.create(
+            patient=self.patient, gp=None,
+            start_time=utc_dt(self.day, 10, 0), end_time=utc_dt(self.day, 10, 30),
+        )
+
+    def test_constraint_violation_becomes_400_when_precheck_is_raced(self):
+        client = APIClient()
+        client.force_authenticate(self.receptionist)
+
+        # Simulate a concurrent booking slipping past the read-side check
+        with mock.patch.object(AppointmentSerializer, "_gp_has_conflict", return_value=False):
+            resp = client.post(
+                reverse("appointment_list_create"),
+                {
+                    "patient": self.patient.id,
+                    "gp": self.gp.id,
+                    "start_time": utc_dt(self.day, 10, 10).isoformat(),
+                    "end_time": utc_dt(self.day, 10, 20).isoformat(),
+                },
+                format="json",
+            )
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("gp", resp.data)
+        self.assertEqual(Appointment.objects.filter(gp=self.gp).count(), 1)
+
+
+class BulkAppointmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.receptionist = User.objects.create_user(
+            username="reception1", password="pass", role=User.Role.RECEPTIONIST
+        )
+        cls.day = timezone.now().date() + timedelta(days=7)
+        Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp,
+            start_time=utc_dt(cls.day, 10, 0), end_time=utc_dt(cls.day, 10, 30),
+            status=Appointment.Status.CONFIRMED,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.receptionist)
+        self.url = reverse("appointment_bulk_create")
+
+    def item(self, h, m, minutes=15):
+        start = utc_dt(self.day, h, m)
+        return {
+            "patient": self.patient.id,
+            "gp": self.gp.id,
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=minutes)).isoformat(),
+        }
+
+    def test_atomic_mode_creates_nothing_on_conflict(self):
+        items = [self.item(9, 0), self.item(10, 15), self.item(9, 10)]
+        resp = self.client.post(self.url, {"appointments": items}, format="json")
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([r["status"] for r in resp.data["results"]], ["skipped", "conflict", "conflict"])
+        self.assertEqual(Appointment.objects.filter(gp=self.gp).count(), 1)
+
+    def test_best_effort_mode_creates_valid_items_with_batched_queries(self):
+        items = [self.item(9, 0), self.item(10, 15), self.item(11, 0), {"patient": self.patient.id}]
+
+        # Fixed cost: lookups, one conflict query, one insert, occupancy refresh,
+        # one audit insert with its chain head lock and update
+        with self.assertNumQueries(15):
+            resp = self.client.post(self.url, {"mode": "best_effort", "appointments": items}, format="json")
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["created"], 2)
+        self.assertEqual(
+            [r["status"] for r in resp.data["results"]], ["created", "conflict", "created", "invalid"]
+        )
+        self.assertEqual(
+            AuditLog.objects.filter(action="APPOINTMENT_CREATE", metadata__bulk=True).count(), 2
+        )
+        # bulk_create bypasses signals, so the bitmap must still be maintained
+        self.assertEqual(SlotOccupancy.objects.get(gp=self.gp, day=self.day).mask, 0b1 | 0b11 << 4 | 0b1 << 8)
+
+    def test_weekly_recurrence(self):
+        start = utc_dt(self.day, 14, 0)
+        resp = self.client.post(self.url, {
+            "recurrence": {
+                "patient": self.patient.id,
+                "gp": self.gp.id,
+                "start_time": start.isoformat(),
+                "end_time": (start + timedelta(minutes=20)).isoformat(),
+                "frequency": "WEEKLY",
+                "count": 4,
+            },
+        }, format="json")
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["created"], 4)
+        starts = sorted(Appointment.objects.filter(start_time__gte=start).values_list("start_time", flat=True))
+        self.assertEqual(starts, [start + timedelta(weeks=i) for i in range(4)])
+
+    def test_patients_cannot_bulk_create(self):
+        self.client.force_authenticate(self.patient)
+        resp = self.client.post(self.url, {"appointments": [self.item(9, 0)]}, format="json")
+        self.assertEqual(resp.status_code, 403)
+
+
+class EarliestAvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.gp2 = User.objects.create_user(username="gp2", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.day = timezone.now().date() + timedelta(days=5)
+
+        Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp,
+            start_time=utc_dt(cls.day, 9, 0), end_time=utc_dt(cls.day, 9, 30),
+        )
+        # gp2 is fully booked on the first day
+        Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp2,
+            start_time=utc_dt(cls.day, 9, 0), end_time=utc_dt(cls.day, 17, 0),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def get(self, query):
+        return self.client.get(reverse("appointment_earliest_availability") + query)
+
+    def test_merges_gps_in_time_order(self):
+        after = utc_dt(self.day, 16, 30).isoformat().replace("+00:00", "Z")
+        resp = self.get(f"?after={after}&limit=4&gp={self.gp.id},{self.gp2.id}")
+        self.assertEqual(resp.status_code, 200)
+
+        day2 = self.day + timedelta(days=1)
+        self.assertEqual(
+            [(s["gp"], s["start_time"]) for s in resp.data["slots"]],
+            [
+                (self.gp.id, f"{self.day}T16:30:00Z"),
+                (self.gp.id, f"{self.day}T16:45:00Z"),
+                (self.gp.id, f"{day2}T09:00:00Z"),
+                (self.gp2.id, f"{day2}T09:00:00Z"),
+            ],
+        )
+
+    def test_stops_reading_once_enough_slots_are_found(self):
+        after = utc_dt(self.day, 9, 0).isoformat().replace("+00:00", "Z")
+        # GP lookup + a single occupancy chunk; later days are never queried
+        with self.assertNumQueries(2):
+            resp = self.get(f"?after={after}&limit=2&gp={self.gp.id},{self.gp2.id}")
+        self.assertEqual([s["start_time"] for s in resp.data["slots"]], [f"{self.day}T09:30:00Z", f"{self.day}T09:45:00Z"])
+
+    def test_fractional_after_excludes_the_slot_it_is_inside(self):
+        after = f"{self.day}T16:30:00.500000Z"
+        resp = self.get(f"?after={after}&limit=1&gp={self.gp.id}")
+        self.assertEqual(resp.data["slots"][0]["start_time"], f"{self.day}T16:45:00Z")
+
+    def test_invalid_after_is_400(self):
+        for after in ("tomorrow", "2030-13-40T00:00"):
+            resp = self.get(f"?after={after}")
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn("after", resp.data)
+
+    def test_limit_is_bounded(self):
+        self.assertEqual(self.get("?limit=0").status_code, 400)
+        self.assertEqual(self.get("?limit=500").status_code, 400)
+
+
+class AppointmentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.receptionist = User.objects.create_user(
+            username="reception1", password="pass", role=User.Role.RECEPTIONIST
+        )
+        cls.day = timezone.now().date() + timedelta(days=10)
+
+        # Pairs of appointments share a start time (gp + no gp) to exercise the id tie-breaker
+        for i in range(6):
+            start = utc_dt(cls.day, 9 + i, 0)
+            for gp in (cls.gp, None):
+                Appointment.objects.create(
+                    patient=cls.patient, gp=gp, start_time=start, end_time=start + timedelta(minutes=30)
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.receptionist)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            ids += [item["id"] for item in resp.data["results"]]
+            url = resp.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_pages_follow_start_time_then_id_without_gaps(self):
+        ids, pages = self.walk(reverse("appointment_list_create") + "?page_size=5")
+
+        expected = list(
+            Appointment.objects.order_by("-start_time", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_filters_apply_across_pages(self):
+        ids, _ = self.walk(reverse("appointment_list_create") + f"?gp={self.gp.id}&page_size=4")
+        self.assertEqual(len(ids), 6)
+        self.assertTrue(all(Appointment.objects.get(id=i).gp_id == self.gp.id for i in ids))
+
+    def test_later_pages_cost_the_same_query(self):
+        first = self.client.get(reverse("appointment_list_create") + "?page_size=2")
+        # ETag aggregate + the page itself, whatever the page number
+        with self.assertNumQueries(2):
+            self.client.get(first.data["next"])
+
+    def test_invalid_cursor_is_404(self):
+        resp = self.client.get(reverse("appointment_list_create") + "?cursor=not-a-cursor")
+        self.assertEqual(resp.status_code, 404)
+
+
+class AppointmentIndexTests(TestCase):
+    """
+    The hot filters must be answerable from an index. Sequential scans are
+    disabled so the plan shows which index (if any) can serve the predicate,
+    independent of how small the test table is.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gps = [
+            User.objects.create_user(username=f"gp{i}", password="pass", role=User.Role.GP)
+            for i in range(5)
+        ]
+        cls.patients = [
+            User.objects.create_user(username=f"patient{i}", password="pass", role=User.Role.PATIENT)
+            for i in range(20)
+        ]
+        cls.day = date(2030, 1, 7)
+
+        objs = []
+        for n in range(2000):
+            start = utc_dt(cls.day + timedelta(days=n // 80), 9, 0) + timedelta(minutes=15 * ((n % 80) // 5))
+            objs.append(Appointment(
+                patient=cls.patients[n % 20],
+                gp=cls.gps[n % 5],
+                start_time=start,
+                end_time=start + timedelta(minutes=15),
+                status=Appointment.Status.CANCELLED if n % 10 == 0 else Appointment.Status.CONFIRMED,
+            ))
+        Appointment.objects.bulk_create(objs)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE appointments_appointment")
+
+    def plan(self, qs):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return qs.explain()
+
+    def assertIndexRange(self, plan, index_name):
+        self.assertIn(index_name, plan)
+        # start_time is bounded inside the index condition, not filtered afterwards
+        cond = [line for line in plan.splitlines() if "Index Cond" in line]
+        self.assertTrue(any("start_time" in line for line in cond), plan)
+
+    def test_date_range_filter_is_sargable(self):
+        params = {"date_from": "2030-01-08", "date_to": "2030-01-09"}
+        qs = filter_date_range(Appointment.objects.filter(patient=self.patients[0]), "start_time", params)
+
+        self.assertIndexRange(self.plan(qs), "appt_patient_start_idx")
+        # Half-open range keeps whole days, same rows as the old __date filters
+        expected = Appointment.objects.filter(
+            patient=self.patients[0],
+            start_time__date__gte=date(2030, 1, 8),
+            start_time__date__lte=date(2030, 1, 9),
+        )
+        self.assertEqual(set(qs), set(expected))
+        self.assertTrue(qs.exists())
+
+    def test_gp_overlap_check_uses_gp_start_index(self):
+        start = utc_dt(self.day + timedelta(days=3), 10, 0)
+        qs = AppointmentSerializer()._conflict_queryset(self.gps[0], start, start + timedelta(minutes=30))
+
+        plan = self.plan(qs)
+        self.assertIndexRange(plan, "appt_gp_start_idx")
+        self.assertTrue(any("gp_id" in line for line in plan.splitlines() if "Index Cond" in line), plan)
+
+    def test_staff_list_keyset_page_uses_start_id_index(self):
+        qs = AppointmentCursorPagination().apply_cursor(Appointment.objects.all(), None)[:51]
+
+        plan = self.plan(qs)
+        self.assertIn("appt_start_id_idx", plan)
+        self.assertNotIn("Sort", plan)
+
+
+class AppointmentExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.gp2 = User.objects.create_user(username="gp2", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.manager = User.objects.create_user(
+            username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER
+        )
+        cls.day = date(2030, 3, 4)
+        for i, gp in enumerate([cls.gp, cls.gp2, cls.gp]):
+            start = utc_dt(cls.day, 9 + i, 0)
+            Appointment.objects.create(
+                patient=cls.patient, gp=gp, start_time=start,
+                end_time=start + timedelta(minutes=30), reason=f"visit, #{i}",
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.url = reverse("appointment_export")
+
+    def body(self, resp):
+        return b"".join(resp.streaming_content).decode()
+
+    def test_csv_streams_filtered_rows_oldest_first(self):
+        resp = self.client.get(self.url + f"?gp={self.gp.id}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertTrue(resp["Content-Type"].startswith("text/csv"))
+        self.assertIn('filename="appointments.csv"', resp["Content-Disposition"])
+
+        rows = list(csv.DictReader(StringIO(self.body(resp))))
+        self.assertEqual([r["reason"] for r in rows], ["visit, #0", "visit, #2"])
+        self.assertEqual(rows[0]["gp__username"], "gp1")
+        self.assertEqual(rows[0]["start_time"], "2030-03-04T09:00:00+00:00")
+
+    def test_csv_neutralises_formula_cells(self):
+        Appointment.objects.filter(reason="visit, #0").update(reason="=HYPERLINK(\"http://x\")")
+        resp = self.client.get(self.url + f"?gp={self.gp.id}")
+        rows = list(csv.DictReader(StringIO(self.body(resp))))
+        self.assertEqual(rows[0]["reason"], "'=HYPERLINK(\"http://x\")")
+
+        # NDJSON is data, not a spreadsheet: values are left alone
+        resp = self.client.get(self.url + f"?gp={self.gp.id}&output=ndjson")
+        self.assertEqual(json.loads(self.body(resp).splitlines()[0])["reason"], "=HYPERLINK(\"http://x\")")
+
+    def test_ndjson_one_object_per_line(self):
+        resp = self.client.get(self.url + "?output=ndjson&date_from=2030-03-04&date_to=2030-03-04")
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+
+        lines = [json.loads(line) for line in self.body(resp).splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[1]["gp"], self.gp2.id)
+        self.assertEqual(lines[1]["start_time"], "2030-03-04T10:00:00Z")
+
+    def test_rows_are_read_lazily(self):
+        # Only the audit insert (and its chain head lock and update) runs
+        # before the body is consumed
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.url)
+        self.body(resp)
+        self.assertTrue(AuditLog.objects.filter(action="APPOINTMENT_EXPORT").exists())
+
+    def test_non_staff_forbidden(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_unknown_output_rejected(self):
+        resp = self.client.get(self.url + "?output=xlsx")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("output", resp.data)
+
+
+class IcsFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.other = User.objects.create_user(username="patient2", password="pass", role=User.Role.PATIENT)
+        cls.receptionist = User.objects.create_user(
+            username="reception1", password="pass", role=User.Role.RECEPTIONIST
+        )
+        day = timezone.now().date() + timedelta(days=3)
+        cls.appt = Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp, start_time=utc_dt(day, 10, 0), end_time=utc_dt(day, 10, 30),
+            status=Appointment.Status.CONFIRMED, reason="Follow-up; bloods, " + "x" * 80,
+        )
+        Appointment.objects.create(
+            patient=cls.other, gp=cls.gp, start_time=utc_dt(day, 11, 0), end_time=utc_dt(day, 11, 30),
+        )
+
+    def feed_url(self, user, query="", method="get"):
+        client = APIClient()
+        client.force_authenticate(user)
+        resp = getattr(client, method)(reverse("appointment_feed_link") + query)
+        self.assertEqual(resp.status_code, 200)
+        return resp.data["url"]
+
+    def test_patient_feed_lists_only_their_appointments(self):
+        resp = APIClient().get(self.feed_url(self.patient))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/calendar"))
+
+        body = resp.content.decode()
+        self.assertEqual(body.count("BEGIN:VEVENT"), 1)
+        self.assertIn(f"UID:appointment-{self.appt.id}@gp-system", body)
+        self.assertIn("SUMMARY:GP appointment with gp1", body)
+        self.assertNotIn("DESCRIPTION", body)
+
+        # Reasons are clinical data: only in feeds linked with include_reason
+        body = APIClient().get(self.feed_url(self.patient, "?include_reason=1")).content.decode()
+        self.assertIn("DESCRIPTION:Follow-up\; bloods\\, ", body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split("\r\n")))
+
+    def test_gp_feed_has_all_their_patients(self):
+        body = APIClient().get(self.feed_url(self.gp)).content.decode()
+        self.assertEqual(body.count("BEGIN:VEVENT"), 2)
+        self.assertIn("SUMMARY:Appointment: patient2", body)
+
+    def test_unchanged_poll_is_304_from_one_query(self):
+        url = self.feed_url(self.gp)
+        first = APIClient().get(url)
+        etag = first["ETag"]
+
+        # Token version, then the aggregate
+        with self.assertNumQueries(2):
+            resp = APIClient().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        resp = APIClient().get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_edit_or_delete_changes_etag(self):
+        url = self.feed_url(self.gp)
+        etag = APIClient().get(url)["ETag"]
+
+        self.appt.status = Appointment.Status.CANCELLED
+        self.appt.save()
+        resp = APIClient().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("STATUS:CANCELLED", resp.content.decode())
+
+        etag = resp["ETag"]
+        Appointment.objects.filter(patient=self.other).delete()
+        self.assertEqual(APIClient().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_staff_link_and_bad_token(self):
+        url = self.feed_url(self.receptionist, f"?patient={self.other.id}")
+        body = APIClient().get(url).content.decode()
+        self.assertIn("X-WR-CALNAME:Appointments - patient2", body)
+
+        tampered = url.replace(".ics", "x.ics")
+        self.assertEqual(APIClient().get(tampered).status_code, 404)
+
+    def test_rotating_a_feed_revokes_its_old_urls(self):
+        old = self.feed_url(self.patient)
+        staff_issued = self.feed_url(self.receptionist, f"?patient={self.patient.id}")
+        new = self.feed_url(self.patient, method="post")
+
+        self.assertEqual(APIClient().get(old).status_code, 404)
+        self.assertEqual(APIClient().get(staff_issued).status_code, 404)
+        self.assertEqual(APIClient().get(new).status_code, 200)
+        # Other feeds keep working
+        self.assertEqual(APIClient().get(self.feed_url(self.gp)).status_code, 200)
+
+
+class AppointmentConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        start = utc_dt(timezone.now().date() + timedelta(days=2), 10, 0)
+        cls.appt = Appointment.objects.create(
+            patient=cls.patient, gp=cls.gp, start_time=start, end_time=start + timedelta(minutes=30)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def test_list_304_skips_serialisation(self):
+        url = reverse("appointment_list_create")
+        etag = self.client.get(url)["ETag"]
+
+        with mock.patch.object(AppointmentSerializer, "to_representation") as to_repr:
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+        to_repr.assert_not_called()
+
+    def test_list_tag_changes_on_update_and_delete(self):
+        url = reverse("appointment_list_create")
+        etag = self.client.get(url)["ETag"]
+
+        self.appt.reason = "changed"
+        self.appt.save()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+        etag = resp["ETag"]
+        self.appt.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_304(self):
+        url = reverse("appointment_detail", args=[self.appt.id])
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304
+        )
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, event):
+        self.events.append(event)
+
+
+class AppointmentEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.gp2 = User.objects.create_user(username="gp2", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.other = User.objects.create_user(username="patient2", password="pass", role=User.Role.PATIENT)
+        cls.receptionist = User.objects.create_user(
+            username="reception1", password="pass", role=User.Role.RECEPTIONIST
+        )
+        cls.start = utc_dt(timezone.now().date() + timedelta(days=5), 10, 0)
+
+    def setUp(self):
+        self.broker = RecordingBroker()
+        patcher = mock.patch("appointments.events.get_broker", return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, **kwargs):
+        fields = dict(patient=self.patient, gp=self.gp, start_time=self.start, end_time=self.start + timedelta(minutes=30))
+        fields.update(kwargs)
+        return Appointment.objects.create(**fields)
+
+    def test_events_go_out_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appt = self.create()
+            self.assertEqual(self.broker.events, [])
+        self.assertEqual(self.broker.events[0]["type"], "created")
+        self.assertEqual(self.broker.events[0]["gp"], self.gp.id)
+
+    def test_update_cancel_move_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appt = self.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            appt.reason = "x"
+            appt.save()
+            appt.gp = self.gp2
+            appt.save()
+            appt.status = Appointment.Status.CANCELLED
+            appt.save()
+            appt.delete()
+
+        kinds = [e["type"] for e in self.broker.events]
+        self.assertEqual(kinds, ["created", "updated", "updated", "cancelled", "deleted"])
+        moved = self.broker.events[2]
+        self.assertEqual((moved["gp"], moved["previous_gp"]), (self.gp2.id, self.gp.id))
+
+    def test_bulk_create_publishes_each_appointment(self):
+        client = APIClient()
+        client.force_authenticate(self.receptionist)
+        items = [
+            {"patient": self.patient.id, "gp": self.gp.id,
+             "start_time": (self.start + timedelta(hours=i)).isoformat(),
+             "end_time": (self.start + timedelta(hours=i, minutes=30)).isoformat()}
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(reverse("appointment_bulk_create"), {"appointments": items}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([e["type"] for e in self.broker.events], ["created"] * 3)
+
+    def test_visibility_matches_list_scoping(self):
+        event = appointment_event("updated", self.create(gp=self.gp2), previous_gp=self.gp.id)
+
+        self.assertTrue(visible_to(self.receptionist, event))
+        self.assertTrue(visible_to(self.gp, event))  # moved away from gp1
+        self.assertTrue(visible_to(self.gp2, event))
+        self.assertTrue(visible_to(self.patient, event))
+        self.assertFalse(visible_to(self.other, event))
+
+
+class AppointmentEventStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.other = User.objects.create_user(username="patient2", password="pass", role=User.Role.PATIENT)
+
+    def event(self, patient_id, appt_id):
+        return {"type": "created", "id": appt_id, "patient": patient_id, "gp": self.gp.id, "status": "REQUESTED",
+                "start_time": "2030-01-01T10:00:00+00:00", "end_time": "2030-01-01T10:30:00+00:00"}
+
+    async def test_stream_pushes_only_visible_events(self):
+        token = str(AccessToken.for_user(self.patient))
+        resp = await AsyncClient().get(reverse("appointment_events") + f"?token={token}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+
+        chunks = aiter(resp.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b"retry:"))
+
+        broker = get_broker()
+        broker.publish(self.event(self.other.id, 1))
+        broker.publish(self.event(self.patient.id, 2))
+        chunk = (await asyncio.wait_for(anext(chunks), 2)).decode()
+        self.assertTrue(chunk.startswith("event: appointment\n"))
+        self.assertEqual(json.loads(chunk.split("data: ", 1)[1])["id"], 2)
+
+        # On client disconnect the ASGI handler cancels the task reading the stream
+        pending = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(broker.has_subscribers())
+
+    async def test_stream_closes_when_the_token_expires(self):
+        token = AccessToken.for_user(self.patient)
+        token.set_exp(lifetime=timedelta(seconds=1))
+        resp = await AsyncClient().get(reverse("appointment_events") + f"?token={token}")
+        self.assertEqual(resp.status_code, 200)
+
+        async def read_all():
+            return [chunk async for chunk in resp.streaming_content]
+
+        chunks = await asyncio.wait_for(read_all(), 5)
+        self.assertTrue(chunks[-1].decode().startswith("event: expired\n"))
+        self.assertFalse(get_broker().has_subscribers())
+
+    async def test_bad_token_rejected(self):
+        resp = await AsyncClient().get(reverse("appointment_events") + "?token=nope")
+        self.assertEqual(resp.status_code, 401)
+
+    def test_requires_asgi(self):
+        self.client.force_login(self.patient)
+        resp = self.client.get(reverse("appointment_events") + "?token=x")
+        self.assertEqual(resp.status_code, 501)
+
+
+class AppointmentLifecycleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.now = utc_dt(date(2030, 6, 3), 12, 0)
+        cls.day = cls.now.date()
+
+    def make(self, hour, status, day=None):
+        start = utc_dt(day or self.day, hour, 0)
+        return Appointment.objects.create(
+            patient=self.patient, gp=self.gp, start_time=start,
+            end_time=start + timedelta(minutes=30), status=status,
+        )
+
+    def test_moves_past_appointments_in_batches(self):
+        past_confirmed = [self.make(9 + i, "CONFIRMED", day=self.day - timedelta(days=1)) for i in range(5)]
+        past_requested = self.make(10, "REQUESTED")
+        future_confirmed = self.make(14, "CONFIRMED")
+        future_requested = self.make(15, "REQUESTED")
+        cancelled = self.make(11, "CANCELLED")
+
+        totals = run_lifecycle(now=self.now, batch_size=2)
+        self.assertEqual(totals, {"completed": 5, "expired": 1})
+
+        statuses = dict(Appointment.objects.values_list("id", "status"))
+        self.assertTrue(all(statuses[a.id] == "COMPLETED" for a in past_confirmed))
+        self.assertEqual(statuses[past_requested.id], "CANCELLED")
+        self.assertEqual(statuses[future_confirmed.id], "CONFIRMED")
+        self.assertEqual(statuses[future_requested.id], "REQUESTED")
+        self.assertEqual(statuses[cancelled.id], "CANCELLED")
+
+        self.assertEqual(AuditLog.objects.filter(action="APPOINTMENT_AUTO_COMPLETE").count(), 5)
+        expire_log = AuditLog.objects.get(action="APPOINTMENT_EXPIRE")
+        self.assertEqual(expire_log.object_id, past_requested.id)
+        self.assertEqual(expire_log.metadata["previous_status"], "REQUESTED")
+
+        past_requested.refresh_from_db()
+        self.assertEqual(past_requested.updated_at, self.now)
+
+    def test_expired_request_frees_its_slot(self):
+        self.make(10, "REQUESTED")
+        self.assertNotEqual(SlotOccupancy.objects.get(gp=self.gp, day=self.day).mask, 0)
+
+        run_lifecycle(now=self.now)
+        self.assertEqual(SlotOccupancy.objects.get(gp=self.gp, day=self.day).mask, 0)
+
+    def test_grace_period_and_rerun(self):
+        self.make(11, "REQUESTED")
+        self.assertEqual(run_lifecycle(now=self.now, requested_grace=timedelta(hours=2))["expired"], 0)
+        self.assertEqual(run_lifecycle(now=self.now)["expired"], 1)
+        # Nothing left to do: no updates and no new audit rows
+        self.assertEqual(run_lifecycle(now=self.now), {"completed": 0, "expired": 0})
+        self.assertEqual(AuditLog.objects.filter(action="APPOINTMENT_EXPIRE").count(), 1)
+
+    def test_command(self):
+        self.make(9, "CONFIRMED", day=date(2020, 1, 6))
+        out = StringIO()
+        call_command("expire_appointments", "--batch-size", "10", stdout=out)
+        self.assertIn("Completed 1, expired 0", out.getvalue())
+
+
+class AsyncReadEndpointTests(TestCase):
+    """
+    The async variants must answer exactly like the DRF views they mirror.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.gp2 = User.objects.create_user(username="gp2", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.receptionist = User.objects.create_user(
+            username="reception1", password="pass", role=User.Role.RECEPTIONIST
+        )
+        cls.day = timezone.now().date() + timedelta(days=4)
+        for i in range(3):
+            Appointment.objects.create(
+                patient=cls.patient, gp=cls.gp if i % 2 == 0 else cls.gp2,
+                start_time=utc_dt(cls.day, 9 + i, 0), end_time=utc_dt(cls.day, 9 + i, 30),
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def sync_get(self, user, name, query=""):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(reverse(name) + query)
+
+    async def async_get(self, user, name, query=""):
+        token = str(AccessToken.for_user(user))
+        return await AsyncClient().get(reverse(name) + query, headers={"Authorization": f"Bearer {token}"})
+
+    async def assertSameAs(self, user, sync_name, async_name, query=""):
+        expected = await sync_to_async(self.sync_get)(user, sync_name, query)
+        resp = await self.async_get(user, async_name, query)
+        self.assertEqual(resp.status_code, expected.status_code)
+        # Only difference allowed: next links point back at the async endpoint
+        body = resp.content.decode().replace("/api/async/", "/api/")
+        self.assertEqual(json.loads(body), json.loads(expected.content))
+        return resp
+
+    async def test_list_matches_sync_view(self):
+        await self.assertSameAs(self.receptionist, "appointment_list_create", "async_appointment_list", f"?gp={self.gp.id}")
+        await self.assertSameAs(self.patient, "appointment_list_create", "async_appointment_list", "?page_size=2")
+
+        # The next link is followed the same way
+        first = await self.async_get(self.patient, "async_appointment_list", "?page_size=2")
+        query = "?" + first.json()["next"].split("?", 1)[1]
+        resp = await self.assertSameAs(self.patient, "appointment_list_create", "async_appointment_list", query)
+        self.assertEqual(len(resp.json()["results"]), 1)
+
+    async def test_availability_matches_sync_view(self):
+        day = self.day.isoformat()
+        await self.assertSameAs(self.patient, "appointment_availability", "async_appointment_availability",
+                                f"?date={day}&gp={self.gp.id}")
+        await self.assertSameAs(self.patient, "appointment_availability", "async_appointment_availability",
+                                f"?date_from={day}&date_to={day}")
+
+    async def test_errors_match_sync_view(self):
+        # GP asking about another GP, bad input, unknown GP
+        await self.assertSameAs(self.gp, "appointment_availability", "async_appointment_availability",
+                                f"?date={self.day.isoformat()}&gp={self.gp2.id}")
+        await self.assertSameAs(self.patient, "appointment_availability", "async_appointment_availability",
+                                "?date=nope&gp=1")
+        await self.assertSameAs(self.patient, "appointment_availability", "async_appointment_availability",
+                                f"?date_from={self.day.isoformat()}&date_to={self.day.isoformat()}&gp=999")
+
+    async def test_requires_token(self):
+        resp = await AsyncClient().get(reverse("async_appointment_list"))
+        self.assertEqual(resp.status_code, 401)
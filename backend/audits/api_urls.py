@@ -3,4 +3,16 @@ from . import api_views
 
 urlpatterns = [
     path("", api_views.AuditLogListView.as_view(), name="audit_list"),
+    path("export/", api_views.AuditLogExportView.as_view(), name="audit_export"),
+    path("stats/", api_views.AuditStatsView.as_view(), name="audit_stats"),
+    path(
+        "patients/<int:patient_id>/",
+        api_views.AuditPatientAccessView.as_view(),
+        name="audit_patient_access",
+    ),
+    path(
+        "history/<str:object_type>/<int:object_id>/",
+        api_views.AuditObjectHistoryView.as_view(),
+        name="audit_object_history",
+    ),
 ]
@@ -1,14 +1,92 @@
-from django.utils.dateparse import parse_date
+from datetime import timedelta
+from itertools import islice
+
+from django.db.models import F, Max, Min, Sum
+from django.utils import timezone
 from rest_framework import generics
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 
 
 from accounts.models import User
-from .models import AuditLog
-from .serializers import AuditLogSerializer
+from audits.utils import log_event
+from config.conditional import ConditionalGetMixin
+from config.exports import EXPORT_FORMATS, parse_bool_flag, parse_export_format, parse_gzip_flag, streaming_export
+from config.filters import date_range_bounds, filter_date_range, parse_date_param, start_of_day
+from config.pagination import KeysetPagination
+from .archive import AuditArchive, as_instances
+from .models import AuditDailyRollup, AuditHourlyRollup, AuditLog, AuditRollupState
+from .rollups import STATE_NAME
+from .serializers import AuditHistoryItemSerializer, AuditLogSerializer
+
+
+class AuditLogPagination(KeysetPagination):
+    # Newest first; each page is a seek on the (..., timestamp, id) indexes
+    ordering = "-timestamp"
+    page_size = 50
+    max_page_size = 200
+
+
+def require_manager(u: User) -> None:
+    # Manager only (and allow superuser)
+    if not (u.is_authenticated and (u.is_superuser or u.role == User.Role.PRACTICE_MANAGER)):
+        raise PermissionDenied("Only practice managers can view audit logs.")
+
+
+def audit_filters(params) -> dict:
+    """
+    The list filters from the query string (date range, user, action,
+    object_type, object_id, patient), validated; None where not given.
+    """
+    since, until = date_range_bounds(params)
+    filters = {
+        "since": since,
+        "until": until,
+        "user_id": None,
+        "action": params.get("action") or None,
+        "object_type": params.get("object_type") or None,
+        "object_id": None,
+        "patient_id": None,
+    }
+    for field, param, message in [
+        ("user_id", "user", "Invalid user id."),
+        ("object_id", "object_id", "Invalid object id."),
+        ("patient_id", "patient", "Invalid patient id."),
+    ]:
+        raw = params.get(param)
+        if raw:
+            try:
+                filters[field] = int(raw)
+            except (TypeError, ValueError):
+                raise ValidationError({param: message})
+    return filters
 
 
+def audit_logs_for(request):
+    """
+    Audit rows matching the list filters in the query string (date range,
+    user, action, object_type, object_id, patient). Manager-only.
+    """
+    require_manager(request.user)
+    filters = audit_filters(request.query_params)
+
+    qs = AuditLog.objects.all()
+
+    # A plain range on timestamp (not timestamp__date) lets Postgres skip
+    # the monthly partitions outside it.
+    if filters["since"]:
+        qs = qs.filter(timestamp__gte=filters["since"])
+    if filters["until"]:
+        qs = qs.filter(timestamp__lt=filters["until"])
+
+    for field in ("user_id", "action", "object_type", "object_id", "patient_id"):
+        if filters[field] is not None:
+            qs = qs.filter(**{field: filters[field]})
+
+    return qs
+
 
 @extend_schema(
     parameters=[
@@ -47,52 +125,340 @@ from .serializers import AuditLogSerializer
             required=False,
             description="Filter by object type (e.g. appointment, record_entry)."
         ),
+        OpenApiParameter(
+            name="object_id",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Filter by object id (use with object_type)."
+        ),
+        OpenApiParameter(
+            name="patient",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Filter by the patient whose data the event touched."
+        ),
+        OpenApiParameter(
+            name="archive",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Continue into archived months (archive_audit_logs) once the database rows run out."
+        ),
     ],
-    description="Manager-only. Lists audit logs. Supports filtering by date range, user, action, and object_type.",
+    description="Manager-only. Lists audit logs. Supports filtering by date range, user, action, object_type and object_id.",
 )
 
 
-class AuditLogListView(generics.ListAPIView):
+class AuditLogListView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = AuditLogSerializer
+    pagination_class = AuditLogPagination
+    # Audit rows are never edited
+    last_modified_field = "timestamp"
+
+    def list_validators(self, queryset):
+        # Rows are only appended or pruned by month (oldest changes), so the
+        # range's ends plus the newest id identify it: a row inserted with an
+        # older timestamp (buffered flush, spool replay) still gets a new id.
+        # Unlike the default COUNT(*) these are index probes however large
+        # the history is.
+        agg = queryset.aggregate(first=Min("timestamp"), last=Max("timestamp"), last_id=Max("id"))
+        ends = [v.isoformat() if v else "-" for v in (agg["first"], agg["last"])]
+        archive = self.archive.fingerprint() if self.archive else ""
+        return self.compute_etag("list", *ends, agg["last_id"] or "-", archive)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.archive = AuditArchive() if parse_bool_flag(request.query_params, "archive") else None
 
     def get_queryset(self):
-        u: User = self.request.user
-
-        # Manager only (and allow superuser)
-        if not (u.is_authenticated and (u.is_superuser or u.role == User.Role.PRACTICE_MANAGER)):
-            raise PermissionDenied("Only practice managers can view audit logs.")
-
-        qs = AuditLog.objects.select_related("user").all()
-        params = self.request.query_params
-
-        # Filters
-        date_from = params.get("date_from")
-        if date_from:
-            d = parse_date(date_from)
-            if not d:
-                raise ValidationError({"date_from": "Invalid date. Use YYYY-MM-DD."})
-            qs = qs.filter(timestamp__date__gte=d)
-
-        date_to = params.get("date_to")
-        if date_to:
-            d = parse_date(date_to)
-            if not d:
-                raise ValidationError({"date_to": "Invalid date. Use YYYY-MM-DD."})
-            qs = qs.filter(timestamp__date__lte=d)
-
-        user_id = params.get("user")
-        if user_id:
+        qs = audit_logs_for(self.request).select_related("user")
+        if self.archive and self.archive.boundary:
+            # Older rows are served from the archive (even if their month's
+            # partition hasn't been dropped yet)
+            qs = qs.filter(timestamp__gte=self.archive.boundary)
+        return qs
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        paginator = self.paginator
+        if not self.archive or paginator.has_next:
+            return page
+
+        # The database rows ran out: fill the page from the archive, reading
+        # only the segments that can hold matching rows
+        if page:
+            before = (page[-1].timestamp, page[-1].id)
+        else:
+            raw = self.request.query_params.get(paginator.cursor_query_param)
+            before = paginator.decode_cursor(AuditLog, raw) if raw else None
+        wanted = paginator.size + 1 - len(page)
+        rows = list(islice(self.archive.rows(audit_filters(self.request.query_params), before), wanted))
+        return paginator.take_page(page + as_instances(rows))
+
+
+class AuditLogExportView(APIView):
+    """
+    GET /api/audits/export/?output=csv|ndjson&gzip=1&<list filters>
+
+    Manager-only. Streams every matching audit row oldest first for
+    subject-access and compliance requests, optionally gzipped on the fly.
+    """
+
+    FIELDS = [
+        "id", "timestamp", "user_id", "user__username", "role", "action",
+        "object_type", "object_id", "patient_id", "metadata", "ip_address",
+        # Lets the recipient check the rows against the hash chain
+        "chain", "seq", "row_hash",
+    ]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="output",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                enum=list(EXPORT_FORMATS),
+                description="csv (default) or ndjson."
+            ),
+            OpenApiParameter(
+                name="gzip",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Compress the download (.csv.gz / .ndjson.gz)."
+            ),
+        ],
+        responses={200: OpenApiTypes.BINARY},
+        description="Manager-only. Streams audit logs matching the list filters (date range, user, action, object_type, object_id).",
+    )
+    def get(self, request):
+        qs = audit_logs_for(request).order_by("timestamp", "id")
+        fmt = parse_export_format(request.query_params)
+
+        log_event(
+            request,
+            action="AUDIT_EXPORT",
+            object_type="audit_log",
+            metadata={"output": fmt, "filters": request.query_params.dict()},
+        )
+        return streaming_export(
+            request, qs, self.FIELDS, fmt, filename="audit_logs", compress=parse_gzip_flag(request.query_params),
+        )
+
+
+# Exactly the key and INCLUDE columns of audit_object_ts_idx: the query never
+# touches the table heap (an index-only scan once the partitions are vacuumed).
+HISTORY_FIELDS = ["id", "timestamp", "action", "role", "user_id"]
+
+
+@extend_schema(
+    responses=AuditHistoryItemSerializer(many=True),
+    description=(
+        "Manager-only. Every audit event for one object (e.g. appointment 12), newest first. "
+        "Add `?limit=N` to return only the latest N."
+    ),
+)
+class AuditObjectHistoryView(APIView):
+    max_limit = 1000
+
+    def get(self, request, object_type, object_id):
+        require_manager(request.user)
+
+        qs = (
+            AuditLog.objects.filter(object_type=object_type, object_id=object_id)
+            .order_by("-timestamp", "-id")
+            .values(*HISTORY_FIELDS)
+        )
+        limit = request.query_params.get("limit")
+        if limit:
             try:
-                qs = qs.filter(user_id=int(user_id))
-            except (TypeError, ValueError):
-                raise ValidationError({"user": "Invalid user id."})
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                raise ValidationError({"limit": "Must be a positive integer."})
+            qs = qs[: min(limit, self.max_limit)]
+        return Response(list(qs))
 
-        action = params.get("action")
-        if action:
-            qs = qs.filter(action=action)
 
-        object_type = params.get("object_type")
-        if object_type:
-            qs = qs.filter(object_type=object_type)
+# period -> (rollup model, bucket field, dimensions it can group/filter by,
+# default and maximum span in days)
+STATS_PERIODS = {
+    "day": (AuditDailyRollup, "day", ["action", "role", "object_type", "user"], 30, 366),
+    "hour": (AuditHourlyRollup, "bucket", ["action", "role", "object_type"], 1, 31),
+}
 
-        return qs
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="period",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            enum=list(STATS_PERIODS),
+            description="Bucket size: day (default, up to 366 days) or hour (up to 31 days)."
+        ),
+        OpenApiParameter(
+            name="date_from",
+            type=OpenApiTypes.DATE,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="First day (default: 30 days ago for day, today for hour)."
+        ),
+        OpenApiParameter(
+            name="date_to",
+            type=OpenApiTypes.DATE,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Last day, inclusive (default today)."
+        ),
+        OpenApiParameter(
+            name="group_by",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Comma-separated: action, role, object_type, user (day only). Default action."
+        ),
+        OpenApiParameter(
+            name="action",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Only count this action."
+        ),
+        OpenApiParameter(
+            name="role",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Only count events by this role."
+        ),
+        OpenApiParameter(
+            name="object_type",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Only count events on this object type."
+        ),
+        OpenApiParameter(
+            name="user",
+            type=OpenApiTypes.INT,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Only count events by this user (day only)."
+        ),
+    ],
+    responses=OpenApiTypes.OBJECT,
+    description=(
+        "Manager-only. Audit event counts per day or hour from the rollup tables "
+        "(kept current by rollup_audit_logs), so the cost doesn't grow with the audit log."
+    ),
+)
+class AuditStatsView(APIView):
+    def get(self, request):
+        require_manager(request.user)
+        params = request.query_params
+
+        period = params.get("period") or "day"
+        if period not in STATS_PERIODS:
+            raise ValidationError({"period": f"Must be one of: {', '.join(STATS_PERIODS)}."})
+        model, bucket_field, dimensions, default_days, max_days = STATS_PERIODS[period]
+
+        date_to = parse_date_param(params, "date_to") or timezone.localdate()
+        date_from = parse_date_param(params, "date_from") or date_to - timedelta(days=default_days - 1)
+        if date_from > date_to:
+            raise ValidationError({"date_from": "Must not be after date_to."})
+        if (date_to - date_from).days >= max_days:
+            raise ValidationError({"date_to": f"At most {max_days} days per request for period={period}."})
+
+        group_by = [g.strip() for g in (params.get("group_by") or "action").split(",") if g.strip()]
+        unknown = [g for g in group_by if g not in dimensions]
+        if unknown:
+            raise ValidationError({"group_by": f"Choose from: {', '.join(dimensions)}."})
+
+        if period == "day":
+            qs = model.objects.filter(day__gte=date_from, day__lte=date_to)
+        else:
+            qs = model.objects.filter(
+                bucket__gte=start_of_day(date_from), bucket__lt=start_of_day(date_to + timedelta(days=1)),
+            )
+
+        for dim in dimensions:
+            value = params.get(dim)
+            if not value:
+                continue
+            if dim == "user":
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValidationError({"user": "Invalid user id."})
+            qs = qs.filter(**{dim: value})
+
+        fields = ["user_id" if g == "user" else g for g in group_by]
+        rows = (
+            qs.values(*fields, bucket_key=F(bucket_field))
+            .annotate(count=Sum("count"))
+            .order_by("bucket_key", *fields)
+        )
+        state = AuditRollupState.objects.filter(name=STATE_NAME).first()
+
+        return Response({
+            "period": period,
+            "date_from": date_from,
+            "date_to": date_to,
+            "group_by": group_by,
+            # Rows after the rollup mark aren't counted yet
+            "as_of": state.updated_at if state else None,
+            "results": [
+                {"bucket": row.pop("bucket_key"), **row} for row in rows
+            ],
+        })
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="date_from",
+            type=OpenApiTypes.DATE,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Include events from this date (YYYY-MM-DD)."
+        ),
+        OpenApiParameter(
+            name="date_to",
+            type=OpenApiTypes.DATE,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Include events up to this date (YYYY-MM-DD)."
+        ),
+        OpenApiParameter(
+            name="action",
+            type=OpenApiTypes.STR,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Only this action."
+        ),
+    ],
+    description=(
+        "Manager-only. Who touched this patient's data (clinical entries, appointments), "
+        "newest first, paginated like the audit list."
+    ),
+)
+class AuditPatientAccessView(generics.ListAPIView):
+    serializer_class = AuditLogSerializer
+    pagination_class = AuditLogPagination
+
+    def get_queryset(self):
+        require_manager(self.request.user)
+        # Each page is one range scan of audit_patient_ts_idx, however long
+        # the log; the date range also prunes partitions
+        qs = AuditLog.objects.filter(patient_id=self.kwargs["patient_id"])
+        qs = filter_date_range(qs, "timestamp", self.request.query_params)
+        action = self.request.query_params.get("action")
+        if action:
+            qs = qs.filter(action=action)
+        return qs.select_related("user")
@@ -4,3 +4,23 @@ from django.apps import AppConfig
 class AuditsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'audits'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from django.db.models.signals import post_migrate
+
+        from .buffer import flush_on_request_finished
+
+        request_finished.connect(flush_on_request_finished, dispatch_uid="audits.flush_buffer")
+        post_migrate.connect(create_upcoming_partitions, sender=self, dispatch_uid="audits.partitions")
+
+
+def create_upcoming_partitions(sender, using="default", **kwargs):
+    # Every deploy runs migrate, so the next months' partitions always exist
+    # even if the ensure_audit_partitions cron job is missed
+    from django.conf import settings
+
+    from .partitions import ensure_partitions
+
+    if using == "default":
+        ensure_partitions(settings.AUDIT_PARTITION_MONTHS_AHEAD)
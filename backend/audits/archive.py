@@ -0,0 +1,350 @@
+"""
+Cold archive tier for old audit months.
+
+archive_month() writes every audit row of one UTC month (the partition unit,
+see audits.partitions) to gzip NDJSON segment files of at most
+AUDIT_ARCHIVE_SEGMENT_ROWS rows in AUDIT_ARCHIVE_DIR, then drops the month
+from the database by detaching its partition. Segment files are written
+once and never changed; rows that turn up for an archived month later (e.g.
+a replayed spool) go into additional segments.
+
+Each month has a sidecar index, auditlog-YYYYMM.idx.json, written after its
+segments: a month counts as archived once its index exists. The index lists
+each segment's time and id range and the users, actions and object types in
+it, so readers only open segments that can match.
+
+Months are archived oldest first without gaps, so the archive holds
+everything before the end of its newest month and the database everything
+after. Readers split on that boundary, which also hides the rows of a month
+whose partition wasn't dropped yet (archive_month picks them up again).
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import date, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import User
+from . import chain, partitions
+from .models import AuditLog
+
+ARCHIVE_FIELDS = [
+    "id", "timestamp", "user_id", "role", "action", "object_type", "object_id",
+    "patient_id", "metadata", "ip_address", "chain", "seq", "row_hash",
+    "hash_version",
+]
+
+
+def index_path(directory: Path, month) -> Path:
+    return directory / f"auditlog-{month:%Y%m}.idx.json"
+
+
+def segment_path(directory: Path, month, number: int) -> Path:
+    return directory / f"auditlog-{month:%Y%m}-{number:04d}.ndjson.gz"
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SegmentWriter:
+    """
+    One segment file being written (under a .tmp name until closed) and the
+    index entry describing it.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp = path.with_name(path.name + ".tmp")
+        self.fh = open(self.tmp, "wb")
+        self.gz = gzip.GzipFile(fileobj=self.fh, mode="wb")
+        self.rows = 0
+        self.first = self.last = None
+        self.ids, self.users, self.actions, self.object_types = [], set(), set(), set()
+
+    def add(self, row: dict) -> None:
+        # isoformat keeps microseconds (DjangoJSONEncoder would cut them),
+        # so cursors and row hashes still match after a round trip
+        ts = row["timestamp"].astimezone(dt_timezone.utc).isoformat()
+        self.gz.write((json.dumps({**row, "timestamp": ts}, separators=(",", ":")) + "\n").encode())
+        self.rows += 1
+        self.first = self.first or ts
+        self.last = ts
+        self.ids.append(row["id"])
+        self.users.add(row["user_id"])
+        self.actions.add(row["action"])
+        self.object_types.add(row["object_type"])
+
+    def close(self) -> dict:
+        self.gz.close()
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.fh.close()
+        os.replace(self.tmp, self.path)
+        users = sorted(u for u in self.users if u is not None)
+        return {
+            "file": self.path.name,
+            "rows": self.rows,
+            "first_timestamp": self.first,
+            "last_timestamp": self.last,
+            "min_id": min(self.ids),
+            "max_id": max(self.ids),
+            # null stands for rows without a user
+            "users": users + ([None] if None in self.users else []),
+            "actions": sorted(self.actions),
+            "object_types": sorted(self.object_types),
+            "sha256": file_sha256(self.path),
+        }
+
+
+def read_index(directory: Path, month):
+    path = index_path(directory, month)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_segments(directory: Path, month, queryset, first_number: int, segment_rows: int) -> list:
+    """
+    Write `queryset`'s rows oldest first into new segments numbered from
+    `first_number`. Returns their index entries.
+    """
+    rows = (
+        queryset.order_by("timestamp", "id")
+        .values(*ARCHIVE_FIELDS, username=F("user__username"))
+        .iterator(chunk_size=2000)
+    )
+    segments, writer = [], None
+    for row in rows:
+        if writer is None:
+            writer = SegmentWriter(segment_path(directory, month, first_number + len(segments)))
+        writer.add(row)
+        if writer.rows >= segment_rows:
+            segments.append(writer.close())
+            writer = None
+    if writer is not None:
+        segments.append(writer.close())
+    return segments
+
+
+def drop_month(month) -> None:
+    """
+    Remove an archived month from the database: record its chain ranges as
+    removed, detach and drop its partition, then delete any of its rows left
+    in the default partition.
+    """
+    start, end = partitions.month_bounds(month)
+    chain.record_removed(start, end)
+    with connection.cursor() as cursor:
+        name = partitions.existing_partitions(cursor).get(month) if partitions.is_partitioned(cursor) else None
+    if name:
+        partitions.detach_partition(name)
+    AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).delete()
+
+
+def archive_month(month, directory=None, segment_rows=None) -> dict:
+    """
+    Archive one month's rows (those not archived yet) and drop the month from
+    the database. Returns the month's index.
+    """
+    directory = Path(directory or settings.AUDIT_ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    segment_rows = segment_rows or settings.AUDIT_ARCHIVE_SEGMENT_ROWS
+
+    start, end = partitions.month_bounds(month)
+    index = read_index(directory, month)
+    is_new = index is None
+    if is_new:
+        index = {"month": f"{month:%Y-%m}", "rows": 0, "max_id": 0, "segments": []}
+
+    # Rows up to max_id were archived before (left behind by an interrupted run)
+    pending = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end, id__gt=index["max_id"])
+    segments = write_segments(directory, month, pending, len(index["segments"]), segment_rows)
+    if segments or is_new:
+        index["segments"] += segments
+        index["rows"] += sum(s["rows"] for s in segments)
+        index["max_id"] = max([index["max_id"]] + [s["max_id"] for s in segments])
+        write_atomic(index_path(directory, month), json.dumps(index, indent=1).encode())
+
+    drop_month(month)
+    return index
+
+
+def months_to_archive(before, directory=None) -> list:
+    """
+    Months before `before` (a month start) to archive, oldest first: from the
+    oldest audit row, or the month after the archive's newest, whichever is
+    earlier, so archived months stay contiguous.
+    """
+    archive = AuditArchive(directory)
+    oldest = AuditLog.objects.aggregate(oldest=Min("timestamp"))["oldest"]
+    starts = []
+    if oldest is not None:
+        starts.append(partitions.month_start(oldest.astimezone(dt_timezone.utc)))
+    if archive.months:
+        starts.append(partitions.add_months(max(archive.months), 1))
+    if not starts:
+        return []
+
+    month, months = min(starts), []
+    while month < before:
+        months.append(month)
+        month = partitions.add_months(month, 1)
+    return months
+
+
+def expired_archive_months(keep_months: int, now=None, directory=None) -> list:
+    """
+    Archived months older than the retention window (the same rule as
+    partitions.expired_partitions), oldest first.
+    """
+    cutoff = partitions.add_months(partitions.month_start(now or timezone.now()), -keep_months)
+    return sorted(month for month in AuditArchive(directory).months if month < cutoff)
+
+
+def delete_archived_month(month, directory=None) -> None:
+    directory = Path(directory or settings.AUDIT_ARCHIVE_DIR)
+    index = read_index(directory, month)
+    if index is None:
+        return
+    # Index first: without it the month no longer counts as archived
+    index_path(directory, month).unlink()
+    for segment in index["segments"]:
+        (directory / segment["file"]).unlink(missing_ok=True)
+
+
+class AuditArchive:
+    """
+    Read side of the archive: the month indexes, loaded once per instance.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or settings.AUDIT_ARCHIVE_DIR)
+        self.months = {}
+        if self.directory.is_dir():
+            for path in sorted(self.directory.glob("auditlog-*.idx.json")):
+                index = json.loads(path.read_text(encoding="utf-8"))
+                year, month = index["month"].split("-")
+                self.months[date(int(year), int(month), 1)] = index
+
+    @property
+    def boundary(self):
+        """
+        Rows older than this are in the archive (None when it's empty).
+        """
+        if not self.months:
+            return None
+        return partitions.month_bounds(max(self.months))[1]
+
+    def fingerprint(self) -> str:
+        return ",".join(f"{index['month']}:{index['rows']}" for index in self.months.values())
+
+    def rows(self, filters: dict, before=None):
+        """
+        Archived rows (dicts) matching `filters` newest first, reading only
+        segments whose index entries can match. `before` is a (timestamp, id)
+        cursor: only rows strictly older are returned.
+
+        filters holds the audit list filters: since/until datetimes and
+        user_id, action, object_type, object_id (None when not filtered).
+        """
+        for month in sorted(self.months, reverse=True):
+            segments = [s for s in self.months[month]["segments"] if self.segment_matches(s, filters, before)]
+            for group in overlapping_groups(segments):
+                rows = []
+                for segment in group:
+                    rows.extend(self.read_segment(segment, filters, before))
+                rows.sort(key=lambda r: (r["timestamp"], r["id"]), reverse=True)
+                yield from rows
+
+    def segment_matches(self, segment: dict, filters: dict, before) -> bool:
+        first = parse_datetime(segment["first_timestamp"])
+        last = parse_datetime(segment["last_timestamp"])
+        if filters["since"] and last < filters["since"]:
+            return False
+        if filters["until"] and first >= filters["until"]:
+            return False
+        if before and first > before[0]:
+            return False
+        if filters["user_id"] is not None and filters["user_id"] not in segment["users"]:
+            return False
+        if filters["action"] and filters["action"] not in segment["actions"]:
+            return False
+        if filters["object_type"] and filters["object_type"] not in segment["object_types"]:
+            return False
+        return True
+
+    def read_segment(self, segment: dict, filters: dict, before):
+        with gzip.open(self.directory / segment["file"], "rt", encoding="utf-8") as fh:
+            for line in fh:
+                row = json.loads(line)
+                row["timestamp"] = parse_datetime(row["timestamp"])
+                if row_matches(row, filters, before):
+                    yield row
+
+
+def row_matches(row: dict, filters: dict, before) -> bool:
+    ts = row["timestamp"]
+    if filters["since"] and ts < filters["since"]:
+        return False
+    if filters["until"] and ts >= filters["until"]:
+        return False
+    if before and (ts, row["id"]) >= before:
+        return False
+    for field in ("user_id", "action", "object_type", "object_id", "patient_id"):
+        if filters[field] not in (None, "") and row.get(field) != filters[field]:
+            return False
+    return True
+
+
+def overlapping_groups(segments: list):
+    """
+    Segments grouped where their time ranges overlap, newest group first.
+    Segments written in one run never overlap, so groups are usually single
+    segments and only one segment is held in memory at a time.
+    """
+    groups, group_end = [], None
+    for segment in sorted(segments, key=lambda s: s["first_timestamp"]):
+        if groups and segment["first_timestamp"] <= group_end:
+            groups[-1].append(segment)
+            group_end = max(group_end, segment["last_timestamp"])
+        else:
+            groups.append([segment])
+            group_end = segment["last_timestamp"]
+    return reversed(groups)
+
+
+def as_instances(rows) -> list:
+    """
+    Unsaved AuditLog objects for archived rows, with their users loaded in
+    one query (rows of deleted users keep user_id but have no user).
+    """
+    users = User.objects.in_bulk({row["user_id"] for row in rows if row["user_id"]})
+    user_field = AuditLog._meta.get_field("user")
+    objs = []
+    for row in rows:
+        # .get: segments written before a field existed lack it
+        obj = AuditLog(**{field: row.get(field) for field in ARCHIVE_FIELDS})
+        user_field.set_cached_value(obj, users.get(row["user_id"]))
+        objs.append(obj)
+    return objs
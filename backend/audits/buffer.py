@@ -0,0 +1,146 @@
+import atexit
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+SPOOL_FIELDS = ["role", "action", "object_type", "object_id", "patient_id", "metadata", "ip_address"]
+
+
+def row_to_dict(row) -> dict:
+    data = {field: getattr(row, field) for field in SPOOL_FIELDS}
+    data["timestamp"] = row.timestamp
+    data["user_id"] = row.user_id
+    return data
+
+
+def row_from_dict(data):
+    from .models import AuditLog  # local import avoids circular imports
+
+    data = dict(data)
+    data["timestamp"] = parse_datetime(data["timestamp"])
+    return AuditLog(**data)
+
+
+class AuditBuffer:
+    """
+    In-process queue of unsaved AuditLog rows, written with one bulk INSERT.
+
+    Flushes when it holds `max_size` rows, every `flush_interval` seconds from
+    a background thread (0 disables the thread), at the end of each request
+    and at interpreter exit. If the INSERT fails the rows are appended to the
+    spool file instead; `replay_audit_spool` loads them later.
+    """
+
+    def __init__(self, max_size=500, flush_interval=2.0, spool_path=""):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._timer = None
+        self._stopped = threading.Event()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
+
+    def add(self, rows) -> None:
+        with self._lock:
+            self._rows.extend(rows)
+            full = len(self._rows) >= self.max_size
+        self._start_timer()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        from .models import AuditLog  # local import avoids circular imports
+
+        # One flush at a time keeps rows from overlapping batches in order
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.bulk_create(rows, batch_size=self.max_size)
+            except Exception:
+                logger.exception("Audit flush failed, spooling %d rows to %s", len(rows), self.spool_path)
+                self.spool(rows)
+            return len(rows)
+
+    def spool(self, rows) -> None:
+        if not self.spool_path:
+            logger.error("No AUDIT_SPOOL_PATH set, dropping %d audit rows", len(rows))
+            return
+        lines = "".join(json.dumps(row_to_dict(row), cls=DjangoJSONEncoder) + "\n" for row in rows)
+        with self._spool_lock, open(self.spool_path, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.flush()
+
+    def _start_timer(self) -> None:
+        if self.flush_interval <= 0 or self._timer is not None:
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Thread(target=self._run_timer, name="audit-flush", daemon=True)
+        self._timer.start()
+
+    def _run_timer(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            # This thread keeps its own connection; drop it if it went bad
+            close_old_connections()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> AuditBuffer:
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = AuditBuffer(
+                max_size=settings.AUDIT_BUFFER_SIZE,
+                flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+                spool_path=settings.AUDIT_SPOOL_PATH,
+            )
+            atexit.register(_buffer.stop)
+        return _buffer
+
+
+def is_buffered() -> bool:
+    return getattr(settings, "AUDIT_LOG_MODE", "sync") == "buffered"
+
+
+def enqueue(rows) -> None:
+    """
+    Queue rows once the current transaction commits (immediately in
+    autocommit), so a rolled-back write leaves no audit entry.
+    """
+    rows = list(rows)
+    if rows:
+        transaction.on_commit(lambda: get_buffer().add(rows))
+
+
+def flush_on_request_finished(sender, **kwargs) -> None:
+    # Runs after the response has gone out, so the INSERT is off the request's latency
+    if _buffer is not None:
+        _buffer.flush()
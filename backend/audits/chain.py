@@ -0,0 +1,335 @@
+"""
+Tamper-evident hash chains over the audit log.
+
+Every AuditLog row is appended to one of AUDIT_CHAIN_SHARDS chains: it gets
+the chain number, the next sequence number in that chain and
+
+    row_hash = sha256(previous row's row_hash + the row's content)
+
+so editing, deleting or reordering a row breaks the link to the next one.
+Writers claim a chain head with SELECT ... FOR UPDATE SKIP LOCKED, so
+concurrent writers spread over the chains instead of queueing on one row
+lock. The head stays locked until the writing transaction commits (in sync
+mode that is the request's transaction).
+
+Someone with write access to the database could still rewrite a row and
+recompute every hash after it. verify_audit_chain therefore records
+checkpoints, (chain, seq, row_hash) signed with AUDIT_CHECKPOINT_KEY, which
+is not stored in the database; a recomputed chain no longer matches them.
+A normal run only checks the rows after each chain's last checkpoint; a full
+run splits every chain into seq ranges and checks them in a process pool.
+
+Archiving and pruning remove audit rows by month, but chains are in insert
+order, so a removed month can leave holes in the middle of a chain (a row
+replayed from the spool, say). Before removing rows, record_removed() stores
+their seq ranges as signed AuditChainGap rows, each with the hash of its
+last row; verification steps over them and continues from that hash.
+
+Rows written since the patient column exists have hash_version 2, which
+also covers patient_id. Older rows (version 1) had their patient_id
+backfilled after they were hashed; verification only checks it against
+their hashed metadata.
+
+AuditLog.user has no FK constraint and nothing happens to audit rows when a
+user is deleted, so the hashed user_id never changes.
+"""
+import hashlib
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import GENESIS_HASH, AuditChainCheckpoint, AuditChainGap, AuditChainHead, AuditLog
+
+# Row content covered by row_hash, besides its chain and seq
+HASHED_FIELDS = ["timestamp", "user_id", "role", "action", "object_type", "object_id", "metadata", "ip_address"]
+
+# Version of new rows' hashes; version 2 adds patient_id
+HASH_VERSION = 2
+HASHED_FIELDS_V2 = HASHED_FIELDS + ["patient_id"]
+
+# Rows per verification task
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def row_digest(prev_hash: str, chain: int, seq: int, values, version: int = 1) -> str:
+    """
+    row_hash for a row with these HASHED_FIELDS (HASHED_FIELDS_V2 for version
+    2) values (a dict) following `prev_hash` in its chain. Stable across a
+    database round trip: jsonb reorders keys and timestamps come back in UTC.
+    """
+    fields = HASHED_FIELDS_V2 if version >= 2 else HASHED_FIELDS
+    content = [chain, seq, values["timestamp"].astimezone(dt_timezone.utc).isoformat()]
+    content += [values[field] for field in fields[1:]]
+    payload = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256((prev_hash + payload).encode()).hexdigest()
+
+
+def ensure_heads() -> None:
+    AuditChainHead.objects.bulk_create(
+        [AuditChainHead(chain=n) for n in range(settings.AUDIT_CHAIN_SHARDS)],
+        ignore_conflicts=True,
+    )
+
+
+def claim_head() -> AuditChainHead:
+    """
+    Lock the chain head this transaction already holds, else the shortest
+    chain no other transaction holds (so runs are reproducible), or wait for
+    a random one when every chain is busy. Must run inside a transaction.
+
+    Holding at most one head per transaction is what keeps two writers from
+    deadlocking on each other's heads in the fallback wait.
+    """
+    connection = transaction.get_connection()
+    heads = AuditChainHead.objects.filter(chain__lt=settings.AUDIT_CHAIN_SHARDS)
+
+    # The marker is an on_commit callback: Django drops it when the
+    # transaction (or the savepoint that took the lock) ends, i.e. exactly
+    # when the row lock is released
+    held = getattr(connection, "audit_chain_claim", None)
+    if held and held[0] < settings.AUDIT_CHAIN_SHARDS and any(cb[1] is held[1] for cb in connection.run_on_commit):
+        return heads.select_for_update().get(chain=held[0])
+
+    free = heads.select_for_update(skip_locked=True).order_by("seq", "chain")
+    head = free.first()
+    if head is None:
+        ensure_heads()
+        head = free.first() or heads.select_for_update().get(chain=random.randrange(settings.AUDIT_CHAIN_SHARDS))
+
+    def marker():
+        pass
+
+    transaction.on_commit(marker)
+    connection.audit_chain_claim = (head.chain, marker)
+    return head
+
+
+def append(rows, insert):
+    """
+    Chain unsaved AuditLog rows onto one chain and insert them with
+    insert(rows), in the same transaction as the head update (so a rollback
+    leaves no gap). Returns what insert returns.
+    """
+    rows = list(rows)
+    if not rows:
+        return insert(rows)
+    # No savepoint of its own: a failed insert has to abort the caller anyway
+    with transaction.atomic(savepoint=False):
+        head = claim_head()
+        for row in rows:
+            head.seq += 1
+            row.chain, row.seq, row.hash_version = head.chain, head.seq, HASH_VERSION
+            values = {f: getattr(row, f) for f in HASHED_FIELDS_V2}
+            row.row_hash = row_digest(head.last_hash, head.chain, head.seq, values, HASH_VERSION)
+            head.last_hash = row.row_hash
+        result = insert(rows)
+        head.save(update_fields=["seq", "last_hash"])
+    return result
+
+
+# Seq ranges of the rows about to be removed, one per run of consecutive seqs
+# per chain, with the hash of each run's last row
+REMOVED_RANGES_SQL = """
+SELECT "chain", min("seq"), max("seq"), (array_agg("row_hash" ORDER BY "seq" DESC))[1]
+FROM (
+    SELECT "chain", "seq", "row_hash", "seq" - row_number() OVER (PARTITION BY "chain" ORDER BY "seq") AS run
+    FROM "audits_auditlog"
+    WHERE "timestamp" >= %s AND "timestamp" < %s AND "chain" IS NOT NULL
+) AS rows
+GROUP BY "chain", run
+"""
+
+
+def record_removed(start, end) -> list:
+    """
+    Record the chain ranges of the rows with timestamps in [start, end) as
+    signed gaps. Call before archiving or pruning removes them; recording the
+    same rows twice (a retried run) is a no-op.
+    """
+    with connections["default"].cursor() as cursor:
+        cursor.execute(REMOVED_RANGES_SQL, [start, end])
+        ranges = cursor.fetchall()
+    gaps = []
+    for chain, first_seq, last_seq, row_hash in ranges:
+        gap = AuditChainGap(chain=chain, first_seq=first_seq, last_seq=last_seq, row_hash=row_hash)
+        gap.signature = gap.sign()
+        gaps.append(gap)
+    AuditChainGap.objects.bulk_create(gaps, ignore_conflicts=True)
+    return gaps
+
+
+def verify_range(chain: int, first_seq: int, last_seq: int, prev_hash: str | None = None):
+    """
+    Check the links of rows first_seq..last_seq of one chain. `prev_hash` is
+    the hash they follow; by default the stored hash of the row before, or
+    the hash recorded for it when it was removed. Missing rows are only
+    accepted where signed gaps cover exactly their seqs; the range before
+    reports a predecessor that is simply gone.
+
+    Returns (rows checked, hash of the last row, problems).
+    """
+    gaps = {
+        gap.first_seq: gap
+        for gap in AuditChainGap.objects.filter(chain=chain, first_seq__lte=last_seq, last_seq__gte=first_seq - 1)
+        if gap.signature_valid()
+    }
+
+    def across_gaps(expected, prev_hash, before):
+        # Past removed ranges starting at `expected` that end before seq `before`
+        while expected in gaps and gaps[expected].last_seq < before:
+            expected, prev_hash = gaps[expected].last_seq + 1, gaps[expected].row_hash
+        return expected, prev_hash
+
+    expected = first_seq
+    if prev_hash is None:
+        if first_seq == 1:
+            prev_hash = GENESIS_HASH
+        else:
+            prev_hash = (
+                AuditLog.objects.filter(chain=chain, seq=first_seq - 1)
+                .values_list("row_hash", flat=True)
+                .first()
+            )
+            if prev_hash is None:
+                # A chunk boundary inside a removed range
+                gap = next((g for g in gaps.values() if g.first_seq < first_seq <= g.last_seq + 1), None)
+                if gap is not None:
+                    expected, prev_hash = gap.last_seq + 1, gap.row_hash
+
+    rows = (
+        AuditLog.objects.filter(chain=chain, seq__gte=first_seq, seq__lte=last_seq)
+        .order_by("seq", "id")
+        .values("id", "seq", "row_hash", "hash_version", *HASHED_FIELDS_V2)
+    )
+    checked, problems = 0, []
+    for row in rows.iterator(chunk_size=2000):
+        seq = row["seq"]
+        expected, prev_hash = across_gaps(expected, prev_hash, seq)
+        if seq < expected:
+            problems.append(f"chain {chain}: row {row['id']} repeats seq {seq}")
+        elif seq > expected:
+            problems.append(f"chain {chain}: seq {expected}..{seq - 1} missing")
+        if prev_hash is not None and row_digest(prev_hash, chain, seq, row, row["hash_version"]) != row["row_hash"]:
+            problems.append(f"chain {chain}: row {row['id']} (seq {seq}) doesn't match its hash")
+        # Version 1 rows don't hash patient_id; it must at least agree with
+        # the hashed metadata (rows backfilled from appointments carry no
+        # patient in metadata, so theirs is unchecked)
+        meta = row["metadata"] if isinstance(row["metadata"], dict) else {}
+        if meta.get("patient_id", row["patient_id"]) != row["patient_id"]:
+            problems.append(f"chain {chain}: row {row['id']} has a patient_id that differs from its metadata")
+        prev_hash, expected, checked = row["row_hash"], max(expected, seq + 1), checked + 1
+    # A gap may run past the end of this range; the next range starts after it
+    expected, prev_hash = across_gaps(expected, prev_hash, float("inf"))
+    if expected <= last_seq:
+        problems.append(f"chain {chain}: seq {expected}..{last_seq} missing")
+    return checked, prev_hash, problems
+
+
+def _init_worker():
+    # Spawned workers start without Django; forked ones already have it
+    import django
+
+    django.setup()
+
+
+def _verify_task(args):
+    return verify_range(*args)
+
+
+def run_tasks(tasks, workers: int):
+    if workers <= 1 or len(tasks) <= 1:
+        return [verify_range(*task) for task in tasks]
+    # Forked workers must not share the parent's connection
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return list(pool.map(_verify_task, tasks))
+
+
+def verify_chains(full: bool = False, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Verify every chain up to its current head: from its latest checkpoint,
+    or with full=True from seq 1, also re-checking every checkpoint. Rows
+    that are gone count as missing unless a signed AuditChainGap covers
+    them. Each chain is split into chunk_size ranges run on `workers`
+    processes.
+
+    Returns (rows checked, problems, heads verified).
+    """
+    problems, tasks, ends = [], [], []
+    heads = list(AuditChainHead.objects.order_by("chain"))
+    for gap in AuditChainGap.objects.order_by("chain", "first_seq"):
+        if not gap.signature_valid():
+            problems.append(f"chain {gap.chain}: removed range {gap.first_seq}..{gap.last_seq} has a bad signature")
+    checkpoints = {}
+    for cp in AuditChainCheckpoint.objects.order_by("chain", "seq"):
+        if not cp.signature_valid():
+            problems.append(f"chain {cp.chain}: checkpoint at seq {cp.seq} has a bad signature")
+            continue
+        checkpoints.setdefault(cp.chain, []).append(cp)
+
+    for head in heads:
+        latest = checkpoints.get(head.chain, [None])[-1]
+        if latest and latest.seq > head.seq:
+            problems.append(f"chain {head.chain}: head is behind the checkpoint at seq {latest.seq}")
+            continue
+        if full or latest is None:
+            first_seq, prev_hash = 1, GENESIS_HASH
+        else:
+            first_seq, prev_hash = latest.seq + 1, latest.row_hash
+
+        start = first_seq
+        while start <= head.seq:
+            end = min(start + chunk_size - 1, head.seq)
+            # Later chunks read the stored hash before them: each link is
+            # checked once, and checkpoints pin the stored hashes below
+            tasks.append((head.chain, start, end, prev_hash if start == first_seq else None))
+            start = end + 1
+        ends.append((head, len(tasks) - 1 if head.seq >= first_seq else None, prev_hash))
+
+    results = run_tasks(tasks, workers)
+    checked = sum(n for n, _, _ in results)
+    for _, _, found in results:
+        problems.extend(found)
+
+    for head, last_task, prev_hash in ends:
+        last_hash = results[last_task][1] if last_task is not None else prev_hash
+        if last_task is not None and last_hash != head.last_hash:
+            problems.append(f"chain {head.chain}: last row doesn't match the chain head")
+
+    if full:
+        for chain, cps in checkpoints.items():
+            stored = dict(
+                AuditLog.objects.filter(chain=chain, seq__in=[cp.seq for cp in cps]).values_list("seq", "row_hash")
+            )
+            gaps = [gap for gap in AuditChainGap.objects.filter(chain=chain) if gap.signature_valid()]
+            for cp in cps:
+                if cp.seq not in stored:
+                    # Only a signed removal may account for a checkpointed row
+                    gap = next((g for g in gaps if g.first_seq <= cp.seq <= g.last_seq), None)
+                    if gap is None:
+                        problems.append(f"chain {chain}: row at seq {cp.seq} of a checkpoint is missing")
+                    elif gap.last_seq == cp.seq and gap.row_hash != cp.row_hash:
+                        problems.append(f"chain {chain}: removed row at seq {cp.seq} differs from its checkpoint")
+                elif stored[cp.seq] != cp.row_hash:
+                    problems.append(f"chain {chain}: row at seq {cp.seq} differs from its checkpoint")
+
+    return checked, problems, heads
+
+
+def record_checkpoints(heads) -> list:
+    """
+    Sign a checkpoint at each verified head that has moved since its last one.
+    """
+    created = []
+    for head in heads:
+        if head.seq == 0 or AuditChainCheckpoint.objects.filter(chain=head.chain, seq__gte=head.seq).exists():
+            continue
+        cp = AuditChainCheckpoint(chain=head.chain, seq=head.seq, row_hash=head.last_hash)
+        cp.signature = cp.sign()
+        cp.save()
+        created.append(cp)
+    return created
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from audits.archive import archive_month, months_to_archive
+from audits.partitions import add_months, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Move audit log months older than AUDIT_ARCHIVE_AFTER_MONTHS into compressed "
+        "segment files under AUDIT_ARCHIVE_DIR and drop them from the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--after-months", type=int, default=settings.AUDIT_ARCHIVE_AFTER_MONTHS)
+        parser.add_argument("--dir", default=settings.AUDIT_ARCHIVE_DIR)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        before = add_months(month_start(timezone.now()), -options["after_months"])
+        months = months_to_archive(before, directory=options["dir"])
+        for month in months:
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {month:%Y-%m}")
+                continue
+            index = archive_month(month, directory=options["dir"])
+            self.stdout.write(f"Archived {month:%Y-%m}: {index['rows']} rows in {len(index['segments'])} segments")
+        self.stdout.write(self.style.SUCCESS(f"{len(months)} months archived before {before:%Y-%m}."))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from audits.partitions import ensure_partitions
+
+
+class Command(BaseCommand):
+    help = "Create the monthly audit log partitions for this month and the months ahead."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=settings.AUDIT_PARTITION_MONTHS_AHEAD)
+
+    def handle(self, *args, **options):
+        created = ensure_partitions(options["months_ahead"])
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created."))
@@ -0,0 +1,82 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from audits.buffer import row_from_dict
+from audits.models import AuditLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert audit rows that the buffered writer spooled to AUDIT_SPOOL_PATH, then remove the file. "
+        "Lines that can't be parsed are moved to <path>.rejected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=settings.AUDIT_SPOOL_PATH)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        batch_size = options["batch_size"]
+        # Writers keep appending to the original path; replay a moved copy
+        replaying = path + ".replaying"
+        if not os.path.exists(path) and not os.path.exists(replaying):
+            self.stdout.write("No spooled audit rows.")
+            return
+        if not os.path.exists(replaying):
+            os.replace(path, replaying)
+
+        # Byte offset up to which batches are committed, so an interrupted
+        # replay resumes instead of inserting those rows again
+        position = replaying + ".pos"
+        offset = 0
+        if os.path.exists(position):
+            with open(position, encoding="utf-8") as fh:
+                offset = int(fh.read().strip() or 0)
+
+        replayed = rejected = 0
+        batch = []
+        with open(replaying, "rb") as fh:
+            fh.seek(offset)
+            for raw in fh:
+                offset += len(raw)
+                line = raw.decode("utf-8", errors="replace")
+                if not line.strip():
+                    continue
+                try:
+                    row = row_from_dict(json.loads(line))
+                    if row.timestamp is None:
+                        raise ValueError("invalid timestamp")
+                except (KeyError, ValueError, TypeError) as exc:
+                    rejected += 1
+                    self.reject(path, line, exc)
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    replayed += self.insert(batch, position, offset)
+                    batch = []
+            if batch:
+                replayed += self.insert(batch, position, offset)
+
+        os.remove(replaying)
+        if os.path.exists(position):
+            os.remove(position)
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} audit rows."))
+        if rejected:
+            self.stderr.write(f"Rejected {rejected} malformed lines; see {path}.rejected")
+
+    def insert(self, rows, position, offset) -> int:
+        with transaction.atomic():
+            AuditLog.objects.bulk_create(rows)
+        with open(position, "w", encoding="utf-8") as fh:
+            fh.write(str(offset))
+        return len(rows)
+
+    def reject(self, path, line, exc) -> None:
+        self.stderr.write(f"Skipping malformed spool line: {exc}")
+        with open(path + ".rejected", "a", encoding="utf-8") as fh:
+            fh.write(line if line.endswith("\n") else line + "\n")
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from audits.rollups import DEFAULT_BATCH_SIZE, reset_rollups, run_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Add new audit log rows to the hourly/daily rollup tables (incremental, "
+        "safe to re-run). --rebuild backfills them from the whole audit log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--rebuild", action="store_true", help="Empty the rollups and recount every row.")
+        parser.add_argument(
+            "--every", type=int, default=0,
+            help="Keep running, repeating every N seconds (0 = run once).",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            reset_rollups()
+        while True:
+            counted = run_rollups(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Rolled up {counted} audit rows."))
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,129 @@
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations
+from django.utils import timezone
+
+# The model state is unchanged: Django still treats `id` as the primary key
+# (values come from one sequence, so they stay unique), while the table's
+# primary key is (id, timestamp) because a partitioned table's unique
+# constraints must include the partition key.
+
+PARTITION_SQL = """
+CREATE TABLE "audits_auditlog_partitioned" (
+    "id" bigint NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    "role" varchar(32) NOT NULL,
+    "action" varchar(64) NOT NULL,
+    "object_type" varchar(64) NOT NULL,
+    "object_id" integer NULL,
+    "metadata" jsonb NOT NULL,
+    "ip_address" varchar(64) NOT NULL,
+    "user_id" bigint NULL,
+    CONSTRAINT "audits_auditlog_partitioned_pkey" PRIMARY KEY ("id", "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+CREATE TABLE "audits_auditlog_default" PARTITION OF "audits_auditlog_partitioned" DEFAULT;
+
+INSERT INTO "audits_auditlog_partitioned"
+    ("id", "timestamp", "role", "action", "object_type", "object_id", "metadata", "ip_address", "user_id")
+SELECT "id", "timestamp", "role", "action", "object_type", "object_id", "metadata", "ip_address", "user_id"
+FROM "audits_auditlog";
+
+DROP TABLE "audits_auditlog";
+ALTER TABLE "audits_auditlog_partitioned" RENAME TO "audits_auditlog";
+ALTER TABLE "audits_auditlog" RENAME CONSTRAINT "audits_auditlog_partitioned_pkey" TO "audits_auditlog_pkey";
+
+CREATE SEQUENCE "audits_auditlog_id_seq" OWNED BY "audits_auditlog"."id";
+SELECT setval('audits_auditlog_id_seq', COALESCE((SELECT max("id") FROM "audits_auditlog"), 0) + 1, false);
+ALTER TABLE "audits_auditlog" ALTER COLUMN "id" SET DEFAULT nextval('audits_auditlog_id_seq');
+
+ALTER TABLE "audits_auditlog" ADD CONSTRAINT "audits_auditlog_user_id_b8884964_fk_accounts_user_id"
+    FOREIGN KEY ("user_id") REFERENCES "accounts_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX "audits_auditlog_user_id_b8884964" ON "audits_auditlog" ("user_id");
+"""
+
+UNPARTITION_SQL = """
+CREATE TABLE "audits_auditlog_plain" (
+    "id" bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    "timestamp" timestamp with time zone NOT NULL,
+    "role" varchar(32) NOT NULL,
+    "action" varchar(64) NOT NULL,
+    "object_type" varchar(64) NOT NULL,
+    "object_id" integer NULL,
+    "metadata" jsonb NOT NULL,
+    "ip_address" varchar(64) NOT NULL,
+    "user_id" bigint NULL,
+    CONSTRAINT "audits_auditlog_plain_pkey" PRIMARY KEY ("id")
+);
+
+INSERT INTO "audits_auditlog_plain"
+    ("id", "timestamp", "role", "action", "object_type", "object_id", "metadata", "ip_address", "user_id")
+SELECT "id", "timestamp", "role", "action", "object_type", "object_id", "metadata", "ip_address", "user_id"
+FROM "audits_auditlog";
+
+DROP TABLE "audits_auditlog";
+ALTER TABLE "audits_auditlog_plain" RENAME TO "audits_auditlog";
+ALTER TABLE "audits_auditlog" RENAME CONSTRAINT "audits_auditlog_plain_pkey" TO "audits_auditlog_pkey";
+ALTER SEQUENCE "audits_auditlog_plain_id_seq" RENAME TO "audits_auditlog_id_seq";
+SELECT setval('audits_auditlog_id_seq', COALESCE((SELECT max("id") FROM "audits_auditlog"), 0) + 1, false);
+
+ALTER TABLE "audits_auditlog" ADD CONSTRAINT "audits_auditlog_user_id_b8884964_fk_accounts_user_id"
+    FOREIGN KEY ("user_id") REFERENCES "accounts_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX "audits_auditlog_user_id_b8884964" ON "audits_auditlog" ("user_id");
+"""
+
+
+# The partition helpers below are copied from audits.partitions as of this
+# migration, so later changes there don't change what it does.
+
+def _add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def create_monthly_partitions(apps, schema_editor):
+    # Every month that has rows, through 3 months ahead; rows move out of the
+    # default partition as their month is attached
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min("timestamp") FROM "audits_auditlog"')
+        oldest = cursor.fetchone()[0]
+        now = timezone.now()
+        month = date((oldest or now).year, (oldest or now).month, 1)
+        last = _add_months(date(now.year, now.month, 1), 3)
+
+        while month <= last:
+            name = f"audits_auditlog_p{month:%Y%m}"
+            lower, upper = _bound(month), _bound(_add_months(month, 1))
+            cursor.execute(f'CREATE TABLE "{name}" (LIKE "audits_auditlog" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM "audits_auditlog_default"
+                    WHERE "timestamp" >= %s AND "timestamp" < %s
+                    RETURNING *
+                )
+                INSERT INTO "{name}" SELECT * FROM moved
+                """,
+                [lower, upper],
+            )
+            cursor.execute(
+                f'ALTER TABLE "audits_auditlog" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+                [lower, upper],
+            )
+            month = _add_months(month, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audits', '0002_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+        migrations.RunPython(create_monthly_partitions, migrations.RunPython.noop),
+    ]
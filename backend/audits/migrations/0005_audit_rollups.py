@@ -0,0 +1,54 @@
+# Generated by Django 5.2.10 on 2026-10-16 21:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audits', '0004_auditlog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(max_length=64)),
+                ('role', models.CharField(blank=True, default='', max_length=32)),
+                ('object_type', models.CharField(blank=True, default='', max_length=64)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'action', 'role', 'object_type'), name='audit_hourly_rollup_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('action', models.CharField(max_length=64)),
+                ('role', models.CharField(blank=True, default='', max_length=32)),
+                ('object_type', models.CharField(blank=True, default='', max_length=64)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'action', 'role', 'object_type', 'user'), name='audit_daily_rollup_key', nulls_distinct=False)],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from datetime import timezone as dt_timezone
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copied from audits.chain and audits.models as of this migration, so later
+# changes there don't change the hashes it writes.
+GENESIS_HASH = "0" * 64
+
+HASHED_FIELDS = ["timestamp", "user_id", "role", "action", "object_type", "object_id", "metadata", "ip_address"]
+
+
+def row_digest(prev_hash, chain, seq, values):
+    content = [chain, seq, values["timestamp"].astimezone(dt_timezone.utc).isoformat()]
+    content += [values[field] for field in HASHED_FIELDS[1:]]
+    payload = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256((prev_hash + payload).encode()).hexdigest()
+
+
+def chain_existing_rows(apps, schema_editor):
+    # Rows written before chaining go onto chain 0 in id order, as they are now
+    AuditLog = apps.get_model("audits", "AuditLog")
+    AuditChainHead = apps.get_model("audits", "AuditChainHead")
+
+    seq, last_hash, batch = 0, GENESIS_HASH, []
+    for row in AuditLog.objects.order_by("id").iterator(chunk_size=2000):
+        seq += 1
+        row.chain, row.seq = 0, seq
+        row.row_hash = last_hash = row_digest(last_hash, 0, seq, {f: getattr(row, f) for f in HASHED_FIELDS})
+        batch.append(row)
+        if len(batch) >= 1000:
+            AuditLog.objects.bulk_update(batch, ["chain", "seq", "row_hash"])
+            batch = []
+    if batch:
+        AuditLog.objects.bulk_update(batch, ["chain", "seq", "row_hash"])
+
+    AuditChainHead.objects.bulk_create(
+        [AuditChainHead(chain=n) for n in range(settings.AUDIT_CHAIN_SHARDS)], ignore_conflicts=True,
+    )
+    AuditChainHead.objects.filter(chain=0).update(seq=seq, last_hash=last_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audits', '0005_audit_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditChainCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chain', models.PositiveSmallIntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('row_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('signature', models.CharField(max_length=64)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('chain', 'seq'), name='audit_checkpoint_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditChainHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chain', models.PositiveSmallIntegerField(unique=True)),
+                ('seq', models.BigIntegerField(default=0)),
+                ('last_hash', models.CharField(default='0000000000000000000000000000000000000000000000000000000000000000', max_length=64)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='chain',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='row_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='seq',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['chain', 'seq'], name='audit_chain_seq_idx'),
+        ),
+        migrations.RunPython(chain_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Existing rows: clinical-entry events carry metadata["patient_id"];
+# appointment events get the appointment's patient.
+BACKFILL_SQL = """
+UPDATE "audits_auditlog"
+SET "patient_id" = ("metadata"->>'patient_id')::bigint
+WHERE jsonb_typeof("metadata"->'patient_id') = 'number';
+
+UPDATE "audits_auditlog" AS l
+SET "patient_id" = a."patient_id"
+FROM "appointments_appointment" AS a
+WHERE l."object_type" = 'appointment' AND l."object_id" = a."id" AND l."patient_id" IS NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointment_open_index'),
+        ('audits', '0006_audit_hash_chain'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='patient',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        # Before the index exists, so the UPDATEs don't maintain it row by row
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['patient', 'timestamp', 'id'], name='audit_patient_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audits', '0009_auditchaingap'),
+    ]
+
+    operations = [
+        # Existing rows were hashed without patient_id (version 1); new rows cover it
+        migrations.AddField(
+            model_name='auditlog',
+            name='hash_version',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='hash_version',
+            field=models.PositiveSmallIntegerField(default=2, editable=False),
+        ),
+    ]
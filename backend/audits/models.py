@@ -1,16 +1,38 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# What the first row of each hash chain follows (see audits.chain)
+GENESIS_HASH = "0" * 64
+
+
+class AuditLogQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # Every insert is appended to a hash chain
+        from .chain import append  # local import avoids circular imports
+
+        return append(objs, lambda rows: super(AuditLogQuerySet, self).bulk_create(rows, *args, **kwargs))
 
 
 class AuditLog(models.Model):
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # The table is range-partitioned by month on timestamp (migration 0003,
+    # see audits.partitions); its primary key in Postgres is (id, timestamp).
 
+    # Set when the event happens, not when a buffered row reaches the database
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    # No FK constraint and nothing done on delete: user_id is hashed into the
+    # row (audits.chain), so deleting a user must leave it as it is
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.SET_NULL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         null=True,
         blank=True,
         related_name="audit_logs",
+        # Covered by audit_user_ts_idx
+        db_index=False,
     )
 
     role = models.CharField(max_length=32, blank=True, default="")
@@ -21,8 +43,176 @@ class AuditLog(models.Model):
     metadata = models.JSONField(default=dict, blank=True)
     ip_address = models.CharField(max_length=64, blank=True, default="")
 
+    # Patient whose data the event touched, copied from metadata["patient_id"]
+    # so access history is an index range scan. No FK constraint: the
+    # history has to outlive the account.
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+        # Covered by audit_patient_ts_idx
+        db_index=False,
+    )
+
+    # Hash chain position and link, set on insert (audits.chain)
+    chain = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    seq = models.BigIntegerField(null=True, blank=True, editable=False)
+    row_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
+    # Which fields row_hash covers; 1 for rows hashed before patient_id existed
+    hash_version = models.PositiveSmallIntegerField(default=2, editable=False)
+
+    objects = AuditLogQuerySet.as_manager()
+
     class Meta:
         ordering = ["-timestamp"]
+        # Each filter of the audit list is an equality prefix followed by the
+        # (timestamp, id) sort/range, so filtered pages are one index range
+        # scan read backwards. The object index also carries the history
+        # columns, making per-object history an index-only scan.
+        indexes = [
+            models.Index(fields=["timestamp", "id"], name="audit_ts_idx"),
+            models.Index(fields=["user", "timestamp", "id"], name="audit_user_ts_idx"),
+            models.Index(fields=["action", "timestamp", "id"], name="audit_action_ts_idx"),
+            models.Index(
+                fields=["object_type", "object_id", "timestamp", "id"],
+                include=["action", "role", "user"],
+                name="audit_object_ts_idx",
+            ),
+            models.Index(fields=["patient", "timestamp", "id"], name="audit_patient_ts_idx"),
+            models.Index(fields=["chain", "seq"], name="audit_chain_seq_idx"),
+        ]
 
     def __str__(self):
         return f"{self.timestamp} {self.action} {self.object_type}:{self.object_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        from .chain import append  # local import avoids circular imports
+
+        append([self], lambda rows: super(AuditLog, self).save(*args, **kwargs))
+
+
+class AuditHourlyRollup(models.Model):
+    """
+    Audit events per hour by action, role and object type. Maintained by
+    audits.rollups from new AuditLog rows; outlives partition pruning.
+    """
+    bucket = models.DateTimeField()
+    action = models.CharField(max_length=64)
+    role = models.CharField(max_length=32, blank=True, default="")
+    object_type = models.CharField(max_length=64, blank=True, default="")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "action", "role", "object_type"], name="audit_hourly_rollup_key",
+            ),
+        ]
+
+
+class AuditDailyRollup(models.Model):
+    """
+    Audit events per day (TIME_ZONE) by action, role, object type and user.
+    """
+    day = models.DateField()
+    action = models.CharField(max_length=64)
+    role = models.CharField(max_length=32, blank=True, default="")
+    object_type = models.CharField(max_length=64, blank=True, default="")
+    # No FK constraint: counts stay attributed after the user is deleted
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULLS NOT DISTINCT so anonymous events upsert into one row per day
+            models.UniqueConstraint(
+                fields=["day", "action", "role", "object_type", "user"],
+                name="audit_daily_rollup_key",
+                nulls_distinct=False,
+            ),
+        ]
+
+
+class AuditRollupState(models.Model):
+    """
+    High-water mark: AuditLog ids up to last_id are counted in the rollups.
+    """
+    name = models.CharField(max_length=32, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class AuditChainHead(models.Model):
+    """
+    Last row of one audit hash chain; locked by writers appending to it.
+    """
+    chain = models.PositiveSmallIntegerField(unique=True)
+    seq = models.BigIntegerField(default=0)
+    last_hash = models.CharField(max_length=64, default=GENESIS_HASH)
+
+
+class AuditChainCheckpoint(models.Model):
+    """
+    A verified chain position, signed with AUDIT_CHECKPOINT_KEY so it can't
+    be rewritten along with the rows.
+    """
+    chain = models.PositiveSmallIntegerField()
+    seq = models.BigIntegerField()
+    row_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+    signature = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["chain", "seq"], name="audit_checkpoint_key"),
+        ]
+
+    def sign(self) -> str:
+        value = f"{self.chain}:{self.seq}:{self.row_hash}:{self.created_at.isoformat()}"
+        return salted_hmac(
+            "audits.checkpoint", value, secret=settings.AUDIT_CHECKPOINT_KEY, algorithm="sha256",
+        ).hexdigest()
+
+    def signature_valid(self) -> bool:
+        return constant_time_compare(self.signature, self.sign())
+
+
+class AuditChainGap(models.Model):
+    """
+    Rows first_seq..last_seq of a chain that were removed on purpose
+    (archived or past retention), with the hash of the last one so
+    verification can follow the chain across them. Signed like checkpoints,
+    so rows deleted by hand can't be passed off as removed.
+    """
+    chain = models.PositiveSmallIntegerField()
+    first_seq = models.BigIntegerField()
+    last_seq = models.BigIntegerField()
+    row_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(default=timezone.now)
+    signature = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["chain", "first_seq"], name="audit_chain_gap_key"),
+        ]
+
+    def sign(self) -> str:
+        value = f"{self.chain}:{self.first_seq}:{self.last_seq}:{self.row_hash}:{self.created_at.isoformat()}"
+        return salted_hmac(
+            "audits.chain_gap", value, secret=settings.AUDIT_CHECKPOINT_KEY, algorithm="sha256",
+        ).hexdigest()
+
+    def signature_valid(self) -> bool:
+        return constant_time_compare(self.signature, self.sign())
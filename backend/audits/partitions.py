@@ -0,0 +1,148 @@
+"""
+Monthly range partitions of audits_auditlog (PostgreSQL declarative
+partitioning on `timestamp`).
+
+Partitions are named audits_auditlog_pYYYYMM and cover one calendar month in
+UTC. audits_auditlog_default catches rows outside every partition so an
+insert never fails; ensure_partitions() moves such rows into the month's
+partition when it creates it.
+"""
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+TABLE = "audits_auditlog"
+DEFAULT_PARTITION = f"{TABLE}_default"
+NAME_RE = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def month_bounds(month: date):
+    """
+    [start, end) of a partition month as UTC datetimes.
+    """
+    return (
+        datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc),
+        datetime(*add_months(month, 1).timetuple()[:3], tzinfo=dt_timezone.utc),
+    )
+
+
+def _bound(month: date) -> str:
+    return month_bounds(month)[0].isoformat()
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+    return cursor.fetchone() is not None
+
+
+def existing_partitions(cursor) -> dict:
+    """
+    {month: table name} for the monthly partitions currently attached.
+    """
+    cursor.execute(
+        """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        """,
+        [TABLE],
+    )
+    found = {}
+    for (name,) in cursor.fetchall():
+        m = NAME_RE.match(name)
+        if m:
+            found[date(int(m.group(1)), int(m.group(2)), 1)] = name
+    return found
+
+
+def create_partition(cursor, month: date) -> str:
+    """
+    Create and attach the partition for `month`, first moving any rows for
+    that month out of the default partition (attaching would fail otherwise).
+    """
+    name = partition_name(month)
+    lower, upper = _bound(month), _bound(add_months(month, 1))
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM "{DEFAULT_PARTITION}"
+            WHERE "timestamp" >= %s AND "timestamp" < %s
+            RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+        """,
+        [lower, upper],
+    )
+    cursor.execute(
+        f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+        [lower, upper],
+    )
+    return name
+
+
+def ensure_partitions(months_ahead: int = 3, start: date | None = None) -> list:
+    """
+    Make sure every month from `start` (default: this month) through
+    `months_ahead` months from now has a partition. Returns the names created
+    (none while the table isn't partitioned, e.g. migrated back before 0003).
+    """
+    this_month = month_start(timezone.now())
+    month = month_start(start) if start else this_month
+    last = add_months(this_month, months_ahead)
+
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return created
+        existing = existing_partitions(cursor)
+        while month <= last:
+            if month not in existing:
+                created.append(create_partition(cursor, month))
+            month = add_months(month, 1)
+    return created
+
+
+def expired_partitions(keep_months: int, now=None) -> list:
+    """
+    (month, name) of partitions wholly older than the retention window: the
+    current month plus the `keep_months` months before it are kept.
+    """
+    cutoff = add_months(month_start(now or timezone.now()), -keep_months)
+    with connection.cursor() as cursor:
+        existing = existing_partitions(cursor)
+    return sorted((month, name) for month, name in existing.items() if month < cutoff)
+
+
+def detach_partition(name: str, drop: bool = True) -> None:
+    """
+    Detach a monthly partition (a catalog change, no row-by-row DELETE) and
+    drop it. A kept table loses its foreign keys so deleting a user never
+    has to look at it.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+        if drop:
+            cursor.execute(f'DROP TABLE "{name}"')
+            return
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [name],
+        )
+        for (conname,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "{conname}"')
@@ -3,7 +3,8 @@ from .models import AuditLog
 
 
 class AuditLogSerializer(serializers.ModelSerializer):
-    user_id = serializers.IntegerField(source="user.id", read_only=True)
+    # Kept for deleted users, whose rows still carry their id
+    user_id = serializers.IntegerField(read_only=True)
     username = serializers.CharField(source="user.username", read_only=True)
 
     class Meta:
@@ -20,3 +21,12 @@ class AuditLogSerializer(serializers.ModelSerializer):
             "metadata",
             "ip_address",
         ]
+
+
+class AuditHistoryItemSerializer(serializers.Serializer):
+    # Schema only: the history view returns index columns without loading models
+    id = serializers.IntegerField()
+    timestamp = serializers.DateTimeField()
+    action = serializers.CharField()
+    role = serializers.CharField()
+    user_id = serializers.IntegerField(allow_null=True)
@@ -1,9 +1,33 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from accounts.models import User
-from audits.models import AuditLog
+from audits import buffer, partitions
+from audits.archive import AuditArchive, archive_month, months_to_archive
+from audits.chain import HASHED_FIELDS_V2, record_checkpoints, row_digest, verify_chains
+from audits.api_views import HISTORY_FIELDS
+from audits.models import AuditChainCheckpoint, AuditChainGap, AuditChainHead, AuditDailyRollup, AuditHourlyRollup, AuditLog
+from audits.rollups import run_rollups
+from audits.utils import log_event, log_events
+from config.filters import filter_date_range
+from appointments.models import Appointment
 from records.models import MedicalRecord
 
 
@@ -59,4 +83,792 @@ class AuditLogAPITests(TestCase):
         self.client.force_authenticate(self.manager)
         resp = self.client.get(reverse("audit_list") + "?action=TEST_ACTION")
         self.assertEqual(resp.status_code, 200)
-        self.assertTrue(any(item["action"] == "TEST_ACTION" for item in resp.data))
+        self.assertTrue(any(item["action"] == "TEST_ACTION" for item in resp.data["results"]))
+
+    def test_list_is_304_until_a_new_event(self):
+        AuditLog.objects.create(action="TEST_ACTION", object_type="x", metadata={})
+        self.client.force_authenticate(self.manager)
+        url = reverse("audit_list")
+
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(1):
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        AuditLog.objects.create(action="TEST_ACTION", object_type="x", metadata={})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Different filters never share a tag
+        self.assertNotEqual(self.client.get(url + "?action=TEST_ACTION")["ETag"], etag)
+
+    def test_list_tag_changes_for_a_late_row_inside_the_range(self):
+        now = timezone.now()
+        for minutes in (10, 0):
+            AuditLog.objects.create(action="TEST_ACTION", object_type="x", metadata={}, timestamp=now - timedelta(minutes=minutes))
+        self.client.force_authenticate(self.manager)
+        url = reverse("audit_list")
+        etag = self.client.get(url)["ETag"]
+
+        # e.g. a buffered flush or spool replay landing between the ends
+        AuditLog.objects.create(action="TEST_ACTION", object_type="x", metadata={}, timestamp=now - timedelta(minutes=5))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BufferedAuditWriterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.record = MedicalRecord.objects.get(patient=cls.patient)
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.spool_path = os.path.join(tmp, "audit_spool.ndjson")
+        overrides = override_settings(
+            AUDIT_LOG_MODE="buffered",
+            AUDIT_BUFFER_SIZE=3,
+            AUDIT_FLUSH_INTERVAL_SECONDS=0,
+            AUDIT_SPOOL_PATH=self.spool_path,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        buffer._buffer = None
+        self.addCleanup(setattr, buffer, "_buffer", None)
+
+    def test_rows_are_queued_after_commit_and_written_on_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            log_event(None, "TEST_ACTION", object_type="x")
+        self.assertFalse(AuditLog.objects.filter(action="TEST_ACTION").exists())
+        self.assertEqual(len(buffer.get_buffer()), 1)
+
+        buffer.flush_on_request_finished(sender=None)
+        self.assertEqual(AuditLog.objects.filter(action="TEST_ACTION").count(), 1)
+        self.assertEqual(len(buffer.get_buffer()), 0)
+
+    def test_timestamp_is_when_the_event_happened(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            row = log_events(None, [{"action": "TEST_ACTION"}])[0]
+        buffer.get_buffer().flush()
+        self.assertEqual(AuditLog.objects.get(action="TEST_ACTION").timestamp, row.timestamp)
+
+    def test_full_buffer_flushes_itself(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            log_events(None, [{"action": "TEST_ACTION"}] * 2)
+        self.assertEqual(AuditLog.objects.filter(action="TEST_ACTION").count(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            log_event(None, "TEST_ACTION")
+        self.assertEqual(AuditLog.objects.filter(action="TEST_ACTION").count(), 3)
+
+    def test_rolled_back_write_is_not_audited(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    log_event(None, "TEST_ACTION")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(len(buffer.get_buffer()), 0)
+
+    def test_api_write_is_audited_at_request_end(self):
+        client = APIClient()
+        client.force_authenticate(self.gp)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(
+                reverse("record_entries", args=[self.record.id]),
+                {"type": "NOTE", "title": "test", "content": "test content"},
+                format="json",
+            )
+        self.assertEqual(resp.status_code, 201)
+        buffer.flush_on_request_finished(sender=None)
+        self.assertTrue(AuditLog.objects.filter(action="RECORD_ENTRY_CREATE", user=self.gp).exists())
+
+    def test_failed_flush_spools_rows_for_replay(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            log_event(None, "TEST_ACTION", object_type="x", metadata={"n": 1})
+        with mock.patch.object(AuditLog.objects, "bulk_create", side_effect=RuntimeError("db down")):
+            with self.assertLogs("audits.buffer", "ERROR"):
+                buffer.get_buffer().flush()
+        self.assertFalse(AuditLog.objects.filter(action="TEST_ACTION").exists())
+        self.assertTrue(os.path.exists(self.spool_path))
+
+        call_command("replay_audit_spool", path=self.spool_path, stdout=open(os.devnull, "w"))
+        row = AuditLog.objects.get(action="TEST_ACTION")
+        self.assertEqual((row.object_type, row.metadata), ("x", {"n": 1}))
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_replay_skips_malformed_lines_and_inserts_in_batches(self):
+        good = json.dumps({"timestamp": "2030-01-01T00:00:00+00:00", "user_id": None, "role": "", "action": "TEST_ACTION",
+                           "object_type": "x", "object_id": None, "patient_id": None, "metadata": {}, "ip_address": ""})
+        with open(self.spool_path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join([good, "{not json", good, '{"timestamp": "2030-13-40T00:00"}', good]) + "\n")
+
+        err = StringIO()
+        with mock.patch.object(AuditLog.objects, "bulk_create", wraps=AuditLog.objects.bulk_create) as bulk:
+            call_command("replay_audit_spool", path=self.spool_path, batch_size=2,
+                         stdout=open(os.devnull, "w"), stderr=err)
+        self.assertEqual(AuditLog.objects.filter(action="TEST_ACTION").count(), 3)
+        self.assertEqual(bulk.call_count, 2)
+        self.assertIn("Rejected 2 malformed lines", err.getvalue())
+        with open(self.spool_path + ".rejected", encoding="utf-8") as fh:
+            self.assertEqual(len(fh.readlines()), 2)
+        self.assertFalse(os.path.exists(self.spool_path + ".replaying"))
+
+
+class AuditPartitionTests(TestCase):
+    """
+    audits_auditlog is range-partitioned by month (migration 0003).
+    Partition DDL is transactional, so each test's changes roll back.
+    """
+
+    def partition_of(self, row):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM audits_auditlog WHERE id = %s", [row.id])
+            return cursor.fetchone()[0]
+
+    def test_current_and_upcoming_months_have_partitions(self):
+        this_month = partitions.month_start(datetime.now(dt_timezone.utc))
+        with connection.cursor() as cursor:
+            existing = partitions.existing_partitions(cursor)
+        for n in range(4):
+            self.assertIn(partitions.add_months(this_month, n), existing)
+
+        row = AuditLog.objects.create(action="TEST_ACTION")
+        self.assertEqual(self.partition_of(row), partitions.partition_name(this_month))
+
+    def test_rows_in_the_default_partition_move_when_their_month_is_created(self):
+        row = AuditLog.objects.create(action="TEST_ACTION", timestamp=datetime(2001, 2, 3, tzinfo=dt_timezone.utc))
+        self.assertEqual(self.partition_of(row), partitions.DEFAULT_PARTITION)
+
+        created = partitions.ensure_partitions(months_ahead=0, start=date(2001, 2, 1))
+        self.assertIn("audits_auditlog_p200102", created)
+        self.assertEqual(self.partition_of(row), "audits_auditlog_p200102")
+
+    def test_date_filtered_list_only_scans_matching_partitions(self):
+        partitions.ensure_partitions(months_ahead=0, start=date(2001, 1, 1))
+        params = {"date_from": "2001-03-05", "date_to": "2001-03-06"}
+        plan = filter_date_range(AuditLog.objects.all(), "timestamp", params).explain()
+        self.assertIn("audits_auditlog_p200103", plan)
+        self.assertNotIn("audits_auditlog_p200102", plan)
+        self.assertNotIn(partitions.partition_name(date.today().replace(day=1)), plan)
+
+    def test_prune_detaches_months_past_retention(self):
+        partitions.ensure_partitions(months_ahead=0, start=date(2001, 1, 1))
+        old = AuditLog.objects.create(action="OLD", timestamp=datetime(2001, 1, 15, tzinfo=dt_timezone.utc))
+        recent = AuditLog.objects.create(action="RECENT")
+
+        call_command("prune_audit_partitions", keep_months=12, stdout=open(os.devnull, "w"))
+        self.assertFalse(AuditLog.objects.filter(pk=old.pk).exists())
+        self.assertTrue(AuditLog.objects.filter(pk=recent.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('audits_auditlog_p200101')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_prune_can_keep_detached_tables(self):
+        partitions.ensure_partitions(months_ahead=0, start=date(2001, 1, 1))
+        AuditLog.objects.create(action="OLD", timestamp=datetime(2001, 1, 15, tzinfo=dt_timezone.utc))
+
+        call_command("prune_audit_partitions", keep_months=12, keep_tables=True, stdout=open(os.devnull, "w"))
+        self.assertFalse(AuditLog.objects.filter(action="OLD").exists())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "audits_auditlog_p200101"')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class AuditIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER)
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        start = datetime.now(dt_timezone.utc) - timedelta(days=20)
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                timestamp=start + timedelta(hours=n),
+                # One user among many: a selective filter, as in production
+                user=cls.gp if n % 25 == 0 else cls.manager,
+                role="GP" if n % 25 == 0 else "PRACTICE_MANAGER",
+                action=["APPOINTMENT_CREATE", "APPOINTMENT_UPDATE", "RECORD_ENTRY_CREATE"][n % 3],
+                object_type="appointment",
+                object_id=n % 40,
+            )
+            for n in range(400)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE audits_auditlog")
+
+    def plan(self, qs):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+        return qs.explain()
+
+    def assertNoSort(self, plan):
+        # Merge Append of per-partition index scans yields rows already in order
+        self.assertIsNone(re.search(r"(^|->)\s*(Incremental )?Sort\s+\(", plan, re.M), plan)
+
+    def test_user_and_date_filter_is_one_index_range(self):
+        params = {"date_from": str(date.today() - timedelta(days=5)), "date_to": str(date.today())}
+        qs = filter_date_range(AuditLog.objects.filter(user=self.gp), "timestamp", params)
+        plan = self.plan(qs.order_by("-timestamp", "-id")[:50])
+
+        self.assertIn("user_id_timestamp_id", plan)
+        cond = [line for line in plan.splitlines() if "Index Cond" in line]
+        self.assertTrue(cond and all("user_id" in line and "timestamp" in line for line in cond), plan)
+        self.assertNoSort(plan)
+
+    def test_action_filter_uses_action_index(self):
+        plan = self.plan(AuditLog.objects.filter(action="APPOINTMENT_CREATE").order_by("-timestamp", "-id")[:50])
+        self.assertIn("action_timestamp_id", plan)
+        self.assertNoSort(plan)
+
+    def test_object_history_is_index_only(self):
+        view_qs = AuditLog.objects.filter(object_type="appointment", object_id=7).order_by("-timestamp", "-id")
+        plan = self.plan(view_qs.values(*HISTORY_FIELDS))
+        self.assertIn("Index Only Scan", plan)
+        self.assertNotIn("Index Scan", plan.replace("Index Only Scan", ""))
+        self.assertNoSort(plan)
+
+    def test_object_history_endpoint(self):
+        client = APIClient()
+        url = reverse("audit_object_history", args=["appointment", 7])
+
+        client.force_authenticate(self.gp)
+        self.assertEqual(client.get(url).status_code, 403)
+
+        client.force_authenticate(self.manager)
+        resp = client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        expected = list(
+            AuditLog.objects.filter(object_type="appointment", object_id=7)
+            .order_by("-timestamp", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual([row["id"] for row in resp.data], expected)
+        self.assertEqual(set(resp.data[0]), {"id", "timestamp", "action", "role", "user_id"})
+
+        listed = client.get(reverse("audit_list") + "?object_type=appointment&object_id=7")
+        self.assertEqual({row["id"] for row in listed.data["results"]}, set(expected))
+
+        resp = client.get(url + "?limit=2")
+        self.assertEqual([row["id"] for row in resp.data], expected[:2])
+        self.assertEqual(client.get(url + "?limit=0").status_code, 400)
+
+
+class AuditLogPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER)
+        start = datetime.now(dt_timezone.utc) - timedelta(days=3)
+        AuditLog.objects.bulk_create([
+            # Pairs share a timestamp so the id tie-break matters
+            AuditLog(timestamp=start + timedelta(minutes=n // 2), action="TEST_ACTION")
+            for n in range(120)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_pages_walk_the_whole_history_newest_first(self):
+        expected = list(AuditLog.objects.order_by("-timestamp", "-id").values_list("id", flat=True))
+        seen, url = [], reverse("audit_list")
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertLessEqual(len(resp.data["results"]), 50)
+            seen += [row["id"] for row in resp.data["results"]]
+            url = resp.data["next"]
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        resp = self.client.get(reverse("audit_list") + "?page_size=100000")
+        self.assertEqual(len(resp.data["results"]), 120)
+        AuditLog.objects.bulk_create([AuditLog(action="TEST_ACTION") for _ in range(100)])
+        resp = self.client.get(reverse("audit_list") + "?page_size=100000")
+        self.assertEqual(len(resp.data["results"]), 200)
+
+    def test_deep_page_costs_the_same_and_never_counts(self):
+        first = self.client.get(reverse("audit_list") + "?page_size=10")
+        deep = first
+        for _ in range(5):
+            deep = self.client.get(deep.data["next"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(deep.data["next"])
+        self.assertEqual(resp.status_code, 200)
+        # Validators probe + the page itself
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertFalse(any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries))
+        self.assertNotIn("OFFSET", ctx.captured_queries[-1]["sql"].upper())
+
+    def test_bad_cursor_is_404(self):
+        self.assertEqual(self.client.get(reverse("audit_list") + "?cursor=nope").status_code, 404)
+
+
+class AuditLogExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER)
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        start = datetime(2030, 5, 1, 9, tzinfo=dt_timezone.utc)
+        partitions.ensure_partitions(months_ahead=0, start=date(2030, 5, 1))
+        for n in range(3):
+            AuditLog.objects.create(
+                timestamp=start + timedelta(hours=n), user=cls.gp, role="GP",
+                action="RECORD_ENTRY_CREATE", object_type="clinical_entry", object_id=n,
+                metadata={"record_id": 7, "type": "NOTE"},
+            )
+        AuditLog.objects.create(timestamp=start, user=cls.manager, action="OTHER")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.url = reverse("audit_export")
+
+    def body(self, resp):
+        return b"".join(resp.streaming_content)
+
+    def test_csv_uses_list_filters_oldest_first(self):
+        resp = self.client.get(self.url + f"?user={self.gp.id}&date_from=2030-05-01&date_to=2030-05-01")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertIn('filename="audit_logs.csv"', resp["Content-Disposition"])
+
+        rows = list(csv.DictReader(StringIO(self.body(resp).decode())))
+        self.assertEqual([r["object_id"] for r in rows], ["0", "1", "2"])
+        self.assertEqual(rows[0]["user__username"], "gp1")
+        self.assertEqual(json.loads(rows[0]["metadata"]), {"record_id": 7, "type": "NOTE"})
+
+    def test_gzipped_ndjson(self):
+        resp = self.client.get(self.url + "?output=ndjson&gzip=1&action=RECORD_ENTRY_CREATE")
+        self.assertEqual(resp["Content-Type"], "application/gzip")
+        self.assertIn('filename="audit_logs.ndjson.gz"', resp["Content-Disposition"])
+
+        lines = gzip.decompress(self.body(resp)).decode().splitlines()
+        self.assertEqual([json.loads(line)["object_id"] for line in lines], [0, 1, 2])
+
+    def test_rows_are_read_lazily_and_export_is_audited(self):
+        # The audit insert with its chain head lock and update
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.url)
+        self.body(resp)
+        self.assertTrue(AuditLog.objects.filter(action="AUDIT_EXPORT", user=self.manager).exists())
+
+    def test_non_manager_forbidden(self):
+        self.client.force_authenticate(self.gp)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    async def test_streams_an_async_body_under_asgi(self):
+        token = str(AccessToken.for_user(self.manager))
+        resp = await AsyncClient().get(
+            self.url + "?output=ndjson&gzip=1&action=RECORD_ENTRY_CREATE", headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        # A sync body would be collected into a list before the first byte is sent
+        self.assertTrue(resp.is_async)
+        body = b"".join([chunk async for chunk in resp.streaming_content])
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual([json.loads(line)["object_id"] for line in lines], [0, 1, 2])
+
+
+class AuditRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER)
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.later = datetime(2031, 1, 1, tzinfo=dt_timezone.utc)
+
+    def log(self, when, action="APPOINTMENT_CREATE", user=None, role="GP"):
+        return AuditLog.objects.create(
+            timestamp=when, action=action, user=user, role=role if user else "", object_type="appointment",
+        )
+
+    def hourly(self):
+        return {
+            (r.bucket.hour, r.action): r.count
+            for r in AuditHourlyRollup.objects.filter(bucket__date=date(2030, 6, 1))
+        }
+
+    def test_counts_new_rows_once(self):
+        at = lambda h, m: datetime(2030, 6, 1, h, m, tzinfo=dt_timezone.utc)
+        self.log(at(9, 10), user=self.gp)
+        self.log(at(9, 50), user=self.gp)
+        self.log(at(10, 5), user=self.gp, action="APPOINTMENT_UPDATE")
+        self.assertEqual(run_rollups(now=self.later), 3)
+        self.assertEqual(self.hourly(), {(9, "APPOINTMENT_CREATE"): 2, (10, "APPOINTMENT_UPDATE"): 1})
+
+        # Re-running counts nothing twice; new rows add to existing buckets
+        self.assertEqual(run_rollups(now=self.later), 0)
+        self.log(at(9, 59), user=self.gp)
+        self.assertEqual(run_rollups(now=self.later, batch_size=1), 1)
+        self.assertEqual(self.hourly()[(9, "APPOINTMENT_CREATE")], 3)
+
+        daily = AuditDailyRollup.objects.get(day=date(2030, 6, 1), action="APPOINTMENT_CREATE")
+        self.assertEqual((daily.user_id, daily.role, daily.count), (self.gp.id, "GP", 3))
+
+    def test_anonymous_events_share_one_daily_row(self):
+        when = datetime(2030, 6, 1, 9, tzinfo=dt_timezone.utc)
+        self.log(when)
+        run_rollups(now=self.later)
+        self.log(when)
+        run_rollups(now=self.later)
+        row = AuditDailyRollup.objects.get(day=date(2030, 6, 1))
+        self.assertEqual((row.user_id, row.count), (None, 2))
+
+    def test_recent_rows_wait_for_the_next_run(self):
+        now = datetime(2030, 6, 1, 12, tzinfo=dt_timezone.utc)
+        self.log(now - timedelta(hours=1))
+        self.log(now - timedelta(seconds=10))
+        self.assertEqual(run_rollups(now=now), 1)
+        self.assertEqual(run_rollups(now=now + timedelta(hours=1)), 1)
+
+    def test_rebuild_recounts_everything(self):
+        when = datetime(2030, 6, 1, 9, tzinfo=dt_timezone.utc)
+        for _ in range(3):
+            self.log(when)
+        run_rollups(now=self.later)
+        AuditHourlyRollup.objects.update(count=99)
+
+        with mock.patch("audits.rollups.timezone.now", return_value=self.later):
+            call_command("rollup_audit_logs", rebuild=True, stdout=open(os.devnull, "w"))
+        self.assertEqual(self.hourly(), {(9, "APPOINTMENT_CREATE"): 3})
+
+    def test_stats_endpoint_reads_rollups(self):
+        for day, n in [(1, 2), (2, 1)]:
+            for _ in range(n):
+                self.log(datetime(2030, 6, day, 9, tzinfo=dt_timezone.utc), user=self.gp)
+        self.log(datetime(2030, 6, 2, 9, tzinfo=dt_timezone.utc), action="RECORD_ENTRY_CREATE")
+        run_rollups(now=self.later)
+
+        url = reverse("audit_stats") + "?date_from=2030-06-01&date_to=2030-06-02"
+        with self.assertNumQueries(2):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [(str(r["bucket"]), r["action"], r["count"]) for r in resp.data["results"]],
+            [
+                ("2030-06-01", "APPOINTMENT_CREATE", 2),
+                ("2030-06-02", "APPOINTMENT_CREATE", 1),
+                ("2030-06-02", "RECORD_ENTRY_CREATE", 1),
+            ],
+        )
+
+        resp = self.client.get(url + f"&group_by=role,user&user={self.gp.id}")
+        self.assertEqual([(r["role"], r["user_id"], r["count"]) for r in resp.data["results"]],
+                         [("GP", self.gp.id, 2), ("GP", self.gp.id, 1)])
+
+        resp = self.client.get(reverse("audit_stats") + "?period=hour&date_from=2030-06-02&date_to=2030-06-02")
+        self.assertEqual(sum(r["count"] for r in resp.data["results"]), 2)
+        self.assertEqual(resp.data["results"][0]["bucket"].hour, 9)
+
+    def test_stats_validation(self):
+        url = reverse("audit_stats")
+        self.assertEqual(self.client.get(url + "?period=week").status_code, 400)
+        self.assertEqual(self.client.get(url + "?period=hour&group_by=user").status_code, 400)
+        self.assertEqual(self.client.get(url + "?period=hour&date_from=2030-01-01&date_to=2030-03-01").status_code, 400)
+
+        self.client.force_authenticate(self.gp)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+@override_settings(AUDIT_CHAIN_SHARDS=2)
+class AuditHashChainTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        for n in range(3):
+            AuditLog.objects.create(action="RECORD_ENTRY_CREATE", user=cls.gp, role="GP", object_id=n, metadata={"b": 1, "a": [n]})
+        AuditLog.objects.bulk_create([AuditLog(action="APPOINTMENT_CREATE", object_id=n) for n in range(4)])
+
+    def problems(self, **kwargs):
+        return verify_chains(**kwargs)[1]
+
+    def rewrite_chain_from(self, row):
+        # What someone with database access would do to hide an edit
+        prev = AuditLog.objects.get(chain=row.chain, seq=row.seq - 1).row_hash if row.seq > 1 else "0" * 64
+        for later in AuditLog.objects.filter(chain=row.chain, seq__gte=row.seq).order_by("seq"):
+            values = {f: getattr(later, f) for f in HASHED_FIELDS_V2}
+            prev = row_digest(prev, later.chain, later.seq, values, later.hash_version)
+            AuditLog.objects.filter(id=later.id).update(row_hash=prev)
+        AuditChainHead.objects.filter(chain=row.chain).update(last_hash=prev)
+
+    def test_rows_are_chained_without_gaps(self):
+        for head in AuditChainHead.objects.filter(chain__lt=2):
+            rows = list(AuditLog.objects.filter(chain=head.chain).order_by("seq"))
+            self.assertEqual([r.seq for r in rows], list(range(1, head.seq + 1)))
+            if rows:
+                self.assertEqual(rows[-1].row_hash, head.last_hash)
+        self.assertFalse(AuditLog.objects.filter(chain__isnull=True).exists())
+
+        self.assertEqual(verify_chains(full=True, chunk_size=2)[:2], (7, []))
+
+    def test_edits_and_deletions_are_detected(self):
+        row = AuditLog.objects.filter(action="RECORD_ENTRY_CREATE").first()
+        AuditLog.objects.filter(id=row.id).update(role="PRACTICE_MANAGER")
+        self.assertIn(f"row {row.id} (seq {row.seq}) doesn't match its hash", " ".join(self.problems(full=True)))
+
+        AuditLog.objects.filter(id=row.id).update(role="GP")
+        self.assertEqual(self.problems(full=True, chunk_size=1), [])
+
+        AuditLog.objects.filter(id=row.id).delete()
+        self.assertTrue(any("missing" in p for p in self.problems(full=True, chunk_size=1)))
+
+    def test_patient_is_hashed_on_new_rows(self):
+        patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        other = User.objects.create_user(username="patient2", password="pass", role=User.Role.PATIENT)
+        # Like a row whose patient came from its appointment: nothing in metadata
+        row = AuditLog.objects.create(action="APPOINTMENT_CREATE", object_type="appointment", patient=patient)
+        self.assertEqual(row.hash_version, 2)
+        AuditLog.objects.filter(id=row.id).update(patient=other)
+        self.assertIn(f"row {row.id} (seq {row.seq}) doesn't match its hash", " ".join(self.problems(full=True)))
+
+        # Version 1 rows predate the column and verify without it
+        AuditLog.objects.filter(id=row.id).update(patient=None, hash_version=1)
+        self.rewrite_chain_from(AuditLog.objects.get(id=row.id))
+        self.assertEqual(self.problems(full=True), [])
+
+    def test_removed_prefixes_and_checkpointed_rows_are_reported(self):
+        record_checkpoints(verify_chains()[2])
+        first = AuditLog.objects.filter(seq=1).order_by("chain").first()
+        AuditLog.objects.filter(id=first.id).delete()
+        self.assertIn(f"chain {first.chain}: seq 1..1 missing", self.problems(full=True))
+
+        # A chain with no rows left at all
+        AuditLog.objects.filter(chain=first.chain).delete()
+        head = AuditChainHead.objects.get(chain=first.chain)
+        problems = self.problems(full=True, chunk_size=2)
+        self.assertTrue(any(p.startswith(f"chain {first.chain}: seq") and p.endswith(f"..{head.seq} missing") for p in problems))
+        self.assertIn(f"chain {first.chain}: row at seq {head.seq} of a checkpoint is missing", problems)
+
+    def test_checkpoints_catch_a_rewritten_chain(self):
+        checked, problems, heads = verify_chains()
+        self.assertEqual((checked, problems), (7, []))
+        self.assertEqual(len(record_checkpoints(heads)), len({r.chain for r in AuditLog.objects.all()}))
+
+        # Later runs only read rows after the checkpoints
+        AuditLog.objects.create(action="OTHER")
+        self.assertEqual(verify_chains()[:2], (1, []))
+
+        row = AuditLog.objects.filter(action="RECORD_ENTRY_CREATE").order_by("seq").first()
+        AuditLog.objects.filter(id=row.id).update(metadata={"a": [9]})
+        self.rewrite_chain_from(AuditLog.objects.get(id=row.id))
+        self.assertIn(
+            f"chain {row.chain}: row at seq ", " ".join(self.problems(full=True, chunk_size=2)),
+        )
+
+        cp = AuditChainCheckpoint.objects.first()
+        AuditChainCheckpoint.objects.filter(id=cp.id).update(row_hash="f" * 64)
+        self.assertIn("bad signature", " ".join(self.problems()))
+
+    def test_deleting_a_user_leaves_their_rows_intact(self):
+        user_id = self.gp.id
+        self.gp.delete()
+        self.assertEqual(AuditLog.objects.filter(user_id=user_id).count(), 3)
+        self.assertEqual(self.problems(full=True), [])
+
+    @override_settings(AUDIT_CHAIN_SHARDS=8)
+    def test_a_transaction_reuses_the_head_it_holds(self):
+        with transaction.atomic():
+            rows = [AuditLog.objects.create(action="OTHER") for _ in range(5)]
+        self.assertEqual(len({row.chain for row in rows}), 1)
+
+    def test_command_fails_on_tampering_and_records_checkpoints(self):
+        out = StringIO()
+        call_command("verify_audit_chain", workers=1, stdout=out)
+        self.assertIn("Verified 7 audit rows", out.getvalue())
+        self.assertTrue(AuditChainCheckpoint.objects.exists())
+
+        AuditLog.objects.create(action="OTHER")
+        AuditLog.objects.filter(action="OTHER").update(ip_address="10.0.0.1")
+        with self.assertRaises(CommandError):
+            call_command("verify_audit_chain", workers=1, stdout=out, stderr=StringIO())
+
+
+class AuditArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER)
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        jan = datetime(2001, 1, 10, 9, tzinfo=dt_timezone.utc)
+        AuditLog.objects.bulk_create(
+            [AuditLog(timestamp=jan + timedelta(hours=n), user=cls.gp, role="GP", action="APPOINTMENT_CREATE") for n in range(4)]
+            + [AuditLog(timestamp=jan + timedelta(days=5, microseconds=123456), action="LOGIN_FAILED")]
+        )
+        cls.recent = AuditLog.objects.create(action="APPOINTMENT_CREATE", user=cls.gp, role="GP")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        overrides = override_settings(AUDIT_ARCHIVE_DIR=self.dir, AUDIT_ARCHIVE_SEGMENT_ROWS=2)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def ids(self, query):
+        resp, ids = self.client.get(reverse("audit_list") + query), []
+        while True:
+            self.assertEqual(resp.status_code, 200)
+            ids += [r["id"] for r in resp.data["results"]]
+            if not resp.data["next"]:
+                return ids
+            resp = self.client.get(resp.data["next"])
+
+    def test_month_moves_into_segments_and_out_of_the_database(self):
+        partitions.ensure_partitions(months_ahead=0, start=date(2001, 1, 1))
+        index = archive_month(date(2001, 1, 1))
+
+        self.assertEqual(index["rows"], 5)
+        self.assertEqual([s["rows"] for s in index["segments"]], [2, 2, 1])
+        self.assertEqual(index["segments"][2]["users"], [None])
+        self.assertFalse(AuditLog.objects.filter(timestamp__year=2001).exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('audits_auditlog_p200101')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+        with gzip.open(os.path.join(self.dir, index["segments"][2]["file"]), "rt") as fh:
+            row = json.loads(fh.readline())
+        self.assertEqual((row["action"], row["timestamp"]), ("LOGIN_FAILED", "2001-01-15T09:00:00.123456+00:00"))
+        self.assertEqual(len(row["row_hash"]), 64)
+
+    def test_list_continues_into_the_archive(self):
+        archive_month(date(2001, 1, 1))
+        self.assertEqual(self.ids(""), [self.recent.id])
+
+        everything = self.ids("?archive=1&page_size=2")
+        self.assertEqual(everything[0], self.recent.id)
+        self.assertEqual(len(everything), 6)
+        resp = self.client.get(reverse("audit_list") + "?archive=1")
+        self.assertEqual(resp.data["results"][-1]["username"], "gp1")
+
+        # Only the segment that can hold the action is opened
+        with mock.patch("audits.archive.gzip.open", wraps=gzip.open) as opened:
+            ids = self.ids("?archive=1&action=LOGIN_FAILED")
+        self.assertEqual((len(ids), opened.call_count), (1, 1))
+        self.assertEqual(len(self.ids(f"?archive=1&user={self.gp.id}&date_to=2001-01-10")), 4)
+
+    def test_interrupted_and_late_rows_are_archived_once(self):
+        with mock.patch("audits.archive.drop_month"):
+            archive_month(date(2001, 1, 1))
+        # The month's rows are still in the database but only listed once
+        self.assertEqual(len(self.ids("?archive=1")), 6)
+
+        late = AuditLog.objects.create(action="REPLAYED", timestamp=datetime(2001, 1, 20, tzinfo=dt_timezone.utc))
+        index = archive_month(date(2001, 1, 1))
+        self.assertEqual((index["rows"], len(index["segments"])), (6, 4))
+        self.assertEqual(index["max_id"], late.id)
+        self.assertFalse(AuditLog.objects.filter(timestamp__year=2001).exists())
+
+    @override_settings(AUDIT_CHAIN_SHARDS=1)
+    def test_chains_still_verify_after_archiving(self):
+        # A replayed row for the old month lands in the middle of its chain
+        before = AuditLog.objects.create(action="APPOINTMENT_CREATE")
+        late = AuditLog.objects.create(action="REPLAYED", timestamp=datetime(2001, 1, 20, tzinfo=dt_timezone.utc))
+        after = AuditLog.objects.create(action="APPOINTMENT_CREATE")
+        self.assertEqual((before.seq + 1, after.seq - 1), (late.seq, late.seq))
+        archive_month(date(2001, 1, 1))
+
+        for chunk_size in (1, 3, 100):
+            self.assertEqual(verify_chains(full=True, chunk_size=chunk_size)[1], [])
+        self.assertTrue(AuditChainGap.objects.filter(chain=late.chain, first_seq__lte=late.seq, last_seq__gte=late.seq).exists())
+
+        # Rows deleted by hand are still reported, next to a gap or alone in their chain
+        AuditLog.objects.filter(id__in=[before.id, self.recent.id]).delete()
+        problems = verify_chains(full=True, chunk_size=1)[1]
+        self.assertIn(f"chain {late.chain}: seq {before.seq}..{before.seq} missing", problems)
+        self.assertIn(f"chain {self.recent.chain}: seq 1..1 missing", problems)
+
+    def test_forged_gaps_are_rejected(self):
+        archive_month(date(2001, 1, 1))
+        AuditChainGap.objects.update(last_seq=F("last_seq") + 1)
+        problems = " ".join(verify_chains(full=True)[1])
+        self.assertIn("bad signature", problems)
+        self.assertIn("missing", problems)
+
+    def test_archived_months_stay_contiguous(self):
+        self.assertEqual(months_to_archive(date(2001, 3, 1)), [date(2001, 1, 1), date(2001, 2, 1)])
+        archive_month(date(2001, 1, 1))
+        archive_month(date(2001, 2, 1))
+        self.assertEqual(AuditArchive().boundary, datetime(2001, 3, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(months_to_archive(date(2001, 5, 1)), [date(2001, 3, 1), date(2001, 4, 1)])
+
+        call_command("prune_audit_partitions", keep_months=12, stdout=open(os.devnull, "w"))
+        self.assertEqual(AuditArchive().months, {})
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+class AuditPatientAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username="manager1", password="pass", role=User.Role.PRACTICE_MANAGER)
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patients = [
+            User.objects.create_user(username=f"patient{n}", password="pass", role=User.Role.PATIENT) for n in range(20)
+        ]
+        start = datetime.now(dt_timezone.utc) - timedelta(days=20)
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                timestamp=start + timedelta(hours=n), user=cls.gp, role="GP", action="RECORD_ENTRY_CREATE",
+                # Ids clear of the entries tests create
+                object_type="clinical_entry", object_id=1_000_000 + n, patient=cls.patients[n % 20],
+                metadata={"patient_id": cls.patients[n % 20].id},
+            )
+            for n in range(400)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE audits_auditlog")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_events_record_the_patient(self):
+        patient = self.patients[0]
+        self.client.force_authenticate(self.gp)
+        resp = self.client.post(
+            reverse("record_entries", args=[MedicalRecord.objects.get(patient=patient).id]),
+            {"type": "NOTE", "title": "t", "content": "c"}, format="json",
+        )
+        self.assertEqual(resp.status_code, 201)
+        row = AuditLog.objects.get(action="RECORD_ENTRY_CREATE", object_id=resp.data["id"])
+        self.assertEqual((row.patient_id, row.metadata["patient_id"]), (patient.id, patient.id))
+        self.assertIn(row.id, AuditLog.objects.filter(patient=patient).values_list("id", flat=True))
+
+        # Appointment events get the patient from the object, into metadata too
+        row = log_events(None, [{"action": "APPOINTMENT_CREATE", "obj": Appointment(patient=patient)}])[0]
+        self.assertEqual((row.patient_id, row.metadata["patient_id"]), (patient.id, patient.id))
+
+    def test_access_history_endpoint(self):
+        patient = self.patients[3]
+        url = reverse("audit_patient_access", args=[patient.id])
+        resp = self.client.get(url + "?page_size=100")
+        self.assertEqual(resp.status_code, 200)
+        expected = list(
+            AuditLog.objects.filter(metadata__patient_id=patient.id)
+            .order_by("-timestamp", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual([r["id"] for r in resp.data["results"]], expected)
+        self.assertEqual(resp.data["results"][0]["username"], "gp1")
+
+        listed = self.client.get(reverse("audit_list") + f"?patient={patient.id}&page_size=100")
+        self.assertEqual([r["id"] for r in listed.data["results"]], expected)
+
+        self.client.force_authenticate(self.gp)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_history_is_one_index_range(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+        plan = AuditLog.objects.filter(patient=self.patients[3]).order_by("-timestamp", "-id")[:50].explain()
+        self.assertIn("patient_id_timestamp_id", plan)
+        self.assertNotRegex(plan, r"(^|->)\s*(Incremental )?Sort\s+\(")
+
+    def test_patient_column_is_checked_against_the_hashed_metadata(self):
+        row = AuditLog.objects.first()
+        AuditLog.objects.filter(id=row.id).update(patient=self.patients[(self.patients.index(row.patient) + 1) % 20])
+        self.assertIn(
+            f"row {row.id} has a patient_id that differs from its metadata", " ".join(verify_chains(full=True)[1]),
+        )
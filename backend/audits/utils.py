@@ -1,11 +1,16 @@
+from django.utils import timezone
+
+from .buffer import enqueue, is_buffered
+
+
 def get_client_ip(request) -> str:
     # If you later add a reverse proxy, you can expand this to check X-Forwarded-For.
     return request.META.get("REMOTE_ADDR", "") if request else ""
 
 
-def log_event(request, action: str, obj=None, object_type: str = "", metadata: dict | None = None):
+def build_event(request, action: str, obj=None, object_type: str = "", metadata: dict | None = None):
     """
-    Minimal audit logger. Call from API views after successful actions.
+    Unsaved AuditLog row for an action (shared by log_event and log_events).
     """
     from .models import AuditLog  # local import avoids circular imports
 
@@ -24,12 +29,48 @@ def log_event(request, action: str, obj=None, object_type: str = "", metadata: d
     else:
         object_id = None
 
-    AuditLog.objects.create(
+    # The patient goes into metadata (covered by the row hash) and the
+    # indexed patient column
+    metadata = dict(metadata or {})
+    patient_id = metadata.get("patient_id") or getattr(obj, "patient_id", None)
+    if patient_id:
+        metadata["patient_id"] = patient_id
+
+    return AuditLog(
+        timestamp=timezone.now(),
         user=audit_user,
         role=role,
         action=action,
         object_type=object_type or "",
         object_id=object_id,
-        metadata=metadata or {},
+        patient_id=patient_id or None,
+        metadata=metadata,
         ip_address=get_client_ip(request),
     )
+
+
+def log_event(request, action: str, obj=None, object_type: str = "", metadata: dict | None = None):
+    """
+    Minimal audit logger. Call from API views after successful actions.
+    With AUDIT_LOG_MODE=buffered the row is queued and written after commit.
+    """
+    row = build_event(request, action, obj=obj, object_type=object_type, metadata=metadata)
+    if is_buffered():
+        enqueue([row])
+    else:
+        row.save()
+
+
+def log_events(request, events):
+    """
+    Batch audit logger: events is an iterable of dicts with log_event's keyword
+    arguments (action, obj, object_type, metadata). One INSERT for all rows.
+    """
+    from .models import AuditLog  # local import avoids circular imports
+
+    rows = [build_event(request, **event) for event in events]
+    if rows and is_buffered():
+        enqueue(rows)
+    elif rows:
+        AuditLog.objects.bulk_create(rows)
+    return rows
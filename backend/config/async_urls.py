@@ -0,0 +1,16 @@
+"""
+Async (ASGI) variants of the read-heavy endpoints, mounted under /api/async/.
+Same auth, permissions and response shapes as the DRF views they mirror.
+"""
+from django.urls import path
+
+from accounts.async_views import AsyncMeView
+from appointments.async_views import AsyncAppointmentListView, AsyncAvailabilityView
+from records.async_views import AsyncRecordEntriesView
+
+urlpatterns = [
+    path("accounts/me/", AsyncMeView.as_view(), name="async_me"),
+    path("appointments/", AsyncAppointmentListView.as_view(), name="async_appointment_list"),
+    path("appointments/availability/", AsyncAvailabilityView.as_view(), name="async_appointment_availability"),
+    path("records/<int:record_id>/entries/", AsyncRecordEntriesView.as_view(), name="async_record_entries"),
+]
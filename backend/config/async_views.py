@@ -0,0 +1,66 @@
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+
+async def authenticate_jwt(request, allow_query_token=False):
+    """
+    User for the request's Bearer token (or ?token= when allowed), else None.
+    Same validation as the DRF views' JWTAuthentication.
+    """
+    user, _ = await authenticate_jwt_token(request, allow_query_token)
+    return user
+
+
+async def authenticate_jwt_token(request, allow_query_token=False):
+    """
+    authenticate_jwt, also returning the validated token (None, None when
+    authentication fails).
+    """
+    raw = ""
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        raw = header[7:]
+    elif allow_query_token:
+        raw = request.GET.get("token", "")
+    if not raw:
+        return None, None
+
+    auth = JWTAuthentication()
+    try:
+        validated = auth.get_validated_token(raw.encode())
+        return await sync_to_async(auth.get_user)(validated), validated
+    except (InvalidToken, AuthenticationFailed):
+        return None, None
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+
+class AsyncAPIView(View):
+    """
+    Base for async (ASGI) read endpoints mirroring a DRF view.
+
+    Authenticates with the JWT like the DRF views, exposes request.query_params
+    so query-parsing helpers written for DRF requests can be reused, and turns
+    DRF exceptions (ValidationError, PermissionDenied, NotFound...) into the
+    same JSON error bodies DRF would send.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await authenticate_jwt(request)
+        if user is None:
+            return json_response({"detail": "Authentication credentials were not provided."}, status=401)
+        request.user = user
+        request.query_params = request.GET
+
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+            return json_response(data, status=exc.status_code)
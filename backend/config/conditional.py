@@ -0,0 +1,91 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / If-None-Match support for DRF generic list and detail views.
+
+    Validators come from cheap metadata of what the caller would see, not
+    from the rendered body:
+      - list:   count + max(last_modified_field) over the scoped, filtered queryset
+      - detail: pk + the object's last_modified_field
+
+    plus the caller's id/role and the query string, so users and pages never
+    share a tag. A match returns 304 before anything is serialised.
+
+    List responses only carry an ETag: a deleted row changes the count but not
+    the max timestamp, so Last-Modified alone could wrongly validate a list.
+    """
+    last_modified_field = "updated_at"
+
+    # ----- validators -----
+
+    def compute_etag(self, *parts) -> str:
+        u = self.request.user
+        key = "|".join(str(p) for p in (
+            u.pk, getattr(u, "role", ""), self.request.META.get("QUERY_STRING", ""), *parts,
+        ))
+        # Weak: equal tags mean equivalent content, not byte-identical JSON
+        return 'W/"%s"' % hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def list_validators(self, queryset):
+        agg = queryset.aggregate(count=Count("pk"), last=Max(self.last_modified_field))
+        last = agg["last"]
+        return self.compute_etag("list", agg["count"], last.isoformat() if last else "-")
+
+    def object_validators(self, obj):
+        last = getattr(obj, self.last_modified_field)
+        return self.compute_etag("obj", obj.pk, last.isoformat() if last else "-"), last
+
+    # ----- responses -----
+
+    def not_modified(self, request, etag, last_modified=None):
+        return get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+
+    def with_validators(self, response, etag, last_modified=None):
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        # Clients may keep a private copy but must revalidate on every use
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+    # ----- DRF hooks -----
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        etag = self.list_validators(queryset)
+        not_modified = self.not_modified(request, etag)
+        if not_modified is not None:
+            return self.with_validators(not_modified, etag)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(serializer.data)
+        return self.with_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+
+        etag, last = self.object_validators(instance)
+        not_modified = self.not_modified(request, etag, last)
+        if not_modified is not None:
+            return self.with_validators(not_modified, etag, last)
+
+        serializer = self.get_serializer(instance)
+        return self.with_validators(Response(serializer.data), etag, last)
@@ -0,0 +1,56 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+
+def parse_date_param(params, name):
+    """
+    Optional YYYY-MM-DD query param as a date (None when absent).
+    """
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        d = parse_date(raw)
+    except ValueError:
+        d = None
+    if not d:
+        raise ValidationError({name: "Invalid date. Use YYYY-MM-DD."})
+    return d
+
+
+def start_of_day(d):
+    return timezone.make_aware(datetime.combine(d, time.min))
+
+
+def filter_date_range(qs, field, params, from_param="date_from", to_param="date_to"):
+    """
+    Apply ?date_from / ?date_to (inclusive days, current time zone) to a
+    datetime column as a half-open range:
+
+        field >= start of date_from  AND  field < start of (date_to + 1 day)
+
+    Unlike field__date__gte/__lte this compares the bare column, so a btree
+    index on `field` (or with `field` after equality columns) can serve it.
+    """
+    since, until = date_range_bounds(params, from_param, to_param)
+    if since:
+        qs = qs.filter(**{f"{field}__gte": since})
+    if until:
+        qs = qs.filter(**{f"{field}__lt": until})
+    return qs
+
+
+def date_range_bounds(params, from_param="date_from", to_param="date_to"):
+    """
+    (start of date_from, start of the day after date_to) as aware datetimes,
+    each None when its param is absent.
+    """
+    date_from = parse_date_param(params, from_param)
+    date_to = parse_date_param(params, to_param)
+    return (
+        start_of_day(date_from) if date_from else None,
+        start_of_day(date_to + timedelta(days=1)) if date_to else None,
+    )
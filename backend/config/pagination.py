@@ -0,0 +1,158 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination on (ordering field, id).
+
+    The cursor carries the last row's (value, id), and the next page is the
+    rows strictly after it in that order. Page N therefore costs the same index
+    range scan as page 1: no OFFSET and no COUNT(*). Only a `next` link is
+    returned ("load more" style).
+
+    Subclasses set `ordering` to a single field, e.g. "-start_time"; id is
+    always the tie-breaker, in the same direction.
+    """
+    ordering = "-id"
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor."
+
+    # ----- ordering helpers -----
+
+    @property
+    def descending(self) -> bool:
+        return self.ordering.startswith("-")
+
+    @property
+    def key_field(self) -> str:
+        return self.ordering.lstrip("-")
+
+    def order_by_fields(self):
+        sign = "-" if self.descending else ""
+        if self.key_field == "id":
+            return [f"{sign}id"]
+        return [f"{sign}{self.key_field}", f"{sign}id"]
+
+    def seek_filter(self, value, pk) -> Q:
+        """
+        Rows strictly after (value, pk) in page order. The leading inclusive
+        bound keeps the predicate a plain range on the key column, so the
+        planner can use an index on (key, id).
+        """
+        op, op_eq = ("lt", "lte") if self.descending else ("gt", "gte")
+        if self.key_field == "id":
+            return Q(**{f"id__{op}": pk})
+        key = self.key_field
+        return Q(**{f"{key}__{op_eq}": value}) & (
+            Q(**{f"{key}__{op}": value}) | Q(**{key: value, f"id__{op}": pk})
+        )
+
+    # ----- cursor encoding -----
+
+    def encode_cursor(self, obj) -> str:
+        if self.key_field == "id":
+            payload = [None, obj.pk]
+        else:
+            field = obj._meta.get_field(self.key_field)
+            payload = [field.value_to_string(obj), obj.pk]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    def decode_cursor(self, model, raw):
+        try:
+            padded = raw + "=" * (-len(raw) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            pk = int(pk)
+            if self.key_field != "id":
+                value = model._meta.get_field(self.key_field).to_python(value)
+                if value is None:
+                    raise ValueError
+        except (TypeError, ValueError, binascii.Error, UnicodeDecodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    # ----- DRF pagination API -----
+
+    def get_page_size(self, request) -> int:
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                size = int(raw)
+            except ValueError:
+                size = 0
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.size = self.get_page_size(request)
+
+        queryset = self.apply_cursor(queryset, request.query_params.get(self.cursor_query_param))
+        return self.take_page(list(queryset[: self.size + 1]))
+
+    def apply_cursor(self, queryset, raw_cursor):
+        """
+        Order the queryset and seek past the cursor (no query is run).
+        """
+        queryset = queryset.order_by(*self.order_by_fields())
+        if raw_cursor:
+            value, pk = self.decode_cursor(queryset.model, raw_cursor)
+            queryset = queryset.filter(self.seek_filter(value, pk))
+        return queryset
+
+    def take_page(self, rows):
+        """
+        rows holds up to page size + 1 items; the extra one only signals a next page.
+        """
+        self.has_next = len(rows) > self.size
+        self.page = rows[: self.size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opaque cursor taken from the previous page's `next` link.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": f"Items per page (default {self.page_size}, max {self.max_page_size}).",
+                "schema": {"type": "integer"},
+            },
+        ]
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "rest_framework",
     "rest_framework_simplejwt",
     "drf_spectacular",
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     "appointments",
     "records",
     "audits",
+    "idempotency",
 
 
 ]
@@ -100,6 +102,59 @@ DATABASES = {
 }
 
 
+# The local-memory default is per process: with several workers, set a shared
+# backend (DatabaseCache after `manage.py createcachetable`, or Redis) so
+# availability invalidations reach every worker.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", "gp-system"),
+    }
+}
+
+# Computed availability is invalidated on appointment writes, so this is only a safety net.
+AVAILABILITY_CACHE_TIMEOUT = int(os.getenv("AVAILABILITY_CACHE_TIMEOUT", "3600"))
+
+# Live appointment events (SSE): "inprocess" for a single process, "postgres"
+# (LISTEN/NOTIFY) when several workers serve the API.
+APPOINTMENT_EVENTS_BACKEND = os.getenv("APPOINTMENT_EVENTS_BACKEND", "inprocess")
+
+# How long a stored Idempotency-Key response is replayed to retries.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+
+# Audit log writes: "sync" saves each row in the request's transaction;
+# "buffered" queues rows after commit and bulk-inserts them at request end,
+# every AUDIT_FLUSH_INTERVAL_SECONDS or at AUDIT_BUFFER_SIZE rows. Rows that
+# can't be inserted go to AUDIT_SPOOL_PATH (load with replay_audit_spool).
+AUDIT_LOG_MODE = os.getenv("AUDIT_LOG_MODE", "sync")
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "2"))
+AUDIT_SPOOL_PATH = os.getenv("AUDIT_SPOOL_PATH", str(BASE_DIR / "audit_spool.ndjson"))
+
+# audits_auditlog is partitioned by month: partitions are created this many
+# months ahead, and prune_audit_partitions drops months older than the
+# retention window.
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", "3"))
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "96"))
+
+# archive_audit_logs moves months older than AUDIT_ARCHIVE_AFTER_MONTHS out
+# of the database into gzip NDJSON segments under AUDIT_ARCHIVE_DIR (still
+# readable through /api/audits/?archive=1, and pruned at retention).
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", str(BASE_DIR / "audit_archive"))
+AUDIT_ARCHIVE_AFTER_MONTHS = int(os.getenv("AUDIT_ARCHIVE_AFTER_MONTHS", "24"))
+AUDIT_ARCHIVE_SEGMENT_ROWS = int(os.getenv("AUDIT_ARCHIVE_SEGMENT_ROWS", "50000"))
+
+# rollup_audit_logs leaves audit rows younger than this for the next run, so
+# a transaction still in flight can't commit below the high-water mark.
+AUDIT_ROLLUP_LAG_SECONDS = int(os.getenv("AUDIT_ROLLUP_LAG_SECONDS", "300"))
+
+# Audit rows are hash-chained across this many independent chains, so
+# concurrent writers don't wait on one lock. Checkpoints recorded by
+# verify_audit_chain are signed with AUDIT_CHECKPOINT_KEY; keep it out of
+# the database's reach (it defaults to SECRET_KEY).
+AUDIT_CHAIN_SHARDS = int(os.getenv("AUDIT_CHAIN_SHARDS", "8"))
+AUDIT_CHECKPOINT_KEY = os.getenv("AUDIT_CHECKPOINT_KEY", SECRET_KEY)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -39,6 +39,9 @@ urlpatterns = [
     path("api/records/", include("records.api_urls")),
     path("api/audits/", include("audits.api_urls")),
 
+    # Async (ASGI) read endpoints
+    path("api/async/", include("config.async_urls")),
+
 
    
 
@@ -9,8 +9,24 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+if settings.DEBUG:
+    # Serve admin/static files in development, as runserver does
+    from django.contrib.staticfiles.handlers import StaticFilesHandler
+
+    application = StaticFilesHandler(application)
+
+if os.getenv("TRUST_PROXY_HEADERS") == "1":
+    # Behind the Compose proxy, which sets X-Real-IP; audit rows record REMOTE_ADDR
+    django_application = application
+
+    def application(environ, start_response):
+        if environ.get("HTTP_X_REAL_IP"):
+            environ["REMOTE_ADDR"] = environ["HTTP_X_REAL_IP"]
+        return django_application(environ, start_response)
@@ -15,6 +15,11 @@ function clearToken(){
   localStorage.removeItem("me_id");
 }
 
+function newIdempotencyKey(){
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 async function apiFetch(path, opts = {}){
   const headers = opts.headers ? {...opts.headers} : {};
   headers["Accept"] = "application/json";
@@ -27,11 +32,26 @@ async function apiFetch(path, opts = {}){
     headers["Content-Type"] = "application/json";
   }
 
-  const res = await fetch(API_BASE + path, {
-    method: opts.method || "GET",
-    headers,
-    body: hasBody ? (opts.body instanceof FormData ? opts.body : JSON.stringify(opts.body)) : undefined,
-  });
+  // opts.idempotent: send one Idempotency-Key for every attempt so the server
+  // replays the first result instead of creating a duplicate, and retry
+  // network failures / gateway errors a couple of times.
+  const attempts = opts.idempotent ? 3 : 1;
+  if (opts.idempotent) headers["Idempotency-Key"] = newIdempotencyKey();
+
+  let res;
+  for (let attempt = 1; ; attempt++) {
+    try {
+      res = await fetch(API_BASE + path, {
+        method: opts.method || "GET",
+        headers,
+        body: hasBody ? (opts.body instanceof FormData ? opts.body : JSON.stringify(opts.body)) : undefined,
+      });
+      if (![502, 503, 504].includes(res.status) || attempt >= attempts) break;
+    } catch (e) {
+      if (attempt >= attempts) throw e;
+    }
+    await new Promise(r => setTimeout(r, 500 * 2 ** (attempt - 1)));
+  }
 
   let data = null;
   const ct = res.headers.get("content-type") || "";
@@ -52,6 +72,12 @@ async function apiFetch(path, opts = {}){
   return data;
 }
 
+// Paginated endpoints return {next, results}; `next` is an absolute URL.
+function pagePath(nextUrl){
+  const u = new URL(nextUrl, window.location.origin);
+  return u.pathname + u.search;
+}
+
 async function fetchMe(){
   const me = await apiFetch("/api/accounts/me/");
   localStorage.setItem("me_role", me.role || "");
@@ -79,6 +79,61 @@ function renderAppointmentsTable(containerId, appts, { showPatient=false, showGp
   `;
 }
 
+// Secret .ics URL for the signed-in GP/patient, copied for pasting into a calendar app.
+// reset: issue a new URL and revoke the old ones (e.g. after it leaked).
+async function copyCalendarFeed(reset = false){
+  if (reset && !window.confirm("Calendars subscribed with the old feed URL will stop updating. Continue?")) return;
+  try{
+    const data = await apiFetch("/api/appointments/feed/", reset ? { method:"POST" } : {});
+    try{
+      await navigator.clipboard.writeText(data.url);
+      showToast("Calendar feed URL copied");
+    }catch(_){
+      window.prompt("Calendar feed URL", data.url);
+    }
+  }catch(e){
+    showToast(e.message, "err");
+  }
+}
+
+// Live appointment changes (SSE). onChange is debounced so a burst of events
+// (e.g. a bulk booking) causes a single reload.
+function subscribeAppointmentEvents(onChange){
+  let timer = null;
+  const changed = () => {
+    clearTimeout(timer);
+    timer = setTimeout(onChange, 500);
+  };
+
+  const open = () => {
+    const es = new EventSource(`${API_BASE}/api/appointments/events/?token=${encodeURIComponent(getToken())}`);
+    es.addEventListener("appointment", changed);
+    es.addEventListener("resync", changed);
+    es.addEventListener("expired", () => {
+      // The server closes the stream when the token it was opened with expires
+      es.close();
+      setTimeout(open, 5000);
+    });
+    es.onerror = () => {
+      // A rejected (e.g. expired) token closes the stream for good; retry with the current one
+      if (es.readyState === EventSource.CLOSED) setTimeout(open, 5000);
+    };
+  };
+  if (window.EventSource) open();
+}
+
+function renderLoadMore(containerId, nextUrl, onMore){
+  const el = $(containerId);
+  if (!el || !nextUrl) return;
+
+  el.insertAdjacentHTML("beforeend", `
+    <div class="actions-inline" style="margin-top:10px">
+      <button class="btn secondary" data-load-more="1">Load more</button>
+    </div>
+  `);
+  el.querySelector("button[data-load-more]").onclick = onMore;
+}
+
 function renderAvailability(containerId, data, onPickSlot){
   const el = $(containerId);
   if (!el) return;
@@ -155,7 +210,9 @@ function renderEntriesTable(containerId, entries){
       <td>${e.id}</td>
       <td>${escapeHtml(e.type)}</td>
       <td>${escapeHtml(e.title || "")}</td>
-      <td>${escapeHtml(e.content || "")}</td>
+      <td data-entry-content="${e.id}">${"content" in e
+        ? escapeHtml(e.content || "")
+        : `<button class="btn secondary" data-show-entry="${e.id}">Show</button>`}</td>
       <td>${escapeHtml(e.created_by_username || e.created_by || "")}</td>
       <td>${fmtDate(e.created_at)}</td>
     </tr>
@@ -171,6 +228,23 @@ function renderEntriesTable(containerId, entries){
       <tbody>${rows}</tbody>
     </table>
   `;
+
+  // Summary rows (?summary=1) carry no content; fetch it when the entry is opened
+  el.querySelectorAll("button[data-show-entry]").forEach(btn => {
+    btn.onclick = async () => {
+      const id = btn.getAttribute("data-show-entry");
+      btn.disabled = true;
+      try{
+        const entry = await apiFetch(`/api/records/entries/${encodeURIComponent(id)}/`);
+        const e = entries.find(x => String(x.id) === id);
+        if (e) e.content = entry.content;
+        el.querySelector(`td[data-entry-content="${id}"]`).textContent = entry.content || "";
+      }catch(err){
+        btn.disabled = false;
+        showToast(err.message, "err");
+      }
+    };
+  });
 }
 
 function renderAuditTable(containerId, logs){
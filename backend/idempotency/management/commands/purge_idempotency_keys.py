@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from idempotency.mixins import key_ttl
+from idempotency.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL_HOURS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - key_ttl()
+        deleted = 0
+        while True:
+            # Small deletes keep each transaction (and its locks) short
+            ids = list(
+                IdempotencyKey.objects.filter(created_at__lt=cutoff)
+                .values_list("id", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys."))
@@ -0,0 +1,97 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = 422
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = "idempotency_key_reused"
+
+
+def key_ttl() -> timedelta:
+    return timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def request_fingerprint(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """
+    Insert the key row inside the caller's transaction. Returns (row, None)
+    when this request owns the key, or (None, stored_row) for a retry.
+
+    A concurrent request with the same key blocks on the unique index until
+    the first one commits, then finds its stored response.
+    """
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                row = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, status_code=0,
+                )
+            return row, None
+        except IntegrityError:
+            stored = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if stored is None:
+                continue  # first request rolled back; try to take the key again
+            if stored.created_at < timezone.now() - key_ttl():
+                stored.delete()
+                continue
+            if stored.fingerprint != fingerprint:
+                raise IdempotencyKeyReused()
+            return None, stored
+    raise IdempotencyKeyReused("Idempotency-Key is busy, retry the request.")
+
+
+class IdempotentCreateMixin:
+    """
+    Optional Idempotency-Key header for POST on generic create views.
+
+    The first request with a key runs normally and its response (success or
+    4xx) is stored in the same transaction as its writes. Retries with that
+    key get the stored response back, marked `Idempotent-Replayed: true`,
+    without validating, inserting or logging again. A server error stores
+    nothing, so the retry runs for real.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({HEADER: f"Must be at most {MAX_KEY_LENGTH} characters."})
+
+        with transaction.atomic():
+            row, stored = claim_key(request.user, key, request_fingerprint(request))
+            if stored is not None:
+                return Response(
+                    stored.response_body,
+                    status=stored.status_code,
+                    headers={"Idempotent-Replayed": "true"},
+                )
+
+            try:
+                with transaction.atomic():
+                    response = super().create(request, *args, **kwargs)
+            except APIException as exc:
+                # Writes from the failed attempt are rolled back; its error response is kept
+                response = self.handle_exception(exc)
+
+            row.status_code = response.status_code
+            row.response_body = response.data
+            row.save(update_fields=["status_code", "response_body"])
+        return response
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response to a POST sent with an Idempotency-Key header, replayed to
+    retries of the same request. Rows older than IDEMPOTENCY_KEY_TTL are
+    ignored and removed by `manage.py purge_idempotency_keys`.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    key = models.CharField(max_length=255)
+    # sha256 of method, path and body: the same key with a different request is an error
+    fingerprint = models.CharField(max_length=64)
+
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="idempotency_user_key_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["created_at"], name="idempotency_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} -> {self.status_code}"
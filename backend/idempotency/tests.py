@@ -0,0 +1,105 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from appointments.models import Appointment
+from audits.models import AuditLog
+from idempotency.models import IdempotencyKey
+from records.models import ClinicalEntry, MedicalRecord
+
+
+class IdempotencyKeyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # GP first so the patient gets auto-assigned
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.record = MedicalRecord.objects.get(patient=cls.patient)
+
+        start = timezone.now().replace(microsecond=0) + timedelta(days=3)
+        cls.booking = {
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=30)).isoformat(),
+            "reason": "checkup",
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, url, body, key, user):
+        self.client.force_authenticate(user)
+        return self.client.post(url, body, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_booking_is_created_once(self):
+        url = reverse("appointment_list_create")
+        first = self.post(url, self.booking, "k-1", self.patient)
+        self.assertEqual(first.status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post(url, self.booking, "k-1", self.patient)
+        # Only the key lookup ran: no overlap check, insert or audit write
+        self.assertFalse(any("appointments_appointment" in q["sql"] for q in queries))
+        self.assertFalse(any("audits_auditlog" in q["sql"] for q in queries))
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.data["id"], first.data["id"])
+
+        self.assertEqual(Appointment.objects.filter(patient=self.patient).count(), 1)
+        self.assertEqual(AuditLog.objects.filter(action="APPOINTMENT_CREATE").count(), 1)
+
+    def test_retried_entry_is_created_once(self):
+        url = reverse("record_entries", args=[self.record.id])
+        body = {"type": "NOTE", "title": "t", "content": "c"}
+        self.assertEqual(self.post(url, body, "e-1", self.gp).status_code, 201)
+        self.assertEqual(self.post(url, body, "e-1", self.gp).status_code, 201)
+        self.assertEqual(ClinicalEntry.objects.filter(record=self.record).count(), 1)
+
+    def test_error_response_is_replayed(self):
+        url = reverse("record_entries", args=[self.record.id])
+        body = {"type": "BOGUS", "content": "c"}
+        first = self.post(url, body, "e-2", self.gp)
+        self.assertEqual(first.status_code, 400)
+
+        retry = self.post(url, body, "e-2", self.gp)
+        self.assertEqual(retry.status_code, 400)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+    def test_key_reused_with_different_body(self):
+        url = reverse("appointment_list_create")
+        self.post(url, self.booking, "k-2", self.patient)
+        resp = self.post(url, {**self.booking, "reason": "other"}, "k-2", self.patient)
+        self.assertEqual(resp.status_code, 422)
+
+    def test_keys_are_per_user_and_expire(self):
+        url = reverse("record_entries", args=[self.record.id])
+        body = {"type": "NOTE", "title": "t", "content": "c"}
+        self.post(url, body, "shared", self.gp)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        resp = self.post(url, body, "shared", self.gp)
+        self.assertFalse(resp.has_header("Idempotent-Replayed"))
+        self.assertEqual(ClinicalEntry.objects.filter(record=self.record).count(), 2)
+
+    def test_without_header_nothing_is_stored(self):
+        self.client.force_authenticate(self.patient)
+        self.client.post(reverse("appointment_list_create"), self.booking, format="json")
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_purge_command(self):
+        self.post(reverse("appointment_list_create"), self.booking, "old", self.patient)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.post(reverse("record_entries", args=[self.record.id]), {"type": "NOTE", "content": "c"}, "new", self.gp)
+
+        out = StringIO()
+        call_command("purge_idempotency_keys", stdout=out)
+        self.assertIn("Deleted 1", out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"])
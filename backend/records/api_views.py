@@ -2,13 +2,38 @@ from rest_framework import generics
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, NotFound
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+
 from audits.utils import log_event
+from config.conditional import ConditionalGetMixin
+from config.exports import parse_bool_flag
+from config.pagination import KeysetPagination
+from idempotency.mixins import IdempotentCreateMixin
 
 
 
 from accounts.models import User
 from .models import MedicalRecord, ClinicalEntry
-from .serializers import MedicalRecordSerializer, ClinicalEntrySerializer, gp_is_assigned_to_patient
+from .serializers import (
+    ClinicalEntrySerializer, ClinicalEntrySummarySerializer, MedicalRecordSerializer, gp_is_assigned_to_patient,
+)
+
+
+class ClinicalEntryPagination(KeysetPagination):
+    # Newest first, as before; each page is a seek on entry_record_created_idx
+    ordering = "-created_at"
+    page_size = 50
+    max_page_size = 200
+
+
+def is_summary(request) -> bool:
+    return request.method == "GET" and parse_bool_flag(request.query_params, "summary")
+
+
+def entries_for(record, summary=False):
+    qs = ClinicalEntry.objects.filter(record=record).select_related("created_by")
+    # Long notes are stored out of line (TOAST); summaries never read them
+    return qs.defer("content") if summary else qs
 
 
 def can_read_record(user: User, record: MedicalRecord) -> bool:
@@ -27,7 +52,7 @@ def can_read_record(user: User, record: MedicalRecord) -> bool:
     return False  # receptionist/manager denied
 
 
-class MedicalRecordListView(generics.ListAPIView):
+class MedicalRecordListView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = MedicalRecordSerializer
 
     def get_queryset(self):
@@ -47,7 +72,7 @@ class MedicalRecordListView(generics.ListAPIView):
         raise PermissionDenied("You do not have access to medical records.")
 
 
-class MedicalRecordMeView(generics.RetrieveAPIView):
+class MedicalRecordMeView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = MedicalRecordSerializer
 
     def get_object(self):
@@ -61,7 +86,7 @@ class MedicalRecordMeView(generics.RetrieveAPIView):
             return MedicalRecord.objects.create(patient=u)
 
 
-class MedicalRecordDetailView(generics.RetrieveAPIView):
+class MedicalRecordDetailView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = MedicalRecordSerializer
     queryset = MedicalRecord.objects.select_related("patient")
 
@@ -72,8 +97,21 @@ class MedicalRecordDetailView(generics.RetrieveAPIView):
         return record
 
 
-class RecordEntriesListCreateView(generics.ListCreateAPIView):
+@extend_schema(
+    methods=["GET"],
+    parameters=[
+        OpenApiParameter(
+            name="summary",
+            type=OpenApiTypes.BOOL,
+            location=OpenApiParameter.QUERY,
+            required=False,
+            description="Leave out `content` (fetch it per entry from /api/records/entries/<id>/)."
+        ),
+    ],
+)
+class RecordEntriesListCreateView(IdempotentCreateMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = ClinicalEntrySerializer
+    pagination_class = ClinicalEntryPagination
 
     def get_record(self) -> MedicalRecord:
         try:
@@ -87,8 +125,10 @@ class RecordEntriesListCreateView(generics.ListCreateAPIView):
 
 
     def get_queryset(self):
-        record = self.get_record()
-        return ClinicalEntry.objects.filter(record=record).select_related("created_by")
+        return entries_for(self.get_record(), summary=is_summary(self.request))
+
+    def get_serializer_class(self):
+        return ClinicalEntrySummarySerializer if is_summary(self.request) else ClinicalEntrySerializer
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -111,7 +151,7 @@ class RecordEntriesListCreateView(generics.ListCreateAPIView):
 
 
 
-class ClinicalEntryDetailView(generics.RetrieveUpdateAPIView):
+class ClinicalEntryDetailView(ConditionalGetMixin, generics.RetrieveUpdateAPIView):
     serializer_class = ClinicalEntrySerializer
     queryset = ClinicalEntry.objects.select_related("record", "record__patient", "created_by")
 
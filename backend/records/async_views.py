@@ -0,0 +1,41 @@
+from rest_framework.exceptions import NotFound, PermissionDenied
+
+from config.async_views import AsyncAPIView, json_response
+
+from .api_views import ClinicalEntryPagination, can_read_record, entries_for, is_summary
+from .models import MedicalRecord
+from .serializers import ClinicalEntrySerializer, ClinicalEntrySummarySerializer
+
+
+class AsyncRecordEntriesView(AsyncAPIView):
+    """
+    GET /api/async/records/<record_id>/entries/  (read side of RecordEntriesListCreateView,
+    same keyset pages and ?summary=1)
+    """
+
+    async def get(self, request, record_id):
+        try:
+            # Everything can_read_record looks at, so the check needs no further queries
+            record = await (
+                MedicalRecord.objects
+                .select_related("patient__patient_profile__assigned_gp")
+                .aget(pk=record_id)
+            )
+        except MedicalRecord.DoesNotExist:
+            raise NotFound("Medical record not found.")
+
+        if not can_read_record(request.user, record):
+            raise PermissionDenied("You do not have access to this record.")
+
+        pagination = ClinicalEntryPagination()
+        pagination.request = request
+        pagination.size = pagination.get_page_size(request)
+
+        summary = is_summary(request)
+        qs = pagination.apply_cursor(
+            entries_for(record, summary=summary), request.query_params.get(pagination.cursor_query_param)
+        )
+        page = pagination.take_page([entry async for entry in qs[: pagination.size + 1]])
+        serializer_class = ClinicalEntrySummarySerializer if summary else ClinicalEntrySerializer
+        data = serializer_class(page, many=True, context={"request": request, "record": record}).data
+        return json_response({"next": pagination.get_next_link(), "results": data})
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-16 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clinicalentry',
+            index=models.Index(fields=['record', 'created_at', 'id'], name='entry_record_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='clinicalentry',
+            name='record',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='records.medicalrecord'),
+        ),
+    ]
@@ -25,6 +25,8 @@ class ClinicalEntry(models.Model):
         MedicalRecord,
         on_delete=models.CASCADE,
         related_name="entries",
+        # Covered by entry_record_created_idx
+        db_index=False,
     )
     type = models.CharField(max_length=32, choices=EntryType.choices)
     title = models.CharField(max_length=255, blank=True, default="")
@@ -43,6 +45,11 @@ class ClinicalEntry(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        # A record's entries, newest first, is one range scan: every list
+        # page seeks on (created_at, id) within the record
+        indexes = [
+            models.Index(fields=["record", "created_at", "id"], name="entry_record_created_idx"),
+        ]
 
     def __str__(self):
         return f"ClinicalEntry({self.type}) for {self.record.patient.username}"
@@ -73,3 +73,26 @@ class ClinicalEntrySerializer(serializers.ModelSerializer):
             created_by=request.user,
             **validated_data,
         )
+
+
+class ClinicalEntrySummarySerializer(serializers.ModelSerializer):
+    """
+    List rows without `content`; clients fetch an entry's content from
+    entry_detail when it is opened.
+    """
+    created_by_id = serializers.IntegerField(source="created_by.id", read_only=True)
+    created_by_username = serializers.CharField(source="created_by.username", read_only=True)
+
+    class Meta:
+        model = ClinicalEntry
+        fields = [
+            "id",
+            "record",
+            "type",
+            "title",
+            "created_by_id",
+            "created_by_username",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
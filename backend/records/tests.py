@@ -1,8 +1,12 @@
+import json
 from datetime import datetime, timedelta
 
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+
+from django.test import AsyncClient, TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
 from accounts.models import User
 from records.models import MedicalRecord, ClinicalEntry
@@ -88,3 +92,158 @@ class RecordsAPITests(TestCase):
             format="json",
         )
         self.assertEqual(resp.status_code, 403)
+
+
+class RecordsConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.record = MedicalRecord.objects.get(patient=cls.patient)
+        cls.entry = ClinicalEntry.objects.create(
+            record=cls.record, type="NOTE", title="t", content="c", created_by=cls.gp
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.gp)
+
+    def test_entry_list_304_until_an_entry_changes(self):
+        url = reverse("record_entries", args=[self.record.id])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Cache-Control"], "private, no-cache")
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(resp.status_code, 304)
+
+        self.client.post(url, {"type": "NOTE", "title": "x", "content": "y"}, format="json")
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["results"]), 2)
+
+    def test_entry_detail_304_and_edit(self):
+        url = reverse("entry_detail", args=[self.entry.id])
+        first = self.client.get(url)
+        self.assertIn("Last-Modified", first)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+        self.client.patch(url, {"title": "edited"}, format="json")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 200)
+
+    def test_tags_are_per_user(self):
+        url = reverse("record_detail", args=[self.record.id])
+        gp_tag = self.client.get(url)["ETag"]
+
+        self.client.force_authenticate(self.patient)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=gp_tag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], gp_tag)
+
+
+class RecordEntriesPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.record = MedicalRecord.objects.get(patient=cls.patient)
+        for i in range(5):
+            ClinicalEntry.objects.create(
+                record=cls.record, type="NOTE", title=f"n{i}", content="x" * 500, created_by=cls.gp
+            )
+        # Same created_at as the newest entry, to exercise the id tie-breaker
+        newest = ClinicalEntry.objects.order_by("-created_at").first()
+        ClinicalEntry.objects.filter(title="n0").update(created_at=newest.created_at)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.gp)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            ids += [item["id"] for item in resp.data["results"]]
+            url = resp.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_pages_follow_created_at_then_id_without_gaps(self):
+        ids, pages = self.walk(reverse("record_entries", args=[self.record.id]) + "?page_size=2")
+
+        expected = list(
+            ClinicalEntry.objects.filter(record=self.record).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_summary_leaves_out_content(self):
+        url = reverse("record_entries", args=[self.record.id])
+        resp = self.client.get(url + "?summary=1")
+        self.assertEqual(resp.status_code, 200)
+        row = resp.data["results"][0]
+        self.assertNotIn("content", row)
+        self.assertEqual(row["created_by_username"], "gp1")
+
+        # Content is fetched per entry when it's opened
+        detail = self.client.get(reverse("entry_detail", args=[row["id"]]))
+        self.assertEqual(detail.data["content"], "x" * 500)
+
+        # The flag only changes the list; creating still returns the full entry
+        resp = self.client.post(url + "?summary=1", {"type": "NOTE", "title": "t", "content": "c"}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["content"], "c")
+
+    def test_summary_and_full_lists_have_separate_tags(self):
+        url = reverse("record_entries", args=[self.record.id])
+        full_tag = self.client.get(url)["ETag"]
+        resp = self.client.get(url + "?summary=1", HTTP_IF_NONE_MATCH=full_tag)
+        self.assertEqual(resp.status_code, 200)
+
+
+class AsyncRecordEntriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.gp = User.objects.create_user(username="gp1", password="pass", role=User.Role.GP)
+        cls.patient = User.objects.create_user(username="patient1", password="pass", role=User.Role.PATIENT)
+        cls.other_gp = User.objects.create_user(username="gp2", password="pass", role=User.Role.GP)
+        cls.record = MedicalRecord.objects.get(patient=cls.patient)
+        for i in range(2):
+            ClinicalEntry.objects.create(record=cls.record, type="NOTE", title=f"n{i}", content="c", created_by=cls.gp)
+
+    async def get(self, user, record_id, query=""):
+        token = str(AccessToken.for_user(user))
+        return await AsyncClient().get(
+            reverse("async_record_entries", args=[record_id]) + query, headers={"Authorization": f"Bearer {token}"}
+        )
+
+    def sync_entries(self, user, query=""):
+        client = APIClient()
+        client.force_authenticate(user)
+        return json.loads(client.get(reverse("record_entries", args=[self.record.id]) + query).content)
+
+    async def test_matches_sync_view(self):
+        for user in (self.gp, self.patient):
+            resp = await self.get(user, self.record.id)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json(), await sync_to_async(self.sync_entries)(user))
+
+    async def test_pages_and_summary_match_sync_view(self):
+        query = "?summary=1&page_size=1"
+        resp = await self.get(self.gp, self.record.id, query)
+        # Only difference allowed: next links point back at the async endpoint
+        body = json.loads(resp.content.decode().replace("/api/async/", "/api/"))
+        self.assertEqual(body, await sync_to_async(self.sync_entries)(self.gp, query))
+        self.assertNotIn("content", body["results"][0])
+
+        query = "?" + body["next"].split("?", 1)[1]
+        resp = await self.get(self.gp, self.record.id, query)
+        self.assertEqual(resp.json()["results"], (await sync_to_async(self.sync_entries)(self.gp, query))["results"])
+        self.assertIsNone(resp.json()["next"])
+
+    async def test_permissions(self):
+        resp = await self.get(self.other_gp, self.record.id)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.json(), {"detail": "You do not have access to this record."})
+        self.assertEqual((await self.get(self.gp, 999999)).status_code, 404)